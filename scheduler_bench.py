@@ -0,0 +1,223 @@
+"""Headless benchmark suite for the scheduling engine.
+
+Builds synthetic sites - the real roster, rooms and catalog extended with
+generated instructors, rooms and courses - and runs ``generate_horizon`` on
+them, recording wall time, tracemalloc peak and schedule quality. Each case
+prints one JSON line, so results can be diffed or loaded for regression
+tracking::
+
+    python scheduler_bench.py                  # "scale" suite to stdout
+    python scheduler_bench.py --suite full --repeat 3 --out bench.jsonl
+    python scheduler_bench.py --suite occupancy     # interval vs bitmask backend
+    python scheduler_bench.py --list
+
+Cases are generated from a fixed seed, so the same suite and engine give the
+same schedules (timings aside).
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+from datetime import date
+from dataclasses import replace
+
+import scheduler_engine as E
+
+SHIFT_MIX    = ["A1", "A1", "A2", "A2", "B", "B", "C"]  # the default roster's shift ratio
+DURATIONS    = [1.5, 2.0, 2.5, 3.0, 3.5, 4.0]
+MEETING_HRS  = [1.0, 1.5, 2.0]
+MEETING_STARTS = {"A1": "13:00", "A2": "13:00", "B": "18:00", "C": "13:00"}
+
+
+def _case(name, instructors=7, rooms=4, courses=17, density=0.8, pto=0.0, meetings=0.0,
+          months=1, ct=0.0, start=(2026, 3), seed=0, occupancy="interval", improve=0):
+    return {"name": name, "instructors": instructors, "rooms": rooms, "courses": courses,
+            "density": density, "pto": pto, "meetings": meetings, "months": months,
+            "ct": ct, "start": start, "seed": seed, "occupancy": occupancy, "improve": improve}
+
+SUITES = {
+    "smoke": [
+        _case("default"),
+        _case("default_loaded", pto=0.05, meetings=2),
+    ],
+    "scale": [
+        _case("s007", 7, 4, 17),
+        _case("s025", 25, 8, 40, pto=0.03, meetings=1),
+        _case("s050", 50, 12, 60, pto=0.03, meetings=1),
+        _case("s100", 100, 20, 100, pto=0.03, meetings=1),
+    ],
+    # Minutes per case on the current engine; run explicitly.
+    "stress": [
+        _case("s200", 200, 30, 150, pto=0.03, meetings=1),
+        _case("s400", 400, 40, 200, pto=0.03, meetings=1),
+    ],
+    "density": [
+        _case("q020", 50, 12, 60, density=0.2),
+        _case("q050", 50, 12, 60, density=0.5),
+        _case("q090", 50, 12, 60, density=0.9),
+        _case("q050_ct", 50, 12, 60, density=0.5, ct=0.1),
+    ],
+    "load": [
+        _case("l_none", 50, 12, 60),
+        _case("l_pto10", 50, 12, 60, pto=0.10),
+        _case("l_mtg4", 50, 12, 60, meetings=4),
+        _case("l_heavy", 50, 12, 60, pto=0.15, meetings=6),
+    ],
+    "horizon": [
+        _case("h01", 25, 8, 40, months=1),
+        _case("h03", 25, 8, 40, months=3),
+        _case("h06", 25, 8, 40, months=6),
+        _case("h12", 25, 8, 40, months=12),
+    ],
+    # Same sites on both busy-time backends (ScheduleInput.occupancy).
+    "occupancy": [
+        _case(name + "_" + occ[:3], n, rooms, courses, pto=0.03, meetings=1, occupancy=occ)
+        for name, n, rooms, courses in (("o025", 25, 8, 40), ("o050", 50, 12, 60), ("o100", 100, 20, 100))
+        for occ in ("interval", "bitmask")
+    ],
+    # Smallest sites the config accepts; local search must cope with them too.
+    "edge": [
+        _case("one_room", rooms=2),   # Hawking (reserved) + one general room
+        _case("one_room_ls", rooms=2, improve=2000),
+    ],
+}
+SUITES["full"] = [c for k in ("smoke", "scale", "stress", "density", "load", "horizon", "occupancy", "edge")
+                  for c in SUITES[k]]
+
+
+def _months(start, n):
+    y, m = start
+    for _ in range(n):
+        yield y, m
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+
+def synthetic_site(case):
+    """Site config, qualifications, requirements and per-month constraints for ``case``.
+
+    The bundled site's roster, rooms and catalog come first (in that order),
+    so the 7/4/17 case is the real site with generated qualifications.
+    """
+    rng = random.Random(case["seed"])
+    with open(E.DEFAULT_SITE_PATH, encoding="utf-8") as f:
+        config = json.load(f)
+    instructors = config["instructors"][:case["instructors"]]
+    for k in range(len(instructors), case["instructors"]):
+        inst = {"name": "I%03d" % (k + 1), "shift": SHIFT_MIX[k % len(SHIFT_MIX)]}
+        if rng.random() < case["ct"]: inst["cross_training_only"] = True
+        instructors.append(inst)
+    rooms = config["rooms"][:case["rooms"]]
+    rooms += [{"name": "Room %02d" % (k + 1)} for k in range(len(rooms), case["rooms"])]
+    classes = config["courses"][:case["courses"]]
+    for k in range(len(classes), case["courses"]):
+        classes.append({"name": "Course %03d" % (k + 1), "duration": rng.choice(DURATIONS), "all_day": False,
+                        "room_restriction": None, "priority": rng.random() < 0.15})
+    config.update(site="synthetic " + case["name"], instructors=instructors, rooms=rooms, courses=classes)
+
+    names = [c["name"] for c in classes]
+    quals = {}
+    for inst in instructors:
+        if inst.get("cross_training_only"):
+            quals[inst["name"]] = {cn: (E.QUAL_CROSS_TRAINING if rng.random() < 0.5 else E.QUAL_NOT_QUALIFIED) for cn in names}
+        else:
+            quals[inst["name"]] = {cn: (E.QUAL_QUALIFIED if rng.random() < case["density"] else E.QUAL_NOT_QUALIFIED) for cn in names}
+    # Scale demand with the roster so bigger sites are not trivially covered.
+    mult = max(1, case["instructors"] // len(SHIFT_MIX))
+    reqs = {c["name"]: (E.PRIORITY_DEFAULT if c["priority"] else E.STANDARD_DEFAULT) * mult for c in classes}
+
+    constraints = []
+    for y, m in _months(case["start"], case["months"]):
+        cons = {"holidays": [], "pto": [], "meetings": []}
+        for d in E.get_month_dates(y, m):
+            for inst in instructors:
+                if E.day_name(d) not in config["shifts"][inst["shift"]]["days"]: continue
+                if rng.random() < case["pto"]:
+                    cons["pto"].append({"instructor": inst["name"], "date": d.isoformat()})
+        dates = E.get_month_dates(y, m)
+        for inst in instructors:
+            for _ in range(int(case["meetings"]) + (rng.random() < case["meetings"] % 1)):
+                cons["meetings"].append({"date": rng.choice(dates).isoformat(), "instructors": [inst["name"]],
+                                         "label": "Meeting", "start": MEETING_STARTS[inst["shift"]],
+                                         "duration_hrs": rng.choice(MEETING_HRS)})
+        constraints.append(((y, m), cons))
+    return {"config": E.SiteConfig(config), "qualifications": quals, "requirements": reqs,
+            "constraints": constraints}
+
+
+def _input(site, occupancy="interval", improve=0):
+    """One horizon input: the first month, with every month's constraints."""
+    (y, m), _ = site["constraints"][0]
+    cons = {"holidays": [], "pto": [], "meetings": []}
+    for _, c in site["constraints"]:
+        for k in cons: cons[k] += c[k]
+    return E.ScheduleInput(year=y, month=m, class_requirements=dict(site["requirements"]),
+                           constraints=cons, qualifications=site["qualifications"], occupancy=occupancy,
+                           improve_iters=improve)
+
+def run_case(case, repeat=1):
+    """Benchmark one case: best-of-``repeat`` wall time, tracemalloc peak, quality.
+
+    Hour spread is cumulative over the horizon (the carried hours included).
+    """
+    site = synthetic_site(case)
+    with E.active_site(site["config"]):
+        inp   = _input(site, case["occupancy"], case["improve"])
+        times = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            runs = list(E.generate_horizon(inp, case["months"]))
+            times.append(time.perf_counter() - t)
+        # Memory on a separate run: tracemalloc slows allocation-heavy code a lot.
+        # Results are dropped as they come, as a streaming exporter would.
+        tracemalloc.start()
+        for _ in E.generate_horizon(inp, case["months"]): pass
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        scores, carry = [], None
+        for y, m, r in runs:
+            scores.append(E.score_schedule(r, replace(inp, year=y, month=m, carry=carry)))
+            carry = r["carry"]
+    results  = [r for _, _, r in runs]
+    required = sum(site["requirements"].values()) * len(results)
+    unmet    = sum(s[0] for s in scores)
+    return {**{k: v for k, v in case.items() if k != "start"}, "start": "%d-%02d" % case["start"],
+            "seconds": round(min(times), 4), "seconds_all": [round(t, 4) for t in times],
+            "peak_mib": round(peak / 2**20, 2),
+            "sessions": sum(len(r["sessions"]) for r in results),
+            "flags": sum(len(r["flags"]) for r in results),
+            "required": required, "unmet": unmet,
+            "coverage": round(1 - unmet / required, 4) if required else 1.0,
+            "weekly_misses": sum(s[1] for s in scores),
+            "hour_spread": round(max(s[2] for s in scores), 2)}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--suite", default="scale", choices=sorted(SUITES))
+    ap.add_argument("--case", action="append", help="only run the named case(s)")
+    ap.add_argument("--repeat", type=int, default=1, help="timed runs per case (best is reported)")
+    ap.add_argument("--out", help="append JSON lines here instead of stdout")
+    ap.add_argument("--list", action="store_true", help="list the suite's cases and exit")
+    args = ap.parse_args(argv)
+
+    cases = [c for c in SUITES[args.suite] if not args.case or c["name"] in args.case]
+    if args.list:
+        for c in cases: print(json.dumps(c))
+        return 0
+    out = open(args.out, "a") if args.out else sys.stdout
+    meta = {"suite": args.suite, "date": date.today().isoformat(),
+            "python": platform.python_version(), "platform": platform.platform()}
+    try:
+        for case in cases:
+            rec = {**meta, **run_case(case, args.repeat)}
+            out.write(json.dumps(rec) + "\n"); out.flush()
+            print("%-16s %8.3fs %8.2f MiB  coverage %.3f  flags %d"
+                  % (case["name"], rec["seconds"], rec["peak_mib"], rec["coverage"], rec["flags"]), file=sys.stderr)
+    finally:
+        if out is not sys.stdout: out.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2712 @@
+"""Headless scheduling engine for the Training Scheduler.
+
+Nothing in here imports Streamlit: ``generate_schedule`` takes an explicit
+``ScheduleInput`` so it can run in worker processes, batch jobs and benchmarks.
+The Streamlit app imports this module once; Python keeps it cached in
+``sys.modules`` across script reruns.
+"""
+import os
+import copy
+import json
+import math
+import time
+import uuid
+import pickle
+import random
+import hashlib
+import calendar
+import threading
+from functools import lru_cache
+from itertools import count
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError, as_completed, wait
+from dataclasses import asdict, dataclass, field, replace
+from bisect import bisect_left, bisect_right
+from heapq import heappop, heappush
+from datetime import date
+from collections import Counter, OrderedDict, defaultdict, deque
+from collections.abc import MutableMapping
+from sys import intern
+
+# Site tables. Filled from the site config at import (see ``use_site``) and
+# refreshed in place, so modules that imported them keep seeing the active site.
+DEFAULT_CLASSES     = []   # course dicts: name, duration, all_day, room_restriction, priority
+DEFAULT_SHIFTS      = {}   # sk -> label, start, end, days
+ACTIVE_SHIFTS       = []
+SHIFT_DAY_ORDER     = {}   # sk -> weekday name -> position in the shift's week
+DEFAULT_INSTRUCTORS = []   # name, shift (+ cross_training_only)
+DEFAULT_ROOMS       = []
+GENERAL_ROOMS       = []   # rooms open to any course (reserved rooms only by room_restriction)
+INSTRUCTOR_BY_NAME  = {}
+INSTRUCTORS_BY_SHIFT = {}  # sk -> instructors in roster order
+INSTRUCTOR_COLORS   = {}   # name -> {"bg", "text"}
+DEFAULT_QUALIFIED   = {}   # name -> courses Qualified by default; absent = every course
+COP_MEMBERS         = set()  # instructors who attend the standing CoP meeting
+NO_PREP_CLASSES     = set()
+SKIP_WEEKLY_FREQ    = set()  # Mechanical Skills uses its own rule
+MEETING_END_CLASSES = set()  # courses that may run up to an all-staff meeting
+MECH_SKILLS_WEEKLY_SHIFTS = []  # Mechanical Skills weekly on one of these shifts, in try order
+MECH_SKILLS_COURSE  = None
+REQUIREMENT_FILL_SHIFTS = {}  # sk -> minimum weight; requirement fill visits shifts by lead headcount
+MONTHLY_SHIFT_MINIMUM   = {}  # sk -> times every non-all-day course must run on sk per month
+ALL_STAFF_CUT_MINS      = {}  # sk -> minutes cut off the shift end on all-staff meeting days
+PRIORITY_DEFAULT    = 5
+STANDARD_DEFAULT    = 1
+
+SLOT1_MIN, SLOT1_MAX = 3.0, 4.0
+SLOT2_MIN, SLOT2_MAX = 1.5, 2.5
+MEAL_MINS        = 30
+PREP_MINS        = 30
+
+QUAL_QUALIFIED      = "Qualified"
+QUAL_CROSS_TRAINING = "Cross Training"
+QUAL_NOT_QUALIFIED  = "Not Qualified"
+QUAL_STATES         = [QUAL_QUALIFIED, QUAL_CROSS_TRAINING, QUAL_NOT_QUALIFIED]
+
+
+@dataclass
+class ScheduleInput:
+    """Everything ``generate_schedule`` reads - formerly pulled from ``st.session_state``."""
+    year:                int
+    month:               int
+    class_requirements:  dict
+    constraints:         dict
+    qualifications:      dict
+    removed_instructors: frozenset = field(default_factory=frozenset)
+    seed:                int = 0            # RNG seed; same input + seed -> same schedule
+    diversify:           bool = False       # shuffle catalog / tie-break orders (multi-start)
+    improve_iters:       int = 0            # local-search moves after the greedy passes; 0 = off
+    improve_budget_s:    float = 2.0        # wall-clock cap for the local search
+    improve_mode:        str = "anneal"     # "anneal" or "tabu"
+    occupancy:           str = "interval"   # busy-time index: "interval" or "bitmask"
+    profile:             bool = False       # per-phase timings and counters in result["profile"]
+    carry:               dict = None        # state handed over from the previous month, see generate_horizon
+
+
+def get_month_dates(year, month):
+    _, num_days = calendar.monthrange(year, month)
+    return [date(year, month, d) for d in range(1, num_days + 1)]
+
+def get_month_weeks(year, month):
+    """Return list of week-day-lists running Sun-Sat, clipped to actual month boundaries."""
+    month_days = get_month_dates(year, month)
+    weeks = []
+    current_week = []
+    for d in month_days:
+        current_week.append(d)
+        if d.weekday() == 5:
+            weeks.append(current_week)
+            current_week = []
+    if current_week:
+        weeks.append(current_week)
+    return weeks
+
+def week_label(week_days):
+    return week_days[0].strftime("%b %d") + "–" + week_days[-1].strftime("%b %d")
+
+def day_name(d): return d.strftime("%A")
+
+def time_to_minutes(t_str):
+    h, m = map(int, t_str.split(":"))
+    return h * 60 + m
+
+def minutes_to_time(mins):
+    mins = int(mins) % (24 * 60)
+    return str(mins // 60).zfill(2) + ":" + str(mins % 60).zfill(2)
+
+
+def get_shift_window(sk, dobj=None):
+    sh = DEFAULT_SHIFTS[sk]
+    s = time_to_minutes(sh["start"])
+    e = time_to_minutes(sh["end"])
+    if e <= s: e += 24 * 60
+    if dobj is not None and sk in ALL_STAFF_CUT_MINS:
+        mtype = tuesday_meeting_type(dobj, dobj.year, dobj.month)
+        if mtype == "all_staff":
+            e -= ALL_STAFF_CUT_MINS[sk]
+    return s, e
+
+def get_shift_midpoint(sk):
+    s, e = get_shift_window(sk)
+    return (s + e) // 2
+
+ALL_STAFF_ANCHOR = date(2026, 4, 14)  # First All Staff meeting date
+
+def tuesday_meeting_type(dobj, year, month):
+    if dobj.strftime("%A") != "Tuesday": return None
+    delta = (dobj - ALL_STAFF_ANCHOR).days
+    if delta < 0:
+        return None
+    weeks = delta // 7
+    return "all_staff" if weeks % 2 == 0 else "cop"
+
+def get_tuesday_meeting_window(dobj, year, month):
+    mtype = tuesday_meeting_type(dobj, dobj.year, dobj.month)
+    if mtype is None: return None, None
+    if mtype == "all_staff":
+        return time_to_minutes("10:30"), time_to_minutes("12:30")
+    else:  # cop
+        return time_to_minutes("11:00"), time_to_minutes("12:00")
+
+class MonthCalendar:
+    """Date lookups for one month, computed once (see ``month_calendar``).
+
+    Per date: weekday name, active shifts, standing meeting type and window,
+    week index and each shift's window (all-staff cut applied) and
+    day order. Dates outside the month fall back to the plain helpers.
+    """
+
+    def __init__(self, year, month):
+        self.year, self.month = year, month
+        self.dates   = tuple(get_month_dates(year, month))
+        self.weeks   = tuple(tuple(wk) for wk in get_month_weeks(year, month))
+        self.by_iso  = {d.isoformat(): d for d in self.dates}
+        self.weekday = {d: day_name(d) for d in self.dates}
+        self.week_of = {d: wi for wi, wk in enumerate(self.weeks) for d in wk}
+        self.meeting_type = {d: tuesday_meeting_type(d, year, month) for d in self.dates}
+        self.meeting      = {d: get_tuesday_meeting_window(d, year, month) for d in self.dates}
+        self.shifts  = {d: tuple(sk for sk in ACTIVE_SHIFTS if self.weekday[d] in DEFAULT_SHIFTS[sk]["days"])
+                        for d in self.dates}
+        self.day_order = {(sk, d): SHIFT_DAY_ORDER.get(sk, {}).get(self.weekday[d], 99)
+                          for d in self.dates for sk in self.shifts[d]}
+        self._base    = {sk: get_shift_window(sk) for sk in DEFAULT_SHIFTS}
+        self._windows = {(sk, d): get_shift_window(sk, d) for d in self.dates for sk in self.shifts[d]}
+        self._on      = {sk: tuple(d for d in self.dates if sk in self.shifts[d]) for sk in ACTIVE_SHIFTS}
+        self._ordered = {sk: tuple(sorted(ds, key=lambda d: self.day_order[(sk, d)]))
+                         for sk, ds in self._on.items()}
+
+    def window(self, sk, dobj=None):
+        """``get_shift_window(sk, dobj)``; with no date, the plain shift window."""
+        if dobj is None: return self._base[sk]
+        win = self._windows.get((sk, dobj))
+        return win if win is not None else get_shift_window(sk, dobj)
+
+    def meeting_window(self, dobj):
+        win = self.meeting.get(dobj)
+        return win if win is not None else get_tuesday_meeting_window(dobj, dobj.year, dobj.month)
+
+    def dates_on(self, sk):
+        """Dates shift ``sk`` works, in calendar order."""
+        return self._on[sk]
+
+    def shift_dates(self, sk):
+        """Dates shift ``sk`` works, in shift day order (``sort_dates_by_weekday``)."""
+        return self._ordered[sk]
+
+    def week_days(self, sk, wi):
+        return [d for d in self.weeks[wi] if sk in self.shifts[d]]
+
+@lru_cache(maxsize=32)
+def month_calendar(year, month):
+    """Shared, read-only ``MonthCalendar`` for ``year``/``month``."""
+    return MonthCalendar(year, month)
+
+
+# ── Site configuration ─────────────────────────────────────────────────────────
+SITE_CONFIG_ENV   = "TRAINING_SCHEDULER_SITE"
+DEFAULT_SITE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "site_default.json")
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+class SiteConfig:
+    """One site's shifts, rooms, course catalog and roster, validated and indexed.
+
+    Built from the parsed JSON (see ``site_default.json`` for the format).
+    Every problem found is reported at once in a single ``ValueError``.
+    Courses and instructors are normalised to the dicts the engine has always
+    used; per-entry extras (``prep``, ``weekly``, ``may_end_at_meeting``, ``color``, ``cop_meeting``,
+    ``qualified``, room ``reserved``) become the lookup tables below.
+    """
+
+    def __init__(self, raw):
+        errors = []
+        def err(msg): errors.append(msg)
+        def hhmm(v):
+            try: h, m = v.split(":"); return 0 <= int(h) < 24 and 0 <= int(m) < 60
+            except (AttributeError, ValueError): return False
+
+        self.name   = raw.get("site", "")
+        self.shifts = {}
+        for sk, sh in (raw.get("shifts") or {}).items():
+            bad = [k for k in ("start", "end") if not hhmm(sh.get(k))]
+            if bad: err(f"shift {sk}: {'/'.join(bad)} must be HH:MM")
+            days = list(sh.get("days") or [])
+            if not days or any(d not in WEEKDAYS for d in days) or len(set(days)) != len(days):
+                err(f"shift {sk}: days must be distinct weekday names")
+            self.shifts[sk] = {"label": sh.get("label", sk), "start": sh.get("start"), "end": sh.get("end"), "days": days}
+        if not self.shifts: err("no shifts")
+        self.active_shifts = list(raw.get("active_shifts") or self.shifts)
+        for sk in self.active_shifts:
+            if sk not in self.shifts: err(f"active shift {sk!r} is not defined")
+        self.day_order = {sk: {d: k for k, d in enumerate(sh["days"])} for sk, sh in self.shifts.items()}
+
+        self.rooms, self.general_rooms = [], []
+        for r in raw.get("rooms") or []:
+            name = r.get("name") if isinstance(r, dict) else r
+            if not name or name in self.rooms: err(f"room {name!r}: missing or duplicate name"); continue
+            self.rooms.append(name)
+            if not (isinstance(r, dict) and r.get("reserved")): self.general_rooms.append(name)
+        if not self.general_rooms: err("no unreserved rooms")
+
+        self.classes, self.no_prep, self.skip_weekly, self.meeting_end, names = [], set(), set(), set(), set()
+        for c in raw.get("courses") or []:
+            cn = c.get("name")
+            if not cn or cn in names: err(f"course {cn!r}: missing or duplicate name"); continue
+            names.add(cn)
+            dur = c.get("duration")
+            if not isinstance(dur, (int, float)) or dur <= 0: err(f"course {cn}: duration must be a positive number of hours")
+            room = c.get("room_restriction")
+            if room is not None and room not in self.rooms: err(f"course {cn}: unknown room {room!r}")
+            self.classes.append({"name": cn, "duration": dur, "all_day": bool(c.get("all_day", False)),
+                                 "room_restriction": room, "priority": bool(c.get("priority", False))})
+            if c.get("prep", True) is False: self.no_prep.add(cn)
+            if c.get("weekly", True) is False: self.skip_weekly.add(cn)
+            if c.get("may_end_at_meeting"): self.meeting_end.add(cn)
+        if not self.classes: err("no courses")
+
+        self.instructors, self.colors, self.cop, self.default_qualified, seen = [], {}, set(), {}, set()
+        for i in raw.get("instructors") or []:
+            n = i.get("name")
+            if not n or n in seen: err(f"instructor {n!r}: missing or duplicate name"); continue
+            seen.add(n)
+            if i.get("shift") not in self.shifts: err(f"instructor {n}: unknown shift {i.get('shift')!r}"); continue
+            rec = {"name": n, "shift": i["shift"]}
+            if i.get("cross_training_only"): rec["cross_training_only"] = True
+            self.instructors.append(rec)
+            if i.get("color"): self.colors[n] = {"bg": i["color"].get("bg", "#444444"), "text": i["color"].get("text", "#ffffff")}
+            if i.get("cop_meeting"): self.cop.add(n)
+            if "qualified" in i:
+                unknown = [cn for cn in i["qualified"] if cn not in names]
+                if unknown: err(f"instructor {n}: unknown qualified course(s) {unknown}")
+                self.default_qualified[n] = list(i["qualified"])
+        if not self.instructors: err("no instructors")
+
+        req = raw.get("requirements") or {}
+        self.priority_default = req.get("priority", 5)
+        self.standard_default = req.get("standard", 1)
+        rules = raw.get("rules") or {}
+        self.mech_course = rules.get("mech_skills_course")
+        self.mech_shifts = list(rules.get("mech_skills_weekly_shifts") or [])
+        if self.mech_course is not None and self.mech_course not in names:
+            err(f"rules: unknown mech_skills_course {self.mech_course!r}")
+        for sk in self.mech_shifts:
+            if sk not in self.shifts: err(f"rules: unknown mech_skills_weekly_shifts entry {sk!r}")
+        self.fill_shifts = dict(rules.get("requirement_fill_shifts") or {sk: 0 for sk in self.active_shifts})
+        self.shift_min   = dict(rules.get("monthly_shift_minimum") or {})
+        self.staff_cut   = dict(rules.get("all_staff_cut_mins") or {})
+        for key, table in (("requirement_fill_shifts", self.fill_shifts), ("monthly_shift_minimum", self.shift_min),
+                           ("all_staff_cut_mins", self.staff_cut)):
+            for sk, v in table.items():
+                if sk not in self.active_shifts: err(f"rules: {key} names inactive shift {sk!r}")
+                if not isinstance(v, int) or v < 0: err(f"rules: {key}[{sk!r}] must be a non-negative integer")
+        if errors:
+            raise ValueError("invalid site config " + repr(self.name) + ":\n  " + "\n  ".join(errors))
+
+        self.by_name  = {i["name"]: i for i in self.instructors}
+        self.by_shift = {sk: [i for i in self.instructors if i["shift"] == sk] for sk in self.shifts}
+
+def load_site(path=None):
+    """Read and validate a site config; ``path`` defaults to $TRAINING_SCHEDULER_SITE
+    or the bundled ``site_default.json``."""
+    path = path or os.environ.get(SITE_CONFIG_ENV) or DEFAULT_SITE_PATH
+    with open(path, encoding="utf-8") as f:
+        return SiteConfig(json.load(f))
+
+SITE = None
+
+def use_site(site):
+    """Make ``site`` the active site: refresh every site table in place."""
+    global SITE, MECH_SKILLS_COURSE, PRIORITY_DEFAULT, STANDARD_DEFAULT
+    for table, new in ((DEFAULT_CLASSES, site.classes), (ACTIVE_SHIFTS, site.active_shifts),
+                       (DEFAULT_INSTRUCTORS, site.instructors), (DEFAULT_ROOMS, site.rooms),
+                       (GENERAL_ROOMS, site.general_rooms), (MECH_SKILLS_WEEKLY_SHIFTS, site.mech_shifts)):
+        table[:] = new
+    for table, new in ((DEFAULT_SHIFTS, site.shifts), (SHIFT_DAY_ORDER, site.day_order),
+                       (INSTRUCTOR_BY_NAME, site.by_name), (INSTRUCTORS_BY_SHIFT, site.by_shift),
+                       (INSTRUCTOR_COLORS, site.colors), (DEFAULT_QUALIFIED, site.default_qualified),
+                       (COP_MEMBERS, site.cop), (NO_PREP_CLASSES, site.no_prep), (SKIP_WEEKLY_FREQ, site.skip_weekly),
+                       (MEETING_END_CLASSES, site.meeting_end),
+                       (REQUIREMENT_FILL_SHIFTS, site.fill_shifts), (MONTHLY_SHIFT_MINIMUM, site.shift_min),
+                       (ALL_STAFF_CUT_MINS, site.staff_cut)):
+        table.clear(); table.update(new)
+    SITE = site
+    MECH_SKILLS_COURSE = site.mech_course
+    PRIORITY_DEFAULT, STANDARD_DEFAULT = site.priority_default, site.standard_default
+    month_calendar.cache_clear()
+
+@contextmanager
+def active_site(site):
+    """Run a block with ``site`` active, then restore the previous one."""
+    prev = SITE
+    use_site(site)
+    try:
+        yield site
+    finally:
+        use_site(prev)
+
+use_site(load_site())
+
+class ConstraintIndex:
+    """Holidays, PTO and meetings compiled once per run.
+
+    Holidays and PTO become date sets; meetings (explicit plus the standing
+    Tuesday ones) become a small per-(instructor, date) window tuple, built on
+    first use. A blocked check is then a hash lookup plus a short probe.
+    """
+
+    def __init__(self, constraints):
+        self.holidays = {date.fromisoformat(h["date"]) for h in constraints["holidays"]}
+        self.pto      = {(p["instructor"], date.fromisoformat(p["date"])) for p in constraints["pto"]}
+        self.meetings = defaultdict(list)
+        for m in constraints["meetings"]:
+            ms = time_to_minutes(m["start"]); me = ms + int(m["duration_hrs"] * 60)
+            mdate = date.fromisoformat(m["date"])
+            for iname in m["instructors"]:
+                self.meetings[(iname, mdate)].append((ms, me))
+        self._windows = {}
+
+    def day_blocked(self, iname, dobj):
+        return dobj in self.holidays or (iname, dobj) in self.pto
+
+    def windows(self, iname, dobj):
+        key = (iname, dobj)
+        wins = self._windows.get(key)
+        if wins is None:
+            wins = list(self.meetings.get(key, ()))
+            # Standing meetings enforcement
+            mtype = tuesday_meeting_type(dobj, dobj.year, dobj.month)
+            if mtype == "all_staff" or (mtype == "cop" and iname in COP_MEMBERS):
+                wins.append(get_tuesday_meeting_window(dobj, dobj.year, dobj.month))
+            wins = self._windows[key] = tuple(wins)
+        return wins
+
+    def blocked(self, iname, dobj, bstart, bend):
+        if self.day_blocked(iname, dobj): return True
+        for ms, me in self.windows(iname, dobj):
+            if not (bend <= ms or bstart >= me):
+                return True
+        return False
+
+class RunProfile:
+    """Per-phase wall times and call counters for one profiled generation run.
+
+    ``mark(phase)`` closes the running phase and opens the next. While a
+    profile is active on a thread, ``find_room`` and ``inst_blocked`` count
+    their calls into it; ``EngineState`` wraps the ``try_assign_*`` methods
+    to count attempts and successes.
+    """
+
+    def __init__(self):
+        self.phases = {}; self.counts = Counter(); self.peak = 0
+        self._phase, self._t = None, time.perf_counter()
+        self._start = self._t
+
+    def mark(self, phase, n_sessions):
+        now = time.perf_counter()
+        if self._phase is not None:
+            self.phases[self._phase] = self.phases.get(self._phase, 0.0) + (now - self._t)
+        self._phase, self._t = phase, now
+        self.peak = max(self.peak, n_sessions)
+
+    def counted(self, name, fn):
+        counts = self.counts
+        def wrapper(*args, **kwargs):
+            counts[name + ".attempts"] += 1
+            ok = fn(*args, **kwargs)
+            if ok: counts[name + ".successes"] += 1
+            return ok
+        return wrapper
+
+    def report(self, n_sessions):
+        self.mark(None, n_sessions)
+        if _PROFILING.prof is self: _PROFILING.prof = None
+        c = self.counts
+        return {"phases_ms": {k: round(v * 1000, 2) for k, v in self.phases.items()},
+                "total_ms": round((time.perf_counter() - self._start) * 1000, 2),
+                "calls": {fn: {"attempts": c[fn + ".attempts"], "successes": c[fn + ".successes"]}
+                          for fn in ("try_assign_forced", "try_assign_day")}
+                         | {fn: c[fn] for fn in ("find_room", "inst_blocked")},
+                "peak_sessions": self.peak}
+
+# Rough share of a run's time per phase, for progress events (measured on the
+# bench's scale cases; local search only counts when it runs).
+PHASE_WEIGHTS = {"min_once": 8, "all_day": 1, "requirements": 15, "day_fill": 25, "gap_fill_1": 15,
+                 "weekly": 30, "mech_skills": 1, "shift_minimum": 1, "local_search": 60,
+                 "shadows": 2, "meals": 2}
+
+class _Profiling(threading.local):
+    prof = None  # the RunProfile collecting on this thread, if any
+
+_PROFILING = _Profiling()
+
+class _SessionIds(threading.local):
+    seq = None  # the id counter of the run on this thread, see next_session_id
+
+_SESSION_IDS = _SessionIds()
+
+def inst_blocked(iname, dobj, bstart, bend, cindex):
+    prof = _PROFILING.prof
+    if prof is not None: prof.counts["inst_blocked"] += 1
+    return cindex.blocked(iname, dobj, bstart, bend)
+
+def is_day_blocked(iname, dobj, cindex):
+    return cindex.day_blocked(iname, dobj)
+
+class _DayIntervals:
+    """Busy intervals for one (resource, date), kept sorted by start.
+
+    ``maxend[k]`` is the largest end among the first ``k + 1`` intervals, so an
+    overlap probe is one bisect plus one comparison even when intervals overlap
+    (instructor prep can run into the previous block).
+    """
+    __slots__ = ("starts", "ends", "labels", "maxend")
+
+    def __init__(self):
+        self.starts = []; self.ends = []; self.labels = []; self.maxend = []
+
+    def add(self, start, end, label):
+        i = bisect_right(self.starts, start)
+        self.starts.insert(i, start); self.ends.insert(i, end); self.labels.insert(i, label)
+        self.maxend.insert(i, max(self.maxend[i - 1], end) if i else end)
+        for k in range(i + 1, len(self.maxend)):
+            if self.maxend[k] >= end: break
+            self.maxend[k] = end
+
+    def remove(self, start, end, label):
+        i = bisect_left(self.starts, start)
+        while self.ends[i] != end or self.labels[i] != label: i += 1
+        del self.starts[i]; del self.ends[i]; del self.labels[i]; del self.maxend[i]
+        for k in range(i, len(self.maxend)):
+            self.maxend[k] = max(self.maxend[k - 1], self.ends[k]) if k else self.ends[k]
+
+    def overlaps(self, start, end):
+        i = bisect_left(self.starts, end)  # intervals starting before `end`
+        return i > 0 and self.maxend[i - 1] > start
+
+    def blocks(self):
+        return list(zip(self.starts, self.ends, self.labels))
+
+
+class IntervalIndex:
+    """Busy intervals keyed by (resource, date_iso) - backs ``rsched`` and ``isched``."""
+
+    def __init__(self):
+        self._days = {}
+
+    def add(self, key, start, end, label):
+        day = self._days.get(key)
+        if day is None:
+            day = self._days[key] = _DayIntervals()
+        day.add(start, end, label)
+
+    def remove(self, key, start, end, label):
+        day = self._days[key]
+        day.remove(start, end, label)
+        if not day.starts: del self._days[key]
+
+    def overlaps(self, key, start, end):
+        day = self._days.get(key)
+        return day is not None and day.overlaps(start, end)
+
+    def last_end(self, key, default=None):
+        day = self._days.get(key)
+        return day.maxend[-1] if day else default
+
+    def get(self, key, default=None):
+        day = self._days.get(key)
+        return day.blocks() if day else default
+
+    def to_dict(self):
+        return {k: day.blocks() for k, day in self._days.items()}
+
+
+class BitmaskIndex:
+    """Busy time per (resource, date_iso) as an int bitmap, one bit per ``res`` minutes.
+
+    Same interface as ``IntervalIndex``; an overlap probe is one AND against the
+    day's mask. Intervals are widened to whole grid cells, so results are exact
+    when times are multiples of ``res`` - true of every engine time (shift
+    starts, prep/meal/class lengths, standing meetings) at the default 5 minutes.
+    The block list is kept alongside for ``get`` / ``last_end`` / ``remove``.
+    """
+
+    def __init__(self, res=5):
+        self.res     = res
+        self._masks  = {}
+        self._blocks = {}
+        self._spans  = {}  # (start, end) -> mask; the engine probes a few hundred distinct spans
+
+    def _span(self, start, end):
+        span = self._spans.get((start, end))
+        if span is None:
+            lo = start // self.res; hi = -(-end // self.res)
+            span = self._spans[(start, end)] = ((1 << (hi - lo)) - 1) << lo if hi > lo else 0
+        return span
+
+    def add(self, key, start, end, label):
+        self._masks[key] = self._masks.get(key, 0) | self._span(start, end)
+        blocks = self._blocks.setdefault(key, [])
+        blocks.insert(bisect_right(blocks, start, key=lambda b: b[0]), (start, end, label))
+
+    def remove(self, key, start, end, label):
+        blocks = self._blocks[key]
+        blocks.remove((start, end, label))
+        if not blocks:
+            del self._blocks[key]; del self._masks[key]; return
+        mask = 0
+        for bs, be, _ in blocks: mask |= self._span(bs, be)
+        self._masks[key] = mask
+
+    def overlaps(self, key, start, end):
+        mask = self._masks.get(key)
+        if not mask: return False
+        span = self._spans.get((start, end))
+        return bool(mask & (span if span is not None else self._span(start, end)))
+
+    def last_end(self, key, default=None):
+        blocks = self._blocks.get(key)
+        return max(b[1] for b in blocks) if blocks else default
+
+    def get(self, key, default=None):
+        blocks = self._blocks.get(key)
+        return list(blocks) if blocks else default
+
+    def to_dict(self):
+        return {k: list(blocks) for k, blocks in self._blocks.items()}
+
+
+OCCUPANCY_BACKENDS = {"interval": IntervalIndex, "bitmask": BitmaskIndex}
+
+
+def find_room(course, dobj, cs, ce, rsched):
+    prof = _PROFILING.prof
+    if prof is not None: prof.counts["find_room"] += 1
+    rooms = (course["room_restriction"],) if course.get("room_restriction") else GENERAL_ROOMS
+    date_iso = dobj.isoformat()
+    for room in rooms:
+        if not rsched.overlaps((room, date_iso), cs, ce):
+            return room
+    return None
+
+def is_qualified_to_teach(iname, cn, qualifications):
+    return qualifications[iname].get(cn, QUAL_NOT_QUALIFIED) == QUAL_QUALIFIED
+
+def is_cross_training(iname, cn, qualifications):
+    return qualifications[iname].get(cn, QUAL_NOT_QUALIFIED) == QUAL_CROSS_TRAINING
+
+
+def inst_time_conflict(iname, date_iso, cs, ce, isched):
+    """Return True if instructor already has a block overlapping cs-ce on date_iso."""
+    return isched.overlaps((iname, date_iso), cs, ce)
+
+def schedule_two_class_day(sk, dobj, iname, c1_name, c2_name, cmap, rsched, isched, cindex):
+    cal = month_calendar(dobj.year, dobj.month)
+    sh_s, sh_e = cal.window(sk)
+    midpoint   = (sh_s + sh_e) // 2
+    c1   = cmap[c1_name]
+    dur1 = int(c1["duration"] * 60)
+    mtg_start, mtg_resume = cal.meeting_window(dobj)
+    mtype = cal.meeting_type.get(dobj)
+
+    def prep_for(cn):
+        return 0 if cn in NO_PREP_CLASSES else PREP_MINS
+
+    def may_end_at_meeting(cn):
+        if mtype != "all_staff": return True
+        return cn in MEETING_END_CLASSES
+
+    if c1["all_day"]:
+        cs1 = sh_s; ce1 = cs1 + dur1
+        if ce1 > sh_e or inst_blocked(iname, dobj, cs1, ce1, cindex): return None, None, None
+        if inst_time_conflict(iname, dobj.isoformat(), cs1, ce1, isched): return None, None, None
+        room1 = find_room(c1, dobj, cs1, ce1, rsched)
+        if room1 is None: return None, None, None
+        return _make_session(sk, dobj, iname, c1_name, c1, cs1, cs1, ce1, room1), None, None
+
+    p1 = prep_for(c1_name); cs1 = sh_s; ce1 = cs1 + dur1  # class always starts at shift start
+    if mtg_start is not None:
+        if cs1 < mtg_start and ce1 > mtg_start:
+            if may_end_at_meeting(c1_name):
+                ncs = mtg_start - dur1
+                if ncs >= sh_s: cs1, ce1 = ncs, mtg_start
+                else: cs1 = mtg_resume + p1; ce1 = cs1 + dur1
+            else:
+                cs1 = mtg_resume + p1; ce1 = cs1 + dur1
+        elif mtg_start <= cs1 < mtg_resume:
+            cs1 = mtg_resume + p1; ce1 = cs1 + dur1
+
+    if ce1 > sh_e or inst_blocked(iname, dobj, cs1, ce1, cindex): return None, None, None
+    if inst_time_conflict(iname, dobj.isoformat(), cs1, ce1, isched): return None, None, None
+    room1 = find_room(c1, dobj, cs1, ce1, rsched)
+    if room1 is None: return None, None, None
+    s1 = _make_session(sk, dobj, iname, c1_name, c1, cs1 - p1, cs1, ce1, room1)  # prep before shift start is OK
+
+    if c2_name is None:
+        meal_start = None if (mtg_start is not None and ce1 <= mtg_start) else max(ce1, midpoint)
+        return s1, None, meal_start
+
+    c2 = cmap[c2_name]; dur2 = int(c2["duration"] * 60); p2 = prep_for(c2_name)
+    if mtg_start is not None and ce1 <= mtg_start:
+        ps2 = mtg_resume; cs2 = ps2 + p2; meal_start = None
+    else:
+        meal_start = max(ce1, midpoint); ps2 = meal_start + MEAL_MINS; cs2 = ps2 + p2
+    ce2 = cs2 + dur2
+    if ce2 > sh_e or inst_blocked(iname, dobj, cs2, ce2, cindex): return s1, None, meal_start
+    if inst_time_conflict(iname, dobj.isoformat(), cs2, ce2, isched): return s1, None, meal_start
+    room2 = find_room(c2, dobj, cs2, ce2, rsched)
+    if room2 is None: return s1, None, meal_start
+    return s1, _make_session(sk, dobj, iname, c2_name, c2, ps2, cs2, ce2, room2), meal_start
+
+
+_SESSION_FIELDS = ("date", "shift", "course", "instructor", "room",
+                   "prep_start_min", "class_start_min", "class_end_min",
+                   "duration_hrs", "all_day", "shadow_of", "id")
+_SESSION_NAMES  = {"date", "shift", "course", "instructor", "room", "shadow_of"}  # interned
+_SESSION_TIMES  = {"prep_start": "prep_start_min", "class_start": "class_start_min", "class_end": "class_end_min"}
+_SESSION_KEYS   = ("date", "shift", "course", "instructor", "room",
+                   "prep_start", "class_start", "class_end",
+                   "prep_start_min", "class_start_min", "class_end_min",
+                   "duration_hrs", "all_day", "shadow_of", "id")  # key order of the old session dicts, then id
+_SESSION_FIELD_SET = frozenset(_SESSION_FIELDS)
+
+
+class Session(MutableMapping):
+    """One scheduled block, stored compactly.
+
+    Fixed fields live in ``__slots__`` and the name fields (date, shift, course,
+    instructor, room, shadow_of) are interned, so a month of sessions shares
+    one copy of each string. The ``prep_start`` / ``class_start`` /
+    ``class_end`` strings are not stored; they are formatted from the minute
+    fields on access. As a mapping it reads and writes like the old 14-key
+    session dict (``s["room"]``, ``s.get``, ``s.update``, ``dict(s)``); any
+    other key goes to a small overflow dict. ``id`` is the stable session id
+    given by ``_make_session``; see ``SessionStore``.
+    """
+    __slots__ = _SESSION_FIELDS + ("_extra",)
+
+    def __init__(self, date, shift, course, instructor, room, prep_start_min, class_start_min,
+                 class_end_min, duration_hrs, all_day, shadow_of=None, id=None, extra=None):
+        self.date = intern(date); self.shift = intern(shift); self.course = intern(course)
+        self.instructor = intern(instructor); self.room = intern(room) if room is not None else None
+        self.prep_start_min = prep_start_min; self.class_start_min = class_start_min
+        self.class_end_min = class_end_min
+        self.duration_hrs = duration_hrs; self.all_day = all_day
+        self.shadow_of = intern(shadow_of) if shadow_of is not None else None
+        self.id = id
+        self._extra = extra or None
+
+    @classmethod
+    def from_dict(cls, d):
+        """Build from a session mapping (old-style dict or another ``Session``)."""
+        extra = {k: v for k, v in d.items() if k not in _SESSION_FIELD_SET and k not in _SESSION_TIMES}
+        return cls(*(d.get(f) for f in _SESSION_FIELDS), extra=extra)
+
+    def __getitem__(self, key):
+        if key in _SESSION_FIELD_SET:
+            return getattr(self, key)
+        if key in _SESSION_TIMES:
+            return minutes_to_time(getattr(self, _SESSION_TIMES[key]))
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in _SESSION_FIELD_SET:
+            if key in _SESSION_NAMES and isinstance(value, str): value = intern(value)
+            setattr(self, key, value)
+        elif key in _SESSION_TIMES:
+            # Setting the display string moves the minute field, keeping its day offset (B shift)
+            field_ = _SESSION_TIMES[key]; cur = getattr(self, field_)
+            if minutes_to_time(cur) != value:
+                setattr(self, field_, (cur // 1440) * 1440 + time_to_minutes(value))
+        else:
+            if self._extra is None: self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if not self._extra or key not in self._extra:
+            raise KeyError(key)
+        del self._extra[key]
+
+    def __iter__(self):
+        yield from _SESSION_KEYS
+        if self._extra: yield from self._extra
+
+    def __len__(self):
+        return len(_SESSION_KEYS) + (len(self._extra) if self._extra else 0)
+
+    def __contains__(self, key):
+        return key in _SESSION_FIELD_SET or key in _SESSION_TIMES or bool(self._extra and key in self._extra)
+
+    def copy(self):
+        return Session(*(getattr(self, f) for f in _SESSION_FIELDS),
+                       extra=dict(self._extra) if self._extra else None)
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return self.copy() if not self._extra else Session.from_dict(copy.deepcopy(dict(self), memo))
+
+    def __reduce__(self):
+        return (Session, tuple(getattr(self, f) for f in _SESSION_FIELDS) + (self._extra,))
+
+    def __repr__(self):
+        return "Session(" + repr(dict(self)) + ")"
+
+
+def _make_session(sk, dobj, iname, cn, course, ps, cs, ce, room, shadow_of=None):
+    return Session(dobj.isoformat(), sk, cn, iname, room, ps, cs, ce,
+                   course["duration"], course["all_day"], shadow_of, next_session_id())
+
+def next_session_id():
+    """The next session id on this thread: 1, 2, ... from the start of each
+    ``EngineState``, so the same input and seed give the same ids."""
+    ids = _SESSION_IDS.seq
+    if ids is None: ids = _SESSION_IDS.seq = count(1)
+    return next(ids)
+
+class DemandTracker:
+    """Per-course remaining requirement and per-shift counts, updated on commit.
+
+    ``ordered(sk)`` is the course list sorted by (most remaining, fewest on
+    ``sk``, catalog order). Each ``add`` only re-slots the one course that
+    changed, so candidate pools never re-sum or re-sort the catalog.
+    """
+
+    def __init__(self, reqs, course_names, shifts=ACTIVE_SHIFTS):
+        self.reqs   = reqs
+        self.scc    = {sk: {cn: 0 for cn in course_names} for sk in shifts}
+        self.total  = {cn: 0 for cn in course_names}
+        self._pos   = {cn: i for i, cn in enumerate(course_names)}
+        self._keys  = {sk: sorted(self._key(sk, cn) for cn in course_names) for sk in shifts}
+        self._names = {sk: [k[-1] for k in keys] for sk, keys in self._keys.items()}
+
+    def _key(self, sk, cn):
+        return (-self.remaining(cn), self.scc[sk][cn], self._pos[cn], cn)
+
+    def remaining(self, cn):
+        return max(0, self.reqs.get(cn, 0) - self.total[cn])
+
+    def shift_over(self, sk, cn):
+        return self.scc[sk][cn] >= max(1, self.reqs.get(cn, 0))
+
+    def ordered(self, sk):
+        return self._names[sk]
+
+    def add(self, sk, cn, n=1):
+        old = {s: self._key(s, cn) for s in self._keys}
+        self.scc[sk][cn] += n; self.total[cn] += n
+        for s, keys in self._keys.items():
+            names = self._names[s]
+            i = bisect_left(keys, old[s]); del keys[i]; del names[i]
+            new = self._key(s, cn)
+            j = bisect_left(keys, new); keys.insert(j, new); names.insert(j, cn)
+
+class CoverageIndex:
+    """Non-shadow session counts per (course, shift, week index).
+
+    ``weeks`` is the ``get_month_weeks`` list; dates outside it are ignored.
+    ``carry`` (a horizon month's ``inp.carry``, see ``month_carry``) counts the
+    courses the previous month taught in the Sun-Sat week this month opens in
+    towards week 0.
+    """
+
+    def __init__(self, weeks, carry=None):
+        self.week_of = {d.isoformat(): wi for wi, week_days in enumerate(weeks) for d in week_days}
+        self.counts  = Counter()
+        if carry and weeks and weeks[0][0].weekday() != 6:
+            for cn, sk in carry.get("week", ()): self.counts[(cn, sk, 0)] += 1
+
+    @classmethod
+    def from_sessions(cls, sessions, weeks, carry=None):
+        cov = cls(weeks, carry)
+        for s in sessions: cov.add(s)
+        return cov
+
+    def add(self, s, n=1):
+        if s.get("shadow_of"): return
+        wi = self.week_of.get(s["date"])
+        if wi is not None:
+            self.counts[(s["course"], s["shift"], wi)] += n
+
+    def covered(self, cn, sk, wi):
+        return self.counts[(cn, sk, wi)] > 0
+
+    def shifts(self, cn, wi, shifts=ACTIVE_SHIFTS):
+        return [sk for sk in shifts if self.counts[(cn, sk, wi)] > 0]
+
+def commit_session(s, rsched, isched, icount, demand, ihours=None, day_courses=None, coverage=None):
+    iname, date_iso, sk, cn = s["instructor"], s["date"], s["shift"], s["course"]
+    ki = (iname, date_iso)
+    isched.add(ki, s["prep_start_min"], s["class_end_min"], cn)
+    if not s.get("shadow_of"):
+        rsched.add((s["room"], date_iso), s["class_start_min"], s["class_end_min"], cn)
+    icount[iname] = icount.get(iname, 0) + 1
+    if ihours is not None and not s.get("shadow_of"):
+        ihours[iname] = ihours.get(iname, 0.0) + s["duration_hrs"]
+    if not s.get("shadow_of"):
+        demand.add(sk, cn)
+        if day_courses is not None:
+            day_courses.setdefault(date_iso, Counter())[cn] += 1
+        if coverage is not None:
+            coverage.add(s)
+
+def uncommit_session(s, rsched, isched, icount, demand, ihours=None, day_courses=None, coverage=None):
+    """Undo ``commit_session`` for ``s`` (same index arguments)."""
+    iname, date_iso, sk, cn = s["instructor"], s["date"], s["shift"], s["course"]
+    isched.remove((iname, date_iso), s["prep_start_min"], s["class_end_min"], cn)
+    if not s.get("shadow_of"):
+        rsched.remove((s["room"], date_iso), s["class_start_min"], s["class_end_min"], cn)
+    icount[iname] -= 1
+    if ihours is not None and not s.get("shadow_of"):
+        ihours[iname] -= s["duration_hrs"]
+    if not s.get("shadow_of"):
+        demand.add(sk, cn, -1)
+        if day_courses is not None:
+            dc = day_courses[date_iso]; dc[cn] -= 1
+            if not dc[cn]: del dc[cn]
+        if coverage is not None:
+            coverage.add(s, -1)
+
+def _clash_fields(s):
+    # Attribute reads for Session (its mapping access is ~10x slower); dicts too.
+    if type(s) is Session:
+        return s.date, s.instructor, s.room, s.shadow_of, s.class_start_min, s.class_end_min
+    return s["date"], s["instructor"], s["room"], s.get("shadow_of"), s["class_start_min"], s["class_end_min"]
+
+def conflict_buckets(s):
+    """The (reason, date, who) buckets ``s`` can clash in: its instructor's day,
+    and its room's day unless it is a shadow (shadows share the lead's room)."""
+    d, iname, room, shadow_of, _, _ = _clash_fields(s)
+    return [("instructor", d, iname)] if shadow_of else [("instructor", d, iname), ("room", d, room)]
+
+def sweep_conflicts(spans):
+    """Overlapping pairs among ``spans`` - the ``(start, end, key)`` of one bucket's
+    sessions - as ``(key_a, key_b)`` with ``a`` first in start order. Sort,
+    then sweep with a heap of running ends: O(k log k + pairs)."""
+    pairs, active = [], []
+    for start, end, key in sorted(spans):
+        while active and active[0][0] <= start: heappop(active)
+        pairs.extend((a, key) for _, a in active)
+        heappush(active, (end, key))
+    return pairs
+
+def find_conflicts(sessions):
+    """Every clash in ``sessions``: ``(i, j, reason)`` with ``i < j`` indexes and
+    ``reason`` ``"instructor"`` (double-booked) or ``"room"`` (two classes in
+    one room). A pair clashing both ways is listed once per reason."""
+    buckets = defaultdict(list)
+    for k, s in enumerate(sessions):
+        d, iname, room, shadow_of, cs, ce = _clash_fields(s)
+        buckets[("instructor", d, iname)].append((cs, ce, k))
+        if not shadow_of: buckets[("room", d, room)].append((cs, ce, k))
+    out = []
+    for (reason, _, _), spans in buckets.items():
+        if len(spans) == 2:  # the common case, a lead's two classes a day
+            (s1, e1, a), (s2, e2, b) = spans
+            if s1 < e2 and s2 < e1: out.append((a, b, reason))
+        elif len(spans) > 2:
+            out.extend((min(a, b), max(a, b), reason) for a, b in sweep_conflicts(spans))
+    out.sort()
+    return out
+
+class ConflictIndex:
+    """The clashes of an editable session collection, kept up to date edit by edit.
+
+    Sessions are held under caller-chosen keys. ``add``, ``remove`` and
+    ``update`` (after a session was moved, retimed or reassigned in place)
+    re-sweep only the (date, instructor) and (date, room) buckets the session
+    left or joined, so an edit costs a bucket's worth of work instead of a
+    ``find_conflicts`` pass over the month.
+    """
+
+    def __init__(self, items=()):
+        self.sessions = {}                 # key -> session
+        self._spans   = defaultdict(dict)  # bucket -> {key: (start, end)}
+        self._where   = {}                 # key -> the buckets it is filed under
+        self._pairs   = {}                 # bucket -> [(key_a, key_b)], clashing buckets only
+        for key, s in items: self._file(key, s)
+        for b in self._spans: self._sweep(b)
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def _file(self, key, s):
+        d, iname, room, shadow_of, cs, ce = _clash_fields(s)
+        buckets = [("instructor", d, iname)] if shadow_of else [("instructor", d, iname), ("room", d, room)]
+        self.sessions[key], self._where[key] = s, buckets
+        for b in buckets: self._spans[b][key] = (cs, ce)
+        return buckets
+
+    def _sweep(self, b):
+        spans = self._spans.get(b)
+        pairs = sweep_conflicts([(cs, ce, k) for k, (cs, ce) in spans.items()]) if spans and len(spans) > 1 else None
+        if pairs: self._pairs[b] = pairs
+        else: self._pairs.pop(b, None)
+
+    def add(self, key, s):
+        for b in self._file(key, s): self._sweep(b)
+
+    def remove(self, key):
+        del self.sessions[key]
+        for b in self._where.pop(key):
+            spans = self._spans[b]; del spans[key]
+            if not spans: del self._spans[b]
+            self._sweep(b)
+
+    def update(self, key, s):
+        """Re-file ``key`` after its session changed (or hand in a replacement ``s``)."""
+        self.remove(key); self.add(key, s)
+
+    def conflicts(self):
+        """``(key_a, key_b, reason)`` for every clash, by date; see ``find_conflicts``."""
+        return [(a, b, bucket[0]) for bucket in sorted(self._pairs, key=lambda k: (k[1], k[0], k[2]))
+                for a, b in self._pairs[bucket]]
+
+    def flagged(self):
+        """Keys of every session in some clash."""
+        return {k for pairs in self._pairs.values() for pair in pairs for k in pair}
+
+class SessionStore:
+    """Sessions keyed by their stable ``id``, with secondary indexes.
+
+    ``by_date``, ``by_instructor``, ``by_room`` and ``by_shift`` map a value
+    to ``{id: session}`` (insertion order), so views and edits resolve
+    sessions with dict lookups instead of list scans. ``add`` keeps a
+    session's id; one whose id is missing or taken (made outside a run, or
+    from before ids) is stored as a copy under a fresh id, so a caller's
+    session is never written to. ``update`` re-files a session changed in place (or swaps in a
+    replacement). With ``conflicts=True``
+    a ``ConflictIndex`` keyed by id is kept in step as ``self.conflicts``.
+    """
+    INDEXES = ("date", "instructor", "room", "shift")
+
+    def __init__(self, sessions=(), conflicts=False):
+        self.by_id = {}
+        self.by_date, self.by_instructor, self.by_room, self.by_shift = (defaultdict(dict) for _ in self.INDEXES)
+        self._filed = {}  # id -> the (date, instructor, room, shift) it is indexed under
+        self._next  = 1
+        for s in sessions: self._file(s)
+        self.conflicts = ConflictIndex(self.by_id.items()) if conflicts else None
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __iter__(self):
+        return iter(self.by_id.values())
+
+    def __contains__(self, sid):
+        return sid in self.by_id
+
+    def __getitem__(self, sid):
+        return self.by_id[sid]
+
+    def get(self, sid, default=None):
+        return self.by_id.get(sid, default)
+
+    def _file(self, s):
+        sid = s.get("id")
+        if sid is None or sid in self.by_id:
+            s = s.copy(); sid = s["id"] = self._next
+        self._next = max(self._next, sid + 1)
+        self.by_id[sid] = s
+        self._index(sid, s)
+        return sid
+
+    def _indexes(self):
+        return (self.by_date, self.by_instructor, self.by_room, self.by_shift)
+
+    def _index(self, sid, s):
+        keys = self._filed[sid] = (s["date"], s["instructor"], s["room"], s["shift"])
+        for index, k in zip(self._indexes(), keys): index[k][sid] = s
+
+    def _unindex(self, sid):
+        for index, k in zip(self._indexes(), self._filed.pop(sid)):
+            bucket = index[k]; del bucket[sid]
+            if not bucket: del index[k]
+
+    def add(self, s):
+        """Store ``s`` (or a copy, see above); returns its id."""
+        sid = self._file(s)
+        if self.conflicts is not None: self.conflicts.add(sid, self.by_id[sid])
+        return sid
+
+    def remove(self, sid):
+        """Drop session ``sid`` and return it."""
+        self._unindex(sid)
+        if self.conflicts is not None: self.conflicts.remove(sid)
+        return self.by_id.pop(sid)
+
+    def update(self, sid, s=None):
+        """Re-index session ``sid`` after it was changed in place, or replace it with ``s``."""
+        if s is None: s = self.by_id[sid]
+        else: self.by_id[sid] = s
+        self._unindex(sid); self._index(sid, s)
+        if self.conflicts is not None: self.conflicts.update(sid, s)
+
+    def select(self, **where):
+        """Sessions matching every ``field=value`` of ``where`` (indexed fields
+        only), starting from the smallest index bucket."""
+        buckets = [getattr(self, "by_" + f).get(v, {}) for f, v in where.items()]
+        if not buckets: return list(self.by_id.values())
+        smallest = min(buckets, key=len)
+        return [s for sid, s in smallest.items() if all(sid in b for b in buckets)]
+
+class EditJournal:
+    """Undoable edits over a generated schedule's sessions.
+
+    The base sessions are never written to: ``self.store`` (a conflict-tracking
+    ``SessionStore``) starts out sharing them, and a session is copied the first
+    time it is edited, so a month is held once plus whatever was touched.
+    Each edit appends ``(op, sid, before, after)``; ``op`` is one of
+    ``add``, ``move`` (date/room), ``retime``, ``reassign`` (instructor),
+    ``edit`` (course only) or ``remove``, and ``before``/``after`` hold the
+    changed fields (the whole session for add/remove). ``undo``/``redo`` step
+    a cursor through the journal and a new edit drops the redo tail.
+    ``snapshot`` returns the current sessions and compacts the journal; past
+    ``limit`` entries the oldest are compacted the same way.
+    """
+
+    def __init__(self, sessions, limit=200):
+        self.store   = SessionStore(sessions, conflicts=True)
+        self.entries = []
+        self.pos     = 0       # entries[:pos] are applied, entries[pos:] can be redone
+        self.limit   = limit
+        self._owned  = set()   # ids whose session is our copy (safe to write in place)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def can_undo(self):
+        return self.pos > 0
+
+    def can_redo(self):
+        return self.pos < len(self.entries)
+
+    def last(self):
+        """The entry ``undo`` would revert, or None."""
+        return self.entries[self.pos - 1] if self.pos else None
+
+    def _log(self, entry):
+        del self.entries[self.pos:]
+        self.entries.append(entry); self.pos += 1
+        if len(self.entries) > self.limit:
+            self.compact(self.limit)
+
+    def _write(self, sid, fields):
+        s = self.store[sid]
+        if sid not in self._owned:
+            s = Session.from_dict(s); self._owned.add(sid)
+        s.update(fields)
+        self.store.update(sid, s)
+
+    def add(self, s):
+        """Add a new session; returns its id."""
+        sid = self.store.add(s)
+        self._owned.add(sid)
+        self._log(("add", sid, None, self.store[sid]))
+        return sid
+
+    def remove(self, sid):
+        s = self.store.remove(sid)
+        self._log(("remove", sid, s, None))
+        return s
+
+    def edit(self, sid, **fields):
+        """Set fields of session ``sid``; returns the op logged, or None if nothing changed."""
+        s      = self.store[sid]
+        before = {k: s[k] for k, v in fields.items() if s[k] != v}
+        if not before: return None
+        after  = {k: fields[k] for k in before}
+        op = ("reassign" if "instructor" in before else "move" if "date" in before or "room" in before
+              else "retime" if "class_start_min" in before or "class_end_min" in before else "edit")
+        self._write(sid, after)
+        self._log((op, sid, before, after))
+        return op
+
+    def undo(self):
+        """Revert the last applied entry; returns it (None if there is none)."""
+        if not self.pos: return None
+        self.pos -= 1
+        op, sid, before, after = entry = self.entries[self.pos]
+        if op == "add": self.store.remove(sid)
+        elif op == "remove": self.store.add(before)
+        else: self._write(sid, before)
+        return entry
+
+    def redo(self):
+        if self.pos == len(self.entries): return None
+        op, sid, before, after = entry = self.entries[self.pos]
+        self.pos += 1
+        if op == "add": self.store.add(after)
+        elif op == "remove": self.store.remove(sid)
+        else: self._write(sid, after)
+        return entry
+
+    def compact(self, keep=0):
+        """Fold all but the last ``keep`` applied entries into the base and drop the redo tail."""
+        del self.entries[self.pos:]
+        del self.entries[:max(len(self.entries) - keep, 0)]
+        self.pos = len(self.entries)
+        if not keep:
+            # The current sessions become the new immutable base
+            self._owned.clear()
+
+    def snapshot(self):
+        """The current sessions, as a list nothing here will write to again; compacts the journal."""
+        self.compact()
+        return list(self.store)
+
+def pick_slot1(pool, cmap, demand, sk, used_cn=None, day_courses=None):
+    day_courses = day_courses or set()
+    def shift_over(cn): return demand.shift_over(sk, cn)
+    total_rem = demand.remaining
+    def dup(cn): return 1 if cn in day_courses else 0
+    candidates = [cn for cn in pool if cn != used_cn]
+    t1 = [cn for cn in candidates if SLOT1_MIN <= cmap[cn]["duration"] <= SLOT1_MAX and not shift_over(cn) and total_rem(cn) > 0]
+    if t1: return min(t1, key=dup)
+    t2 = [cn for cn in candidates if SLOT1_MIN <= cmap[cn]["duration"] <= SLOT1_MAX and not shift_over(cn)]
+    if t2: return min(t2, key=dup)
+    t3 = [cn for cn in candidates if not shift_over(cn)]
+    if t3: return min(t3, key=dup)
+    return min(candidates, key=dup) if candidates else None
+
+def pick_slot2(pool, cmap, demand, sk, exclude_cn=None, day_courses=None):
+    day_courses = day_courses or set()
+    total_rem = demand.remaining
+    def shift_over(cn): return demand.shift_over(sk, cn)
+    scc_sk = demand.scc[sk]
+    def sort_key(cn): return (1 if cn in day_courses else 0, scc_sk[cn])
+    pool_f = [cn for cn in pool if cn != exclude_cn]
+    best = [cn for cn in pool_f if SLOT2_MIN <= cmap[cn]["duration"] <= SLOT2_MAX and total_rem(cn) > 0 and not shift_over(cn)]
+    if best: return min(best, key=sort_key)
+    ok = [cn for cn in pool_f if SLOT2_MIN <= cmap[cn]["duration"] <= SLOT2_MAX and not shift_over(cn)]
+    if ok: return min(ok, key=sort_key)
+    return None
+
+def qualified_pool_for(iname, sk, demand, cmap, qualifications):
+    return [cn for cn in demand.ordered(sk)
+            if not cmap[cn]["all_day"] and is_qualified_to_teach(iname, cn, qualifications)]
+
+class QualificationMatrix:
+    """The qualification map compiled once per run into instructor x course bits.
+
+    Each instructor gets an int with one bit per catalog course they are
+    Qualified for (and one for Cross Training); slot-1 and slot-2 duration
+    buckets are bit masks too. ``teachers(sk, cn)`` and ``teach[iname]`` are
+    prebuilt tuples, and ``pick1`` / ``pick2`` give the same answer as
+    ``pick_slot1`` / ``pick_slot2`` over ``qualified_pool_for`` in one pass
+    over the demand order without building the pool.
+    """
+
+    def __init__(self, qualifications, catalog, ibs):
+        self.bit = {c["name"]: 1 << k for k, c in enumerate(catalog)}
+        def mask(row, state):
+            return sum(self.bit[cn] for cn, v in row.items() if v == state and cn in self.bit)
+        self.qual  = {n: mask(row, QUAL_QUALIFIED) for n, row in qualifications.items()}
+        self.cross = {n: mask(row, QUAL_CROSS_TRAINING) for n, row in qualifications.items()}
+        allday = sum(self.bit[c["name"]] for c in catalog if c["all_day"])
+        self.slot1 = sum(self.bit[c["name"]] for c in catalog
+                         if not c["all_day"] and SLOT1_MIN <= c["duration"] <= SLOT1_MAX)
+        self.slot2 = sum(self.bit[c["name"]] for c in catalog
+                         if not c["all_day"] and SLOT2_MIN <= c["duration"] <= SLOT2_MAX)
+        self.lead  = {n: m & ~allday for n, m in self.qual.items()}
+        self.teach  = {n: tuple(c["name"] for c in catalog if m & self.bit[c["name"]])
+                       for n, m in self.lead.items()}
+        self.allday = {n: tuple(c["name"] for c in catalog if m & allday & self.bit[c["name"]])
+                       for n, m in self.qual.items()}
+        self._teachers = {(sk, c["name"]): tuple(i for i in insts if self.can(i["name"], c["name"]))
+                          for sk, insts in ibs.items() for c in catalog}
+
+    def can(self, iname, cn):
+        return bool(self.qual.get(iname, 0) & self.bit.get(cn, 0))
+
+    def can_shadow(self, iname, cn):
+        return bool(self.cross.get(iname, 0) & self.bit.get(cn, 0))
+
+    def teachers(self, sk, cn):
+        """Lead instructors on ``sk`` qualified for ``cn``, in shift roster order."""
+        return self._teachers.get((sk, cn), ())
+
+    def pool(self, iname, sk, demand):
+        """``qualified_pool_for`` as a generator."""
+        m, bit = self.lead.get(iname, 0), self.bit
+        return (cn for cn in demand.ordered(sk) if m & bit[cn])
+
+    def pick1(self, iname, sk, demand, used_cn=None, day_courses=None):
+        m, bit, s1 = self.lead.get(iname, 0), self.bit, self.slot1
+        # pick_slot1's tiers are nested, so each course lands in the first one it
+        # qualifies for; per tier keep the first course without and with a same-day dup.
+        first = [None] * 8
+        for cn in demand.ordered(sk):
+            b = bit[cn]
+            if not m & b or cn == used_cn: continue
+            if demand.shift_over(sk, cn): tier = 3
+            elif not b & s1: tier = 2
+            else: tier = 0 if demand.remaining(cn) > 0 else 1
+            dup = 1 if day_courses and cn in day_courses else 0
+            if tier == 0 and not dup: return cn
+            if first[2 * tier + dup] is None: first[2 * tier + dup] = cn
+        for k in range(0, 8, 2):
+            if first[k] is not None: return first[k]
+            if first[k + 1] is not None: return first[k + 1]
+        return None
+
+    def pick2(self, iname, sk, demand, exclude_cn=None, day_courses=None):
+        m, bit, s2, scc_sk = self.lead.get(iname, 0), self.bit, self.slot2, demand.scc[sk]
+        best = [None, None]; keys = [None, None]
+        for cn in demand.ordered(sk):
+            b = bit[cn]
+            if not m & b or not b & s2 or cn == exclude_cn or demand.shift_over(sk, cn): continue
+            tier = 0 if demand.remaining(cn) > 0 else 1
+            key  = (1 if day_courses and cn in day_courses else 0, scc_sk[cn])
+            if best[tier] is None or key < keys[tier]: best[tier], keys[tier] = cn, key
+        return best[0] if best[0] is not None else best[1]
+
+def sort_dates_by_weekday(dates, sk, jitter=None):
+    order = SHIFT_DAY_ORDER.get(sk, {})
+    if jitter:
+        return sorted(dates, key=lambda d: (order.get(day_name(d), 99), jitter.get(d, 0.0)))
+    return sorted(dates, key=lambda d: order.get(day_name(d), 99))
+
+
+def get_shift_window_hours(sk):
+    s, e = get_shift_window(sk)
+    return (e - s) / 60.0
+
+def get_shift_weekly_target_hours(sk):
+    return get_shift_window_hours(sk) * len(DEFAULT_SHIFTS[sk]["days"])
+
+
+def default_meal_start(dobj, last_end, sh_s, sh_e):
+    """Meal start recorded for a working day that has none yet."""
+    midpoint = (sh_s + sh_e) // 2
+    # On All Staff meeting days, lunch is covered by the meeting — record meal at meeting start
+    cal = month_calendar(dobj.year, dobj.month)
+    if cal.meeting_type.get(dobj) == "all_staff":
+        mtg_s, _ = cal.meeting_window(dobj)
+        return mtg_s if mtg_s is not None else midpoint
+    return max(last_end, midpoint)
+
+def free_windows(last_end, meal_at, sh_e, mtg_s, mtg_r):
+    """Gap-fill windows after an instructor's last block, respecting meal and meetings."""
+    wins = []
+    if mtg_s is not None:
+        # Pre-meeting window (after last class, before meeting)
+        if last_end < mtg_s:
+            wins.append(("pre_mtg", last_end, mtg_s))
+        # Post-meeting window — no extra meal buffer needed on all_staff days
+        if mtg_r is not None and mtg_r < sh_e:
+            wins.append(("post_mtg", mtg_r, sh_e))
+    else:
+        # Normal: before meal, then after meal
+        if last_end < meal_at:
+            wins.append(("pre_meal", last_end, meal_at))
+        wins.append(("post_meal", meal_at + MEAL_MINS, sh_e))
+    return wins
+
+
+def inst_over_phase1_target(iname, sk, ihours, lead_instructors, n_weeks, target_wk=30.0):
+    """
+    Returns True if iname should be skipped during phase-1 scheduling.
+    An instructor is skipped if:
+      - They are at or above the 30 hrs/week monthly target, AND
+      - At least one shift-mate is still below that target.
+    This forces under-loaded instructors to be filled first.
+    """
+    monthly_target = target_wk * n_weeks
+    shift_mates = [i["name"] for i in lead_instructors if i["shift"] == sk]
+    if len(shift_mates) <= 1:
+        return False
+    if ihours.get(iname, 0.0) < monthly_target:
+        return False  # not yet at target themselves
+    # Check if any shift-mate is still below target
+    return any(ihours.get(n, 0.0) < monthly_target for n in shift_mates if n != iname)
+
+class EngineState:
+    """The inputs and live indexes one generation run works on.
+
+    Built from a ``ScheduleInput``; the greedy passes in ``generate_schedule``
+    and the ``LocalSearch`` improvement phase read and update the same object.
+    """
+
+    def __init__(self, inp):
+        self.inp         = inp
+        self.month       = inp.month
+        self.year        = inp.year
+        self.cal         = month_calendar(self.year, self.month)
+        self.month_dates = self.cal.dates
+        self.month_weeks = self.cal.weeks
+        self.n_weeks     = max(len(self.month_weeks), 1)
+        self.reqs        = dict(inp.class_requirements)
+        self.cindex      = ConstraintIndex(inp.constraints)
+        self.quals       = inp.qualifications
+
+        # A diversified (multi-start) run shuffles the catalog and breaks load and
+        # weekday ties randomly; otherwise the plain greedy order is used.
+        self.rng     = random.Random(inp.seed)
+        self.catalog = list(DEFAULT_CLASSES)
+        self.ijit    = {i["name"]: 0.0 for i in DEFAULT_INSTRUCTORS}
+        djit         = None
+        if inp.diversify:
+            self.rng.shuffle(self.catalog)
+            self.ijit = {n: self.rng.random() for n in self.ijit}
+            djit      = {d: self.rng.random() for d in self.month_dates}
+
+        self.sessions = []; self.flags = []; self.meal_map = {}
+        self.rsched   = OCCUPANCY_BACKENDS[inp.occupancy](); self.isched = OCCUPANCY_BACKENDS[inp.occupancy]()
+        self.all_cn   = [c["name"] for c in self.catalog]
+        self.cmap     = {c["name"]: c for c in self.catalog}
+
+
+        removed = inp.removed_instructors
+        self.lead_instructors = [i for i in DEFAULT_INSTRUCTORS
+                                 if not i.get("cross_training_only") and i["name"] not in removed]
+        self.ct_instructors   = [i for i in DEFAULT_INSTRUCTORS
+                                 if i.get("cross_training_only") and i["name"] not in removed]
+
+        self.inst_map = INSTRUCTOR_BY_NAME
+        self._cands   = {}  # iname -> gap-fill candidates, see _fill_candidates
+        self._frames  = {}  # (sk, date_iso) -> shift/meeting window, see _slot_frame
+        self.ibs     = {sk: [i for i in self.lead_instructors if i["shift"] == sk] for sk in ACTIVE_SHIFTS}
+        self.qual    = QualificationMatrix(self.quals, self.catalog, self.ibs)
+        self.demand  = DemandTracker(self.reqs, self.all_cn)
+        self.icount  = {i["name"]: 0   for i in DEFAULT_INSTRUCTORS}
+        self.ihours  = {i["name"]: 0.0 for i in DEFAULT_INSTRUCTORS}
+
+        self.sdates = {sk: sort_dates_by_weekday(self.cal.dates_on(sk), sk, djit) if djit
+                           else list(self.cal.shift_dates(sk))
+                       for sk in ACTIVE_SHIFTS}
+
+        self.used_slots  = set()
+        self.day_courses = {}  # date_iso -> Counter of non-shadow courses, kept by commit_session
+        self.coverage    = CoverageIndex(self.month_weeks, inp.carry)
+
+        # Horizon runs: hours relative to shift-mates so far
+        for n, h in (inp.carry or {}).get("hours", {}).items():
+            if n in self.ihours: self.ihours[n] += h
+
+        _SESSION_IDS.seq = count(1)
+        self.prof = _PROFILING.prof = RunProfile() if inp.profile else None
+        if self.prof is not None:
+            self.try_assign_forced = self.prof.counted("try_assign_forced", self.try_assign_forced)
+            self.try_assign_day    = self.prof.counted("try_assign_day", self.try_assign_day)
+
+        weights = {ph: w for ph, w in PHASE_WEIGHTS.items() if ph != "local_search" or inp.improve_iters > 0}
+        total, at, self._span = sum(weights.values()), 0, {}
+        for ph, w in weights.items():
+            self._span[ph] = (at / total, w / total); at += w
+        self._phase, self._seen = None, (0, 0)
+
+    def mark(self, phase):
+        """Start profiling phase ``phase`` (no-op unless ``inp.profile``)."""
+        if self.prof is not None: self.prof.mark(phase, len(self.sessions))
+
+    def phase(self, phase):
+        """Open ``phase`` (see ``mark``) and return its ``"phase"`` event."""
+        self.mark(phase); self._phase = phase
+        return self.event("phase")
+
+    def event(self, kind="progress", frac=0.0):
+        """An ``iter_schedule`` event: ``frac`` of the running phase done, the live
+        counts, and the sessions and flags added since the previous event."""
+        at, width = self._span[self._phase]
+        ns, nf = self._seen
+        self._seen = (len(self.sessions), len(self.flags))
+        return {"kind": kind, "phase": self._phase, "progress": round(at + width * frac, 4),
+                "sessions": len(self.sessions), "flags": len(self.flags),
+                "new_sessions": self.sessions[ns:], "new_flags": self.flags[nf:]}
+
+    def by_load(self, insts):
+        ihours, ijit = self.ihours, self.ijit
+        return sorted(insts, key=lambda i: (ihours[i["name"]], ijit[i["name"]]))
+
+    def commit(self, s):
+        commit_session(s, self.rsched, self.isched, self.icount, self.demand,
+                       self.ihours, self.day_courses, self.coverage)
+        self.sessions.append(s)
+
+    def try_assign_forced(self, iname, sk, dobj, force_c1):
+        """Open a working day for ``iname`` starting with ``force_c1`` (plus a slot-2 class)."""
+        used_slots, cindex, cmap, demand = self.used_slots, self.cindex, self.cmap, self.demand
+        if (iname, dobj.isoformat()) in used_slots: return False
+        if is_day_blocked(iname, dobj, cindex): return False
+        # Phase-1 balance: skip if over 30hr/wk target while shift-mates are below
+        if inst_over_phase1_target(iname, sk, self.ihours, self.lead_instructors, self.n_weeks):
+            return False
+        _dc  = self.day_courses.get(dobj.isoformat())
+        c2   = self.qual.pick2(iname, sk, demand, exclude_cn=force_c1, day_courses=_dc)
+        s1, s2, meal_start = schedule_two_class_day(sk, dobj, iname, force_c1, c2, cmap, self.rsched, self.isched, cindex)
+        if s1 is None:
+            s1, s2, meal_start = schedule_two_class_day(sk, dobj, iname, force_c1, None, cmap, self.rsched, self.isched, cindex)
+        if s1 is None: return False
+        self.commit(s1)
+        if s2: self.commit(s2)
+        if meal_start is not None: self.meal_map[(iname, dobj.isoformat())] = meal_start
+        used_slots.add((iname, dobj.isoformat()))
+        return True
+
+    def try_assign_day(self, iname, sk, dobj):
+        """Open a working day for ``iname`` with the best slot-1 / slot-2 pair (or an all-day course)."""
+        used_slots, cindex, cmap, demand = self.used_slots, self.cindex, self.cmap, self.demand
+        if (iname, dobj.isoformat()) in used_slots: return False
+        if is_day_blocked(iname, dobj, cindex): return False
+        # Phase-1 balance: skip if over 30hr/wk target while shift-mates are below
+        if inst_over_phase1_target(iname, sk, self.ihours, self.lead_instructors, self.n_weeks):
+            return False
+        for cn in self.qual.allday.get(iname, ()):
+            if demand.remaining(cn) > 0:
+                s1, _, _ = schedule_two_class_day(sk, dobj, iname, cn, None, cmap, self.rsched, self.isched, cindex)
+                if s1:
+                    self.commit(s1)
+                    used_slots.add((iname, dobj.isoformat())); return True
+        _dc = self.day_courses.get(dobj.isoformat())
+        c1 = self.qual.pick1(iname, sk, demand, day_courses=_dc)
+        if c1 is None: return False
+        c2 = self.qual.pick2(iname, sk, demand, exclude_cn=c1, day_courses=_dc)
+        s1, s2, meal_start = schedule_two_class_day(sk, dobj, iname, c1, c2, cmap, self.rsched, self.isched, cindex)
+        if s1 is None:
+            s1, s2, meal_start = schedule_two_class_day(sk, dobj, iname, c1, None, cmap, self.rsched, self.isched, cindex)
+        if s1 is None:
+            for cn in self.qual.pool(iname, sk, demand):
+                s1, s2, meal_start = schedule_two_class_day(sk, dobj, iname, cn, None, cmap, self.rsched, self.isched, cindex)
+                if s1: break
+        if s1 is None: return False
+        self.commit(s1)
+        if s2: self.commit(s2)
+        if meal_start is not None: self.meal_map[(iname, dobj.isoformat())] = meal_start
+        used_slots.add((iname, dobj.isoformat()))
+        return True
+
+    def fill_slot(self, iname, date_iso, courses=None):
+        """Gap-fill one working day: append classes after the last block until none fit.
+
+        ``courses`` restricts the candidates. Returns True if anything was placed.
+        The 30hr/wk phase-1 throttle is not applied here; ``gap_fill`` checks it.
+        """
+        inst_rec = self.inst_map.get(iname)
+        if inst_rec is None or inst_rec.get("cross_training_only"): return False
+        sk = inst_rec["shift"]
+        isched, meal_map, demand, cmap = self.isched, self.meal_map, self.demand, self.cmap
+        scc = demand.scc
+        dobj, sh_s, sh_e, mtg_s, mtg_r = self._slot_frame(sk, date_iso)
+        cands = self._fill_candidates(iname)
+
+        # Keep filling until no more classes fit
+        changed = False
+        filled  = True
+        while filled:
+            filled = False
+            last_end = isched.last_end((iname, date_iso))
+            if last_end is None: break
+
+            if (iname, date_iso) not in meal_map:
+                meal_map[(iname, date_iso)] = default_meal_start(dobj, last_end, sh_s, sh_e)
+            meal_at = meal_map[(iname, date_iso)]
+
+            for (wtype, w_start, w_end) in free_windows(last_end, meal_at, sh_e, mtg_s, mtg_r):
+                avail = w_end - w_start
+                if avail < 60: continue
+                _gdc = self.day_courses.get(date_iso, ())
+                pool = [(cn, pv, need) for cn, pv, need in cands
+                        if need <= avail and (courses is None or cn in courses)]
+                if not pool: continue
+                pool.sort(key=lambda c: (
+                    demand.total[c[0]],
+                    1 if c[0] in _gdc else 0,
+                    abs((w_end - 60) - (w_start + c[2])),
+                    scc[sk][c[0]]
+                ))
+                for cn, pv, need in pool:
+                    course = cmap[cn]
+                    cs = w_start + pv; ce = w_start + need
+                    if ce > w_end or inst_blocked(iname, dobj, cs, ce, self.cindex): continue
+                    if inst_time_conflict(iname, date_iso, cs, ce, isched): continue
+                    room = find_room(course, dobj, cs, ce, self.rsched)
+                    if room is None: continue
+                    self.commit(_make_session(sk, dobj, iname, cn, course, w_start, cs, ce, room))
+                    changed = True; filled = True; break
+                if filled: break
+        return changed
+
+    def _fill_candidates(self, iname):
+        """(course, prep mins, prep + class mins) the instructor can gap-fill with, catalog order."""
+        cands = self._cands.get(iname)
+        if cands is None:
+            cands = self._cands[iname] = [
+                (cn, pv, pv + int(self.cmap[cn]["duration"] * 60)) for cn in self.qual.teach.get(iname, ())
+                for pv in (0 if cn in NO_PREP_CLASSES else PREP_MINS,)]
+        return cands
+
+    def _slot_frame(self, sk, date_iso):
+        """(date, shift start, shift end, meeting start, meeting resume) for a shift day."""
+        frame = self._frames.get((sk, date_iso))
+        if frame is None:
+            dobj = self.cal.by_iso.get(date_iso) or date.fromisoformat(date_iso)
+            frame = self._frames[(sk, date_iso)] = (dobj, *self.cal.window(sk, dobj), *self.cal.meeting_window(dobj))
+        return frame
+
+    def gap_fill(self, max_passes=20):
+        """Phase-1 then phase-2 gap fill, driven by a worklist of unsaturated slots.
+
+        ``fill_slot`` leaves a day with nothing more that fits, and nothing the
+        other slots do can change that (they only take rooms), so once visited a
+        slot is done. The only slots that need another look are the ones skipped
+        by the phase-1 30hr/wk throttle, and only after some instructor's hours
+        moved. Same result as sweeping every slot until a sweep changes nothing.
+        """
+        pending = [(iname, date_iso) for iname, date_iso in sorted(self.used_slots)
+                   if iname in self.inst_map and not self.inst_map[iname].get("cross_training_only")]
+        # Phase 1: respects the 30hr/wk cap to balance instructors
+        for _ in range(max_passes):
+            if not pending: break
+            waiting, changed = [], False
+            for iname, date_iso in pending:
+                if inst_over_phase1_target(iname, self.inst_map[iname]["shift"], self.ihours,
+                                           self.lead_instructors, self.n_weeks):
+                    waiting.append((iname, date_iso)); continue
+                if self.fill_slot(iname, date_iso): changed = True
+            pending = waiting
+            if not changed: break
+        # Phase 2: cap removed, fill everyone toward the shift-window max
+        self.mark("gap_fill_2")
+        for iname, date_iso in pending:
+            self.fill_slot(iname, date_iso)
+
+    def guarantee_meals(self):
+        """Give every working day without a recorded meal one (30-min break guarantee)."""
+        for (iname, date_iso) in list(self.used_slots):
+            if (iname, date_iso) in self.meal_map:
+                continue
+            inst_rec = self.inst_map.get(iname)
+            if inst_rec is None:
+                continue
+            dobj = date.fromisoformat(date_iso)
+            sh_s, sh_e = self.cal.window(inst_rec["shift"], dobj)
+            last_end = self.isched.last_end((iname, date_iso), default=sh_s)
+            self.meal_map[(iname, date_iso)] = default_meal_start(dobj, last_end, sh_s, sh_e)
+
+
+def weekly_cells(state):
+    """(course, shift, week index) cells the weekly-frequency pass enforces."""
+    cells = set()
+    for sk in ACTIVE_SHIFTS:
+        wks = [wi for wi in range(len(state.month_weeks)) if state.cal.week_days(sk, wi)]
+        for c in state.catalog:
+            cn = c["name"]
+            if cn in SKIP_WEEKLY_FREQ or c["all_day"]: continue
+            if state.qual.teachers(sk, cn):
+                cells.update((cn, sk, wi) for wi in wks)
+    return cells
+
+def refresh_flags(state):
+    """Recompute the coverage flags of ``state`` after sessions were moved or removed.
+
+    Minimum-once, requirement, weekly-frequency, Mechanical Skills and per-shift minimum
+    flags are rebuilt from the live counts; other flags are kept.
+    """
+    scc, label = state.demand.scc, {sk: DEFAULT_SHIFTS[sk]["label"] for sk in ACTIVE_SHIFTS}
+    stale, fresh = set(), []
+    for sk in ACTIVE_SHIFTS:
+        if not state.sdates[sk]: continue
+        for c in state.catalog:
+            cn = c["name"]
+            if c["all_day"] or not state.qual.teachers(sk, cn):
+                continue
+            f = "Could not schedule " + cn + " on " + label[sk] + " (minimum once)."
+            stale.add(f)
+            if scc[sk][cn] == 0: fresh.append(f)
+    for cn in state.all_cn:
+        req = state.reqs.get(cn, 0)
+        if state.demand.total[cn] < req:
+            fresh.append("Could only schedule " + cn + " " + str(state.demand.total[cn]) + "/" + str(req) + " times.")
+    order = {cn: k for k, cn in enumerate(state.all_cn)}
+    for cn, sk, wi in sorted(weekly_cells(state), key=lambda c: (ACTIVE_SHIFTS.index(c[1]), order[c[0]], c[2])):
+        f = ("Weekly freq: '" + cn + "' missing on " + label[sk]
+             + " week of " + week_label(state.month_weeks[wi]) + ".")
+        stale.add(f)
+        if not state.coverage.covered(cn, sk, wi): fresh.append(f)
+    if MECH_SKILLS_COURSE in state.cmap:
+        for wi, week_days in enumerate(state.month_weeks):
+            f = f"Weekly freq: '{MECH_SKILLS_COURSE}' missing on {'/'.join(MECH_SKILLS_WEEKLY_SHIFTS)} week of {week_label(week_days)}."
+            stale.add(f)
+            if not state.coverage.shifts(MECH_SKILLS_COURSE, wi, MECH_SKILLS_WEEKLY_SHIFTS): fresh.append(f)
+    for sk, k in MONTHLY_SHIFT_MINIMUM.items():
+        for c in state.catalog:
+            if not c["all_day"] and scc[sk][c["name"]] < k:
+                fresh.append(f"{sk}-shift: '{c['name']}' only {scc[sk][c['name']]}/{k} times on {sk} shift this month.")
+    minimum = tuple(f"{sk}-shift: '" for sk in MONTHLY_SHIFT_MINIMUM)
+    state.flags[:] = [f for f in state.flags if f not in stale
+                      and not f.startswith("Could only schedule ") and not f.startswith(minimum)] + fresh
+
+
+class _Bag:
+    """Sessions with O(1) add / discard / random pick (swap-remove)."""
+    __slots__ = ("items", "pos")
+
+    def __init__(self):
+        self.items = []; self.pos = {}
+
+    def add(self, s):
+        self.pos[id(s)] = len(self.items); self.items.append(s)
+
+    def discard(self, s):
+        i = self.pos.pop(id(s)); last = self.items.pop()
+        if last is not s:
+            self.items[i] = last; self.pos[id(last)] = i
+
+    def choice(self, rng):
+        return self.items[int(rng.random() * len(self.items))] if self.items else None
+
+
+class LocalSearch:
+    """Improve a greedy schedule in place by simulated annealing or tabu search.
+
+    Works on the lead, non-all-day sessions of an ``EngineState`` with four
+    moves: swap courses between two instructors on a shift, move a session to
+    another instructor/day, move it to another room, and pull a course into a
+    free gap of a working day (taking it from a donor session if the course has
+    no remaining demand). Moves go through ``commit_session`` /
+    ``uncommit_session`` on the live indexes and are logged, so a move's cost
+    delta only re-reads the terms the touched sessions feed and a rejected move
+    is undone from the log.
+
+    Objective (lower is better): 100 per unmet required session, 100 per
+    session a shift is short of the hard per-shift rules (minimum once,
+    ``MONTHLY_SHIFT_MINIMUM``) and per week without Mechanical Skills, 10 per
+    missing weekly-frequency cell, plus the per-shift hour spread used by
+    ``score_schedule``. The hard-rule terms keep moves from trading a flag
+    ``refresh_flags`` raises for a better spread.
+    """
+    UNMET_W, HARD_W, WEEKLY_W = 100, 100, 10
+
+    def __init__(self, state):
+        self.st     = state
+        self.rng    = state.rng
+        self.mates  = {sk: [i["name"] for i in insts] for sk, insts in state.ibs.items()}
+        self.days   = {sk: state.cal.dates_on(sk) for sk in ACTIVE_SHIFTS}
+        self.teach  = {n: state.qual.teach.get(n, ()) for names in self.mates.values() for n in names}
+        self.cells  = weekly_cells(state)
+        self.need   = self._shift_needs()
+        self.original = list(state.sessions)
+        self.order    = {id(s): s for s in state.sessions}
+        self.pool     = _Bag()
+        self.by_cn    = defaultdict(_Bag)
+        for s in state.sessions:
+            if self._movable(s):
+                self.pool.add(s); self.by_cn[s["course"]].add(s)
+        self.log = []; self.touched = set()
+        self.cost = self.objective()
+
+    # ── objective ────────────────────────────────────────────────────────────
+    def _spread(self, sk):
+        ihours = self.st.ihours
+        hrs = [ihours[n] for n in self.mates[sk]]
+        return max(hrs) - min(hrs) if len(hrs) > 1 else 0.0
+
+    def _shift_needs(self):
+        # (course, shift) -> runs refresh_flags requires: minimum once / MONTHLY_SHIFT_MINIMUM
+        st, need = self.st, {}
+        for sk in ACTIVE_SHIFTS:
+            for c in st.catalog:
+                if c["all_day"]: continue
+                k = MONTHLY_SHIFT_MINIMUM.get(sk, 0)
+                if st.sdates[sk] and st.qual.teachers(sk, c["name"]): k = max(k, 1)
+                if k: need[(c["name"], sk)] = k
+        return need
+
+    def _short(self, cn, sk):
+        return max(0, self.need.get((cn, sk), 0) - self.st.demand.scc[sk][cn])
+
+    def _mech_missing(self, wi):
+        return not self.st.coverage.shifts(MECH_SKILLS_COURSE, wi, MECH_SKILLS_WEEKLY_SHIFTS)
+
+    def _terms(self, cn, sk, wi):
+        st = self.st
+        t = self.UNMET_W * max(0, st.reqs.get(cn, 0) - st.demand.total[cn]) + self.HARD_W * self._short(cn, sk)
+        if cn == MECH_SKILLS_COURSE and wi is not None and self._mech_missing(wi):
+            t += self.HARD_W
+        if (cn, sk, wi) in self.cells and not st.coverage.covered(cn, sk, wi):
+            t += self.WEEKLY_W
+        return t + self._spread(sk)
+
+    def objective(self):
+        st = self.st
+        unmet  = sum(max(0, req - st.demand.total.get(cn, 0)) for cn, req in st.reqs.items())
+        short  = sum(self._short(cn, sk) for cn, sk in self.need)
+        if MECH_SKILLS_COURSE in st.cmap:
+            short += sum(1 for wi in range(len(st.month_weeks)) if self._mech_missing(wi))
+        weekly = sum(1 for cell in self.cells if not st.coverage.covered(*cell))
+        return (self.UNMET_W * unmet + self.HARD_W * short + self.WEEKLY_W * weekly
+                + sum(self._spread(sk) for sk in ACTIVE_SHIFTS))
+
+    # ── primitive edits (cost kept incrementally) and the undo log ───────────
+    def _movable(self, s):
+        return not s.get("shadow_of") and not s["all_day"] and s["instructor"] in self.teach
+
+    def _commit(self, s):
+        st = self.st; cell = (s["course"], s["shift"], st.coverage.week_of.get(s["date"]))
+        before = self._terms(*cell)
+        commit_session(s, st.rsched, st.isched, st.icount, st.demand, st.ihours, st.day_courses, st.coverage)
+        self.cost += self._terms(*cell) - before
+        self.order[id(s)] = s; self.pool.add(s); self.by_cn[s["course"]].add(s)
+
+    def _uncommit(self, s):
+        st = self.st; cell = (s["course"], s["shift"], st.coverage.week_of.get(s["date"]))
+        before = self._terms(*cell)
+        uncommit_session(s, st.rsched, st.isched, st.icount, st.demand, st.ihours, st.day_courses, st.coverage)
+        self.cost += self._terms(*cell) - before
+        del self.order[id(s)]; self.pool.discard(s); self.by_cn[s["course"]].discard(s)
+
+    def _set_slot(self, slot, present):
+        if present: self.st.used_slots.add(slot)
+        else:       self.st.used_slots.discard(slot)
+
+    def _set_meal(self, slot, v):
+        if v is None: self.st.meal_map.pop(slot, None)
+        else:         self.st.meal_map[slot] = v
+
+    def add(self, s):
+        slot = (s["instructor"], s["date"])
+        self._commit(s); self.log.append(("add", s)); self.touched.add(slot)
+        if slot not in self.st.used_slots:
+            self._set_slot(slot, True); self.log.append(("slot", slot, False, True))
+
+    def remove(self, s):
+        self._uncommit(s); self.log.append(("rm", s)); self.touched.add((s["instructor"], s["date"]))
+
+    def meal(self, slot, v):
+        prev = self.st.meal_map.get(slot)
+        if prev != v:
+            self._set_meal(slot, v); self.log.append(("meal", slot, prev, v))
+
+    def undo(self, mark):
+        while len(self.log) > mark:
+            op = self.log.pop()
+            if   op[0] == "add": self._uncommit(op[1])
+            elif op[0] == "rm":  self._commit(op[1])
+            elif op[0] == "slot": self._set_slot(op[1], op[2])
+            else:                 self._set_meal(op[1], op[2])
+
+    def redo(self, ops):
+        for op in ops:
+            if   op[0] == "add": self._commit(op[1])
+            elif op[0] == "rm":  self._uncommit(op[1])
+            elif op[0] == "slot": self._set_slot(op[1], op[3])
+            else:                 self._set_meal(op[1], op[3])
+        self.log.extend(ops)
+
+    def _tidy(self):
+        # Days a move emptied stop being working days (no slot, no meal)
+        for slot in self.touched:
+            if slot in self.st.used_slots and self.st.isched.get(slot) is None:
+                self._set_slot(slot, False); self.log.append(("slot", slot, True, False))
+                self.meal(slot, None)
+
+    # ── placement helpers ───────────────────────────────────────────────────
+    def _fit(self, iname, sk, dobj, cn, ps):
+        """Session for ``cn`` prepping at ``ps``, or None if it breaks a hard rule."""
+        st = self.st; course = st.cmap[cn]; slot = (iname, dobj.isoformat())
+        cs = ps + (0 if cn in NO_PREP_CLASSES else PREP_MINS); ce = cs + int(course["duration"] * 60)
+        sh_s, sh_e = st.cal.window(sk, dobj)
+        if cs < sh_s or ce > sh_e: return None
+        if st.cindex.blocked(iname, dobj, ps, ce) or st.isched.overlaps(slot, ps, ce): return None
+        m = st.meal_map.get(slot)
+        if m is not None and ps < m + MEAL_MINS and ce > m: return None
+        room = find_room(course, dobj, cs, ce, st.rsched)
+        if room is None: return None
+        return _make_session(sk, dobj, iname, cn, course, ps, cs, ce, room)
+
+    def _gaps(self, iname, sk, dobj):
+        """Free (start, end) stretches of at least an hour in the instructor's shift."""
+        st = self.st; slot = (iname, dobj.isoformat())
+        sh_s, sh_e = st.cal.window(sk, dobj)
+        busy = [(b[0], b[1]) for b in st.isched.get(slot, ())]
+        busy.extend(st.cindex.windows(iname, dobj))
+        m = st.meal_map.get(slot)
+        if m is not None: busy.append((m, m + MEAL_MINS))
+        gaps = []; t = sh_s
+        for bs, be in sorted(busy):
+            if bs - t >= 60: gaps.append((t, bs))
+            t = max(t, be)
+        if sh_e - t >= 60: gaps.append((t, sh_e))
+        return gaps
+
+    def _ensure_meal(self, iname, sk, dobj):
+        slot = (iname, dobj.isoformat())
+        if slot not in self.st.meal_map:
+            sh_s, sh_e = self.st.cal.window(sk, dobj)
+            self.meal(slot, default_meal_start(dobj, self.st.isched.last_end(slot, sh_s), sh_s, sh_e))
+
+    def _place(self, iname, sk, dobj, cn):
+        st = self.st; slot = (iname, dobj.isoformat())
+        if st.isched.get(slot) is None:
+            # Fresh day: same single-class layout the greedy passes use
+            if st.cindex.day_blocked(iname, dobj): return False
+            s, _, meal_start = schedule_two_class_day(sk, dobj, iname, cn, None, st.cmap,
+                                                      st.rsched, st.isched, st.cindex)
+            if s is None or s["class_end_min"] > st.cal.window(sk, dobj)[1]: return False
+            self.add(s); self.meal(slot, meal_start)
+            return True
+        self._ensure_meal(iname, sk, dobj)
+        for gs, _ in self._gaps(iname, sk, dobj):
+            s = self._fit(iname, sk, dobj, cn, gs)
+            if s is not None:
+                self.add(s); return True
+        return False
+
+    # ── moves: apply to the live state, return False if infeasible ───────────
+    def move_swap(self):
+        a = self.pool.choice(self.rng); b = self.pool.choice(self.rng)
+        if a is b or a["shift"] != b["shift"] or a["instructor"] == b["instructor"]: return False
+        if a["course"] == b["course"]: return False
+        if a["course"] not in self.teach[b["instructor"]] or b["course"] not in self.teach[a["instructor"]]:
+            return False
+        self.remove(a); self.remove(b)
+        for s, cn in ((a, b["course"]), (b, a["course"])):
+            ns = self._fit(s["instructor"], s["shift"], date.fromisoformat(s["date"]), cn, s["prep_start_min"])
+            if ns is None: return False
+            self.add(ns)
+        return True
+
+    def move_day(self):
+        s = self.pool.choice(self.rng); sk = s["shift"]
+        iname = self.rng.choice(self.mates[sk])
+        if s["course"] not in self.teach[iname]: return False
+        dobj = self.rng.choice(self.days[sk])
+        self.remove(s)
+        return self._place(iname, sk, dobj, s["course"])
+
+    def move_room(self):
+        s = self.pool.choice(self.rng)
+        if self.st.cmap[s["course"]].get("room_restriction"): return False
+        rooms = [r for r in GENERAL_ROOMS if r != s["room"]]
+        if not rooms: return False
+        room = self.rng.choice(rooms)
+        if self.st.rsched.overlaps((room, s["date"]), s["class_start_min"], s["class_end_min"]): return False
+        ns = s.copy(); ns["room"] = room
+        self.remove(s); self.add(ns)
+        return True
+
+    def move_pull(self):
+        st = self.st; anchor = self.pool.choice(self.rng)
+        iname, sk = anchor["instructor"], anchor["shift"]; dobj = date.fromisoformat(anchor["date"])
+        self._ensure_meal(iname, sk, dobj)
+        gaps = self._gaps(iname, sk, dobj)
+        if not gaps: return False
+        gs, ge = self.rng.choice(gaps)
+        fits = [cn for cn in self.teach[iname]
+                if gs + (0 if cn in NO_PREP_CLASSES else PREP_MINS) + int(st.cmap[cn]["duration"] * 60) <= ge]
+        if not fits: return False
+        wi   = st.coverage.week_of.get(anchor["date"])
+        need = [cn for cn in fits if st.demand.remaining(cn) > 0
+                or ((cn, sk, wi) in self.cells and not st.coverage.covered(cn, sk, wi))]
+        cn = self.rng.choice(need or fits)
+        if st.demand.remaining(cn) <= 0:
+            donor = self.by_cn[cn].choice(self.rng)
+            if donor is None: return False
+            self.remove(donor)
+        s = self._fit(iname, sk, dobj, cn, gs)
+        if s is None: return False
+        self.add(s)
+        return True
+
+    def _try(self, move):
+        """Apply ``move``; on failure roll it back. Returns the ops it logged or None."""
+        mark = len(self.log); self.touched = set()
+        if move():
+            self._tidy()
+            return self.log[mark:]
+        self.undo(mark)
+        return None
+
+    # ── drivers ──────────────────────────────────────────────────────────────
+    def run(self, iters, budget_s=None, mode="anneal", **kw):
+        """``iter_run`` to the end; returns its stats."""
+        steps = self.iter_run(iters, budget_s, mode, **kw)
+        while True:
+            try: next(steps)
+            except StopIteration as stop: return stop.value
+
+    def iter_run(self, iters, budget_s=None, mode="anneal", t0=5.0, t1=0.05, samples=8, tenure=12, every_s=0.1):
+        """Search for ``iters`` move evaluations (or ``budget_s`` seconds); keep the best state.
+
+        A generator: yields the fraction done about every ``every_s`` seconds, so
+        a caller can report progress or stop early (closing it leaves the
+        state mid-search), and returns the stats dict.
+        """
+        if mode not in ("anneal", "tabu"):
+            raise ValueError("improve_mode must be 'anneal' or 'tabu', got " + repr(mode))
+        moves = (self.move_swap, self.move_day, self.move_room, self.move_pull)
+        rng   = self.rng
+        t_start  = time.monotonic()
+        deadline = t_start + budget_s if budget_s else None
+        start = best = self.cost
+        self.log = []  # only ops since the best state are kept
+        evaluated = accepted = steps = 0
+        tabu = deque(maxlen=tenure)
+        shown = t_start
+        while evaluated < iters and self.pool.items:
+            if steps % 64 == 0:
+                now = time.monotonic()
+                if deadline and now > deadline: break
+                if now - shown >= every_s:
+                    shown = now
+                    yield min(1.0, max(evaluated / iters, (now - t_start) / budget_s if budget_s else 0.0))
+            steps += 1
+            if mode == "anneal":
+                temp = t0 * (t1 / t0) ** (evaluated / iters)
+                evaluated += 1
+                before = self.cost; mark = len(self.log)
+                if self._try(rng.choice(moves)) is None: continue
+                delta = self.cost - before
+                if delta <= 0 or rng.random() < math.exp(-delta / temp):
+                    accepted += 1
+                else:
+                    self.undo(mark)
+            else:
+                cands = []
+                for _ in range(samples):
+                    evaluated += 1
+                    mark = len(self.log)
+                    ops = self._try(rng.choice(moves))
+                    if ops is not None:
+                        cands.append((self.cost, ops, self.touched))
+                        self.undo(mark)
+                banned = set().union(*tabu) if tabu else set()
+                cands = [c for c in cands if c[0] < best - 1e-9 or not (c[2] & banned)]
+                if not cands: continue
+                cost, ops, touched = min(cands, key=lambda c: c[0])
+                self.redo(ops); tabu.append(touched); accepted += 1
+            if self.cost < best - 1e-9:
+                best = self.cost; self.log = []
+        self.undo(0)
+        return {"mode": mode, "evaluated": evaluated, "accepted": accepted,
+                "cost_before": round(start, 2), "cost_after": round(self.cost, 2),
+                "seconds": round(time.monotonic() - t_start, 3)}
+
+    def finish(self):
+        """Write the improved sessions back in their original order and refresh stale flags."""
+        st = self.st; kept = set()
+        out = []
+        for s in self.original:
+            if id(s) in self.order: out.append(s); kept.add(id(s))
+        out.extend(s for k, s in self.order.items() if k not in kept)
+        st.sessions[:] = out
+        refresh_flags(st)
+
+
+def generate_schedule(inp):
+    """Build one month's schedule from ``inp`` (a ``ScheduleInput``).
+
+    Returns ``{"sessions", "flags", "meal_map", "isched"}``, plus ``"improve"``
+    when local search ran, ``"profile"`` when ``inp.profile`` is set and
+    ``"carry_in"`` (``inp.carry``) for a month generated with a carry.
+    """
+    for ev in iter_schedule(inp): pass
+    return ev["result"]
+
+
+def iter_schedule(inp):
+    """``generate_schedule`` as a generator of progress events.
+
+    Each event is a dict with ``"kind"`` (``"phase"`` when a phase opens,
+    ``"progress"`` inside the long ones, ``"done"`` last), ``"phase"``,
+    ``"progress"`` (0-1, weighted by ``PHASE_WEIGHTS``), the live
+    ``"sessions"`` / ``"flags"`` counts and the ``"new_sessions"`` /
+    ``"new_flags"`` since the previous event. The ``"done"`` event carries
+    the ``generate_schedule`` result under ``"result"``. Closing the
+    generator early abandons the run.
+
+    New sessions are reported as placed; local search may still move or drop
+    them, so only the final result is authoritative.
+    """
+    state = EngineState(inp)
+    month_weeks_all = state.month_weeks
+    reqs, cindex, qual = state.reqs, state.cindex, state.qual
+    rng, catalog, all_cn, cmap = state.rng, state.catalog, state.all_cn, state.cmap
+    sessions, flags, meal_map  = state.sessions, state.flags, state.meal_map
+    rsched, isched  = state.rsched, state.isched
+    cal             = state.cal
+    lead_instructors, ct_instructors, ibs = state.lead_instructors, state.ct_instructors, state.ibs
+    demand, scc     = state.demand, state.demand.scc
+    icount, ihours  = state.icount, state.ihours
+    sdates          = state.sdates
+    used_slots, day_courses, coverage = state.used_slots, state.day_courses, state.coverage
+    by_load         = state.by_load
+
+    try_assign_forced, try_assign_day = state.try_assign_forced, state.try_assign_day
+
+    yield state.phase("min_once")
+    for k, sk in enumerate(ACTIVE_SHIFTS):
+        if k: yield state.event(frac=k / len(ACTIVE_SHIFTS))
+        dlist = list(sdates[sk])
+        if not dlist: continue
+        for course in catalog:
+            if course["all_day"]: continue
+            cn = course["name"]
+            if scc[sk][cn] > 0: continue
+            qualified = qual.teachers(sk, cn)
+            if not qualified:
+                flags.append(cn + " has no qualified instructor on " + DEFAULT_SHIFTS[sk]["label"] + " - skipped.")
+                continue
+            placed = False
+            for dobj in dlist:
+                if placed: break
+                for inst in by_load(qualified):
+                    if (inst["name"], dobj.isoformat()) in used_slots: continue
+                    if try_assign_forced(inst["name"], sk, dobj, cn):
+                        placed = True; break
+            if not placed:
+                flags.append("Could not schedule " + cn + " on " + DEFAULT_SHIFTS[sk]["label"] + " (minimum once).")
+
+    yield state.phase("all_day")
+    for sk in ACTIVE_SHIFTS:
+        dlist = list(sdates[sk])
+        if not dlist: continue
+        for course in catalog:
+            if not course["all_day"]: continue
+            cn = course["name"]
+            if scc[sk][cn] > 0: continue
+            qualified = qual.teachers(sk, cn)
+            if not qualified: continue
+            placed = False
+            for dobj in dlist:
+                if placed: break
+                for inst in by_load(qualified):
+                    if (inst["name"], dobj.isoformat()) in used_slots: continue
+                    s1, _, _ = schedule_two_class_day(sk, dobj, inst["name"], cn, None, cmap, rsched, isched, cindex)
+                    if s1:
+                        commit_session(s1, rsched, isched, icount, demand, ihours, day_courses, coverage); sessions.append(s1)
+                        used_slots.add((inst["name"], dobj.isoformat())); placed = True; break
+
+    yield state.phase("requirements")
+    weighted_shift_order = [sk for sk, w in REQUIREMENT_FILL_SHIFTS.items()
+                            for _ in range(max(len(ibs[sk]), w))] * 4
+    for k, cn in enumerate(all_cn):
+        if k % 8 == 0: yield state.event(frac=k / len(all_cn))
+        req  = reqs.get(cn, 0)
+        need = req - demand.total[cn]
+        if need <= 0: continue
+        # A sweep that placed nothing will place nothing again until some
+        # session is committed, so repeats of the shift are skipped till then.
+        dry = {}
+        for sk in weighted_shift_order:
+            if need <= 0: break
+            if dry.get(sk) == len(sessions): continue
+            n_before = len(sessions)
+            dlist = list(sdates[sk])
+            for dobj in dlist:
+                if need <= 0: break
+                for inst in by_load(qual.teachers(sk, cn)):
+                    if (inst["name"], dobj.isoformat()) in used_slots: continue
+                    if try_assign_forced(inst["name"], sk, dobj, cn):
+                        need -= 1; break
+            if len(sessions) == n_before: dry[sk] = n_before
+        if need > 0:
+            flags.append("Could only schedule " + cn + " " + str(reqs.get(cn,0)-need) + "/" + str(reqs.get(cn,0)) + " times.")
+
+    yield state.phase("day_fill")
+    max_len = max(len(sdates[sk]) for sk in ACTIVE_SHIFTS)
+    interleaved = []
+    for di in range(max_len):
+        for sk in ACTIVE_SHIFTS:
+            if di < len(sdates[sk]):
+                interleaved.append((sk, sdates[sk][di]))
+    for k, (sk, dobj) in enumerate(interleaved):
+        if k % 16 == 0: yield state.event(frac=k / len(interleaved))
+        for inst in by_load(ibs[sk]):
+            try_assign_day(inst["name"], sk, dobj)
+
+    yield state.phase("gap_fill_1")
+    state.gap_fill()
+
+
+    # ── Weekly frequency enforcement (Sun-Sat weeks, clipped to month) ──────
+    yield state.phase("weekly")
+    for k, sk in enumerate(ACTIVE_SHIFTS):
+        if k: yield state.event(frac=k / len(ACTIVE_SHIFTS))
+        for course in catalog:
+            cn = course["name"]
+            if cn in SKIP_WEEKLY_FREQ or course["all_day"]: continue
+            qualified = qual.teachers(sk, cn)
+            if not qualified: continue
+            for wi, week_days in enumerate(month_weeks_all):
+                wdays = cal.week_days(sk, wi)
+                if not wdays: continue
+                if coverage.covered(cn, sk, wi): continue
+                placed = False
+                for dobj in sorted(wdays, key=lambda d: min(icount[i["name"]] for i in qualified)):
+                    if placed: break
+                    for inst in by_load(qualified):
+                        if is_day_blocked(inst["name"], dobj, cindex): continue
+                        if (inst["name"], dobj.isoformat()) not in used_slots:
+                            if try_assign_forced(inst["name"], sk, dobj, cn):
+                                placed = True; break
+                        else:
+                            di2 = dobj.isoformat(); _, se2 = cal.window(sk)
+                            m2s, m2r = cal.meeting_window(dobj)
+                            le   = isched.last_end((inst["name"], di2))
+                            if le is None: continue
+                            fs   = m2r if (m2s is not None and le <= m2s) else le + MEAL_MINS
+                            pv   = 0 if cn in NO_PREP_CLASSES else PREP_MINS
+                            ct   = fs + pv
+                            ce_t = ct + int(cmap[cn]["duration"] * 60)
+                            if ce_t > se2 or inst_blocked(inst["name"], dobj, ct, ce_t, cindex): continue
+                            rt = find_room(cmap[cn], dobj, ct, ce_t, rsched)
+                            if rt is None: continue
+                            sn = _make_session(sk, dobj, inst["name"], cn, cmap[cn], fs, ct, ce_t, rt)
+                            commit_session(sn, rsched, isched, icount, demand, ihours, day_courses, coverage)
+                            sessions.append(sn); placed = True; break
+                if not placed:
+                    flags.append(
+                        "Weekly freq: '" + cn + "' missing on "
+                        + DEFAULT_SHIFTS[sk]["label"] + " week of " + week_label(week_days) + ".")
+
+
+    # ── Mechanical Skills: at least once per week on A1 or B ──────────────────
+    yield state.phase("mech_skills")
+    mech_cn = MECH_SKILLS_COURSE
+    if mech_cn in cmap:
+        for wi, week_days in enumerate(month_weeks_all):
+            if coverage.shifts(mech_cn, wi, MECH_SKILLS_WEEKLY_SHIFTS):
+                continue
+            placed = False
+            for sk_try in MECH_SKILLS_WEEKLY_SHIFTS:
+                if placed: break
+                wdays = cal.week_days(sk_try, wi)
+                qualified = qual.teachers(sk_try, mech_cn)
+                for dobj in wdays:
+                    if placed: break
+                    for inst in by_load(qualified):
+                        if is_day_blocked(inst["name"], dobj, cindex): continue
+                        if (inst["name"], dobj.isoformat()) not in used_slots:
+                            if try_assign_forced(inst["name"], sk_try, dobj, mech_cn):
+                                placed = True; break
+            if not placed:
+                flags.append(f"Weekly freq: '{mech_cn}' missing on {'/'.join(MECH_SKILLS_WEEKLY_SHIFTS)} week of {week_label(week_days)}.")
+
+    # ── Per-shift monthly minimum (B: every non-all-day course twice) ─────────
+    yield state.phase("shift_minimum")
+    for sk, k in MONTHLY_SHIFT_MINIMUM.items():
+        for course in catalog:
+            cn = course["name"]
+            if course["all_day"]: continue
+            have = scc[sk].get(cn, 0)
+            if have < k:
+                need = k - have
+                qualified = qual.teachers(sk, cn)
+                for dobj in sdates[sk]:
+                    if need <= 0: break
+                    for inst in by_load(qualified):
+                        if (inst["name"], dobj.isoformat()) not in used_slots:
+                            if try_assign_forced(inst["name"], sk, dobj, cn):
+                                need -= 1; break
+                if need > 0:
+                    flags.append(f"{sk}-shift: '{cn}' only {k - need}/{k} times on {sk} shift this month.")
+
+    # ── Optional local search over the greedy result (before shadows attach) ──
+    improve = None
+    if inp.improve_iters > 0:
+        yield state.phase("local_search")
+        search  = LocalSearch(state)
+        steps   = search.iter_run(inp.improve_iters, inp.improve_budget_s, inp.improve_mode)
+        while improve is None:
+            try: yield state.event(frac=next(steps))
+            except StopIteration as stop: improve = stop.value
+        search.finish()
+
+    yield state.phase("shadows")
+    shadow_sessions = []
+    for ct_inst in ct_instructors:
+        ct_name  = ct_inst["name"]
+        ct_sk    = ct_inst["shift"]
+        ct_dates = cal.shift_dates(ct_sk)
+
+        shadow_days_per_inst = {i["name"]: 0 for i in lead_instructors if i["shift"] == ct_sk}
+        tiebreak = {i["name"]: rng.random() for i in lead_instructors if i["shift"] == ct_sk}
+
+        for dobj in ct_dates:
+            if is_day_blocked(ct_name, dobj, cindex): continue
+            date_iso = dobj.isoformat()
+
+            day_leads = [s for s in sessions
+                         if s["date"] == date_iso
+                         and s["shift"] == ct_sk
+                         and not s.get("shadow_of")
+                         and qual.can_shadow(ct_name, s["course"])]
+            if not day_leads: continue
+
+            leads_by_inst = defaultdict(list)
+            for lead_s in day_leads:
+                leads_by_inst[lead_s["instructor"]].append(lead_s)
+
+            def course_shadow_count(cn):
+                return sum(1 for x in shadow_sessions if x["course"] == cn)
+
+            all_candidates = []
+            for n in leads_by_inst:
+                for s in leads_by_inst[n]:
+                    all_candidates.append((n, s))
+            all_candidates.sort(key=lambda x: (
+                course_shadow_count(x[1]["course"]),
+                shadow_days_per_inst.get(x[0], 0),
+                tiebreak.get(x[0], 0)
+            ))
+
+            for lead_inst_name, lead_s in all_candidates:
+                cs = lead_s["class_start_min"]
+                ce = lead_s["class_end_min"]
+                if inst_blocked(ct_name, dobj, cs, ce, cindex): continue
+                if isched.overlaps((ct_name, date_iso), cs, ce): continue
+                shadow = _make_session(
+                    lead_s["shift"], dobj, ct_name,
+                    lead_s["course"], cmap[lead_s["course"]],
+                    lead_s["prep_start_min"], cs, ce,
+                    lead_s["room"],
+                    shadow_of=lead_s["instructor"]
+                )
+                ki = (ct_name, date_iso)
+                isched.add(ki, cs, ce, lead_s["course"])
+                icount[ct_name] = icount.get(ct_name, 0) + 1
+                shadow_sessions.append(shadow)
+                used_slots.add((ct_name, date_iso))
+                shadow_days_per_inst[lead_inst_name] = shadow_days_per_inst.get(lead_inst_name, 0) + 1
+                break
+
+    sessions.extend(shadow_sessions)
+
+    yield state.phase("meals")
+    state.guarantee_meals()
+
+    result = {"sessions": sessions, "flags": flags, "meal_map": meal_map, "isched": isched.to_dict()}
+    if inp.carry:
+        result["carry_in"] = inp.carry
+    if improve is not None:
+        result["improve"] = improve
+    if state.prof is not None:
+        result["profile"] = state.prof.report(len(sessions))
+    yield {**state.event("done", 1.0), "result": result}
+
+
+def constraint_delta(old, new):
+    """Entries added to / removed from each constraint list going from ``old`` to ``new``."""
+    delta = {"added": {}, "removed": {}}
+    for kind in ("holidays", "pto", "meetings"):
+        o = Counter(json.dumps(x, sort_keys=True) for x in old.get(kind, []))
+        n = Counter(json.dumps(x, sort_keys=True) for x in new.get(kind, []))
+        delta["added"][kind]   = [json.loads(x) for x in (n - o).elements()]
+        delta["removed"][kind] = [json.loads(x) for x in (o - n).elements()]
+    return delta
+
+def delta_slots(delta):
+    """(instructor, date_iso) slots a ``constraint_delta`` can affect."""
+    slots = set()
+    for side in delta.values():
+        for h in side.get("holidays", []):
+            slots.update((i["name"], h["date"]) for i in DEFAULT_INSTRUCTORS)
+        for p in side.get("pto", []):
+            slots.add((p["instructor"], p["date"]))
+        for m in side.get("meetings", []):
+            slots.update((n, m["date"]) for n in m["instructors"])
+    return slots
+
+
+def repair_schedule(prev, inp, delta):
+    """Patch ``prev`` (a ``generate_schedule`` result) for a constraint change.
+
+    ``inp`` carries the new constraints and ``delta`` is ``constraint_delta(old,
+    new)``. Only sessions on the slots the delta touches are re-checked: those
+    that now conflict are dropped (with their shadows), the touched slots are
+    re-filled and any coverage the dropped sessions held is re-placed with the
+    greedy placement routines. The rest of the month is kept as it was.
+    """
+    t0 = time.perf_counter()
+    state  = EngineState(replace(inp, diversify=False, profile=False))
+    _SESSION_IDS.seq = count(max((s.get("id") or 0 for s in prev["sessions"]), default=0) + 1)
+    cindex = state.cindex
+    slots  = delta_slots(delta)
+
+    dropped = []
+    for s in prev["sessions"]:
+        if s.get("shadow_of"): continue
+        slot = (s["instructor"], s["date"])
+        if slot in slots and cindex.blocked(s["instructor"], date.fromisoformat(s["date"]),
+                                            s["class_start_min"], s["class_end_min"]):
+            dropped.append(s); continue
+        state.commit(Session.from_dict(s)); state.used_slots.add(slot)
+    n_kept = len(state.sessions)
+    state.meal_map.update((k, v) for k, v in prev["meal_map"].items() if k in state.used_slots)
+
+    # Re-fill the touched working days of lead instructors
+    leads = {i["name"] for i in state.lead_instructors}
+    for iname, date_iso in sorted(slots):
+        if iname not in leads or date_iso not in state.coverage.week_of: continue
+        sk, dobj = state.inst_map[iname]["shift"], date.fromisoformat(date_iso)
+        if sk not in state.cal.shifts.get(dobj, ()): continue
+        if (iname, date_iso) not in state.used_slots:
+            state.try_assign_day(iname, sk, dobj)
+        state.fill_slot(iname, date_iso)
+
+    # Re-place coverage the dropped sessions held (same week first, then the month)
+    for s in dropped:
+        cn, sk = s["course"], s["shift"]
+        wi = state.coverage.week_of.get(s["date"])
+        if state.demand.remaining(cn) <= 0 and (wi is None or state.coverage.covered(cn, sk, wi)):
+            continue
+        qualified = state.qual.teachers(sk, cn)
+        week   = set(state.month_weeks[wi]) if wi is not None else set()
+        placed = False
+        for dobj in sorted(state.sdates[sk], key=lambda d: d not in week):
+            if placed: break
+            date_iso = dobj.isoformat()
+            for inst in state.by_load(qualified):
+                if (inst["name"], date_iso) not in state.used_slots:
+                    placed = state.try_assign_forced(inst["name"], sk, dobj, cn)
+                else:
+                    placed = state.fill_slot(inst["name"], date_iso, courses={cn})
+                if placed: break
+
+    # Shadows stay attached to surviving leads; a CT instructor newly blocked loses theirs
+    live = {(s["instructor"], s["date"], s["course"], s["class_start_min"]) for s in state.sessions}
+    for s in prev["sessions"]:
+        if not s.get("shadow_of"): continue
+        slot = (s["instructor"], s["date"])
+        if (s["shadow_of"], s["date"], s["course"], s["class_start_min"]) not in live: continue
+        if slot in slots and cindex.blocked(s["instructor"], date.fromisoformat(s["date"]),
+                                            s["class_start_min"], s["class_end_min"]):
+            continue
+        state.isched.add(slot, s["class_start_min"], s["class_end_min"], s["course"])
+        state.icount[s["instructor"]] = state.icount.get(s["instructor"], 0) + 1
+        state.used_slots.add(slot)
+        state.sessions.append(Session.from_dict(s))
+        if slot in prev["meal_map"]: state.meal_map.setdefault(slot, prev["meal_map"][slot])
+
+    state.flags.extend(prev["flags"])
+    refresh_flags(state)
+    state.guarantee_meals()
+    return {"sessions": state.sessions, "flags": state.flags, "meal_map": state.meal_map,
+            "isched": state.isched.to_dict(),
+            "repair": {"slots": len(slots), "dropped": len(dropped),
+                       "added": len([s for s in state.sessions[n_kept:] if not s.get("shadow_of")]),
+                       "ms": round((time.perf_counter() - t0) * 1000, 1)}}
+
+
+def score_schedule(result, inp):
+    """Lower is better: (unmet requirement sessions, weekly-frequency misses, hour spread).
+
+    Hour spread is the max-min teaching hours between lead instructors on the
+    same shift, summed over shifts.
+    """
+    placed = Counter()
+    hours  = defaultdict(float, (inp.carry or {}).get("hours", {}))
+    for s in result["sessions"]:
+        if s.get("shadow_of"): continue
+        placed[s["course"]] += 1
+        hours[s["instructor"]] += s["duration_hrs"]
+    unmet  = sum(max(0, req - placed[cn]) for cn, req in inp.class_requirements.items())
+    weekly = sum(1 for f in result["flags"] if f.startswith("Weekly freq:"))
+    spread = 0.0
+    for sk in ACTIVE_SHIFTS:
+        mates = [hours[i["name"]] for i in INSTRUCTORS_BY_SHIFT.get(sk, ())
+                 if not i.get("cross_training_only") and i["name"] not in inp.removed_instructors]
+        if len(mates) > 1:
+            spread += max(mates) - min(mates)
+    return (unmet, weekly, round(spread, 2))
+
+
+def _run_start(k, inp, deadline=None):
+    # ``deadline`` is wall-clock (time.time(), comparable across processes): a
+    # start that begins after it is skipped, unless it is run 0, and local
+    # search is clipped to what is left.
+    if deadline is not None:
+        left = deadline - time.time()
+        if left <= 0 and k: return k, None, None
+        if inp.improve_iters > 0:
+            inp = replace(inp, improve_budget_s=max(min(inp.improve_budget_s or left, left), 0.001))
+    result = generate_schedule(inp)
+    return k, score_schedule(result, inp), result
+
+
+def generate_best_schedule(inp, starts=8, budget_s=5.0, workers=None):
+    """Multi-start generation: keep the best of ``starts`` runs.
+
+    Run 0 is the plain greedy order; runs 1..N-1 are diversified with seeds
+    ``inp.seed + k``. Runs go through a process pool (``workers=1`` runs
+    them in-process). ``budget_s`` is enforced inside each run: starts not
+    begun by then are skipped and local search stops at the deadline. A greedy
+    pass already under way is not interrupted, and the first finished run is
+    always waited for, so the wall time can overrun by about one greedy pass.
+    Ties go to the lowest run index, so the result is reproducible for a given
+    input and budget. The result carries a ``"multistart"`` entry.
+    """
+    for ev in iter_best_schedule(inp, starts, budget_s, workers): pass
+    return ev["result"]
+
+
+def iter_best_schedule(inp, starts=8, budget_s=5.0, workers=None):
+    """``generate_best_schedule`` as a generator of progress events.
+
+    Yields a ``"run"`` event as each start finishes (``"run"``, ``"score"``,
+    the run's ``"sessions"`` / ``"flags"`` counts, and ``"progress"`` as the
+    share of starts done), then ``"done"`` with the best result. Closing the
+    generator early cancels the starts still pending.
+    """
+    base   = inp.seed
+    inputs = [replace(inp, diversify=False)] + [
+        replace(inp, seed=base + k, diversify=True) for k in range(1, starts)]
+    deadline = time.time() + budget_s
+    runs = []
+    def run_event(r):
+        runs.append(r)
+        return {"kind": "run", "run": r[0], "score": r[1], "progress": round(len(runs) / starts, 4),
+                "sessions": len(r[2]["sessions"]), "flags": len(r[2]["flags"])}
+    if workers == 1:
+        for k, x in enumerate(inputs):
+            if runs and time.time() >= deadline: break
+            yield run_event(_run_start(k, x, deadline))
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers or min(starts, os.cpu_count() or 1))
+        try:
+            futs = [pool.submit(_run_start, k, x, deadline) for k, x in enumerate(inputs)]
+            try:
+                # Runs under way stop their search at the deadline; give them a moment to report
+                for f in as_completed(futs, timeout=budget_s + 0.25):
+                    if f.result()[2] is not None: yield run_event(f.result())
+            except TimeoutError:
+                while not runs:
+                    done, futs = wait(futs, return_when=FIRST_COMPLETED)
+                    for f in done:
+                        if f.result()[2] is not None: yield run_event(f.result())
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+    k, score, best = min(runs, key=lambda r: (r[1], r[0]))
+    best["multistart"] = {"run": k, "seed": inputs[k].seed, "score": score,
+                          "runs": len(runs), "starts": starts}
+    yield {"kind": "done", "progress": 1.0, "sessions": len(best["sessions"]),
+           "flags": len(best["flags"]), "result": best}
+
+
+def _site_tables():
+    # Every site table use_site fills that the engine reads (colors and the
+    # derived lookups aside), as live module state.
+    return [DEFAULT_CLASSES, ACTIVE_SHIFTS, DEFAULT_SHIFTS, DEFAULT_INSTRUCTORS, DEFAULT_ROOMS, GENERAL_ROOMS,
+            DEFAULT_QUALIFIED, COP_MEMBERS, NO_PREP_CLASSES, SKIP_WEEKLY_FREQ, MEETING_END_CLASSES,
+            REQUIREMENT_FILL_SHIFTS, MONTHLY_SHIFT_MINIMUM, ALL_STAFF_CUT_MINS,
+            MECH_SKILLS_COURSE, MECH_SKILLS_WEEKLY_SHIFTS, PRIORITY_DEFAULT, STANDARD_DEFAULT]
+
+def schedule_key(inp, *extra):
+    """Canonical content hash of ``inp`` (seed included), the active site's
+    tables and rules and any ``extra`` run parameters."""
+    payload = {"input": asdict(inp), "extra": list(extra), "site": _site_tables()}
+    blob = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=sorted)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class ScheduleCache:
+    """Thread-safe LRU of generated schedules, bounded by entry count and bytes.
+
+    Results are stored pickled, so a hit hands back a private copy the caller
+    may edit freely. One instance lives at module level (``SCHEDULE_CACHE``);
+    the app imports this module once per server process, so every user session
+    on that process shares it.
+    """
+
+    def __init__(self, max_entries=32, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes   = max_bytes
+        self._data  = OrderedDict()
+        self._bytes = 0
+        self._lock  = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            blob = self._data.get(key)
+            if blob is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+        return pickle.loads(blob)
+
+    def put(self, key, result):
+        blob = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None: self._bytes -= len(old)
+            self._data[key] = blob; self._bytes += len(blob)
+            while len(self._data) > 1 and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                _, ev = self._data.popitem(last=False); self._bytes -= len(ev)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear(); self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._data), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+SCHEDULE_CACHE = ScheduleCache()
+
+
+def generate_cached(inp, starts=1, budget_s=5.0, cache=SCHEDULE_CACHE):
+    """``generate_schedule`` (or ``generate_best_schedule`` when ``starts > 1``)
+    through ``cache``. The result's ``"cached"`` entry tells whether it was a hit.
+    Profiled runs (``inp.profile``) always generate and are not stored: their
+    timings describe the run that produced them."""
+    for ev in iter_cached(inp, starts, budget_s, cache): pass
+    return ev["result"]
+
+
+def iter_cached(inp, starts=1, budget_s=5.0, cache=SCHEDULE_CACHE):
+    """``generate_cached`` as a generator of ``iter_schedule`` (``starts == 1``)
+    or ``iter_best_schedule`` events; a hit yields just the ``"done"`` event."""
+    key = schedule_key(inp) if starts == 1 else schedule_key(inp, "multistart", starts, budget_s)
+    result = None if inp.profile else cache.get(key)
+    if result is not None:
+        result["cached"] = True
+        yield {"kind": "done", "progress": 1.0, "sessions": len(result["sessions"]),
+               "flags": len(result["flags"]), "result": result}
+        return
+    for ev in (iter_schedule(inp) if starts == 1 else iter_best_schedule(inp, starts, budget_s)):
+        if ev["kind"] == "done":
+            if not inp.profile: cache.put(key, ev["result"])
+            ev["result"]["cached"] = False
+        yield ev
+
+
+def horizon_months(year, month, n):
+    """The ``n`` (year, month) pairs starting at ``year``/``month``."""
+    for _ in range(n):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+def month_constraints(constraints, year, month):
+    """The holidays, PTO and meetings of ``constraints`` dated in ``year``/``month``."""
+    pre = "%04d-%02d-" % (year, month)
+    return {k: [x for x in constraints.get(k, []) if x["date"].startswith(pre)]
+            for k in ("holidays", "pto", "meetings")}
+
+def month_carry(result, inp):
+    """What the month after ``inp`` needs from ``result`` (a ``generate_schedule`` result).
+
+    ``"hours"``: each lead instructor's teaching hours so far (``inp.carry``
+    plus this month) minus their shift's mean, so the next month keeps
+    balancing where this one stopped. ``"week"``: the (course, shift) pairs
+    taught in the month's last Sun-Sat week when it is cut short by the
+    month edge; the next month counts them towards its first week.
+    """
+    hours = defaultdict(float, (inp.carry or {}).get("hours", {}))
+    for s in result["sessions"]:
+        if not s.get("shadow_of"): hours[s["instructor"]] += s["duration_hrs"]
+    for sk in ACTIVE_SHIFTS:
+        mates = [i["name"] for i in INSTRUCTORS_BY_SHIFT.get(sk, ())
+                 if not i.get("cross_training_only") and i["name"] not in inp.removed_instructors]
+        if not mates: continue
+        mean = sum(hours[n] for n in mates) / len(mates)
+        for n in mates: hours[n] -= mean
+    week = []
+    cal  = month_calendar(inp.year, inp.month)
+    if cal.dates[-1].weekday() != 5:
+        tail = {d.isoformat() for d in cal.weeks[-1]}
+        week = sorted({(s["course"], s["shift"]) for s in result["sessions"]
+                       if s["date"] in tail and not s.get("shadow_of")})
+    return {"hours": {n: round(h, 2) for n, h in sorted(hours.items()) if round(h, 2)},
+            "week": [list(p) for p in week]}
+
+def generate_horizon(inp, months=3, run=generate_schedule):
+    """Generate ``months`` consecutive months starting at ``inp.year``/``inp.month``.
+
+    Yields ``(year, month, result)`` as each month finishes; only the carry
+    (``month_carry``) is kept between months, so a caller that exports and
+    drops each result runs a year in one month's memory. ``inp.constraints``
+    may span the whole horizon - each month gets its own slice. Each result
+    carries the state handed to the next month under ``"carry"``. ``run``
+    generates one month, e.g. a ``generate_cached`` partial for multi-start.
+    """
+    carry = inp.carry
+    for y, m in horizon_months(inp.year, inp.month, months):
+        mi = replace(inp, year=y, month=m, constraints=month_constraints(inp.constraints, y, m), carry=carry)
+        result = run(mi)
+        result["carry"] = carry = month_carry(result, mi)
+        yield y, m, result
+
+
+class GenerationJobs:
+    """Generation runs in the background, polled by job id.
+
+    ``submit`` takes an event generator (``iter_cached``, ``iter_schedule``,
+    or any generator yielding dicts that ends in a ``"done"`` event with a
+    ``"result"``) and drains it on a worker thread, keeping the latest
+    progress for ``status``. ``cancel`` stops a job at its next event.
+    ``result`` hands a finished job's result over once and forgets the job.
+    Jobs nobody picks up are dropped oldest first beyond ``keep``.
+
+    One instance lives at module level (``JOBS``), shared by every user
+    session on the process like ``SCHEDULE_CACHE``. Multi-start runs still
+    fan out to worker processes, so those job threads mostly wait.
+    """
+
+    def __init__(self, max_workers=4, keep=32):
+        self.keep  = keep
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="schedule-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, events, label=""):
+        job_id = uuid.uuid4().hex[:12]
+        job = {"id": job_id, "label": label, "state": "queued", "phase": None, "progress": 0.0,
+               "sessions": 0, "flags": 0, "last_flag": None, "error": None, "submitted": time.time(), "finished": None,
+               "result": None, "cancel": threading.Event()}
+        with self._lock:
+            self._jobs[job_id] = job
+            done = [k for k, j in self._jobs.items() if j["finished"] is not None]
+            for k in done[:max(0, len(self._jobs) - self.keep)]: del self._jobs[k]
+        self._pool.submit(self._run, job, events)
+        return job_id
+
+    def _run(self, job, events):
+        state = "cancelled"
+        try:
+            if not job["cancel"].is_set():
+                with self._lock: job["state"] = "running"
+                for ev in events:
+                    with self._lock:
+                        job.update(phase=ev.get("phase"), progress=ev.get("progress", job["progress"]),
+                                   sessions=ev.get("sessions", job["sessions"]), flags=ev.get("flags", job["flags"]))
+                        if ev.get("new_flags"): job["last_flag"] = ev["new_flags"][-1]
+                    if ev["kind"] == "done":
+                        job["result"], state = ev["result"], "done"
+                    if job["cancel"].is_set(): break
+        except Exception as e:
+            job["error"], state = f"{type(e).__name__}: {e}", "failed"
+        finally:
+            events.close()
+            with self._lock: job.update(state=state, finished=time.time())
+
+    def status(self, job_id):
+        """A snapshot of the job (no result), or None for an unknown id."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return None if job is None else {k: v for k, v in job.items() if k not in ("result", "cancel")}
+
+    def cancel(self, job_id):
+        """Ask the job to stop; False if it is unknown or already finished."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["finished"] is not None: return False
+            job["cancel"].set()
+            return True
+
+    def result(self, job_id):
+        """The finished job's result (the job is forgotten), else None."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["state"] != "done": return None
+            del self._jobs[job_id]
+            return job["result"]
+
+
+JOBS = GenerationJobs()
@@ -1,8 +1,9 @@
 import streamlit as st
-import random
 import calendar
+import copy
 import io
 from datetime import date
+from dataclasses import replace
 from collections import defaultdict
 
 try:
@@ -13,84 +14,20 @@ try:
 except ImportError:
     EXCEL_OK = False
 
+from scheduler_engine import (
+    DEFAULT_CLASSES, DEFAULT_SHIFTS, ACTIVE_SHIFTS, DEFAULT_INSTRUCTORS, DEFAULT_ROOMS,
+    PRIORITY_DEFAULT, STANDARD_DEFAULT, MEAL_MINS, PREP_MINS, SKIP_WEEKLY_FREQ,
+    QUAL_QUALIFIED, QUAL_CROSS_TRAINING, QUAL_NOT_QUALIFIED, QUAL_STATES,
+    ScheduleInput, generate_cached, iter_cached, generate_horizon, JOBS, constraint_delta, SessionStore, EditJournal, repair_schedule, _make_session, CoverageIndex,
+    time_to_minutes, minutes_to_time,
+    get_shift_window_hours, get_shift_weekly_target_hours,
+    ConstraintIndex, is_day_blocked, month_calendar,
+    INSTRUCTOR_BY_NAME, INSTRUCTORS_BY_SHIFT, INSTRUCTOR_COLORS, DEFAULT_QUALIFIED, COP_MEMBERS,
+)
+
 st.set_page_config(page_title="Training Scheduler", layout="wide")
 
-DEFAULT_CLASSES = [
-    {"name": "Mech / Elec Torque",                   "duration": 4.0, "all_day": False, "room_restriction": None,                    "priority": False},
-    {"name": "Safety Wire / Cable Installation",      "duration": 3.0, "all_day": False, "room_restriction": None,                    "priority": False},
-    {"name": "Smart Torque",                          "duration": 2.0, "all_day": False, "room_restriction": None,                    "priority": True},
-    {"name": "Threaded Insert Installation",          "duration": 3.5, "all_day": False, "room_restriction": None,                    "priority": False},
-    {"name": "Fluid Fittings Installation",           "duration": 2.5, "all_day": False, "room_restriction": None,                    "priority": False},
-    {"name": "Wire Harness Mate / Demate",            "duration": 3.0, "all_day": False, "room_restriction": None,                    "priority": False},
-    {"name": "Wire Harness Routing and Installation", "duration": 4.0, "all_day": False, "room_restriction": None,                    "priority": False},
-    {"name": "Conversion Coating",                    "duration": 1.5, "all_day": False, "room_restriction": None,                    "priority": False},
-    {"name": "Application of Sealants",               "duration": 3.0, "all_day": False, "room_restriction": None,                    "priority": False},
-    {"name": "Component Adhesive Bonding",            "duration": 2.0, "all_day": False, "room_restriction": None,                    "priority": False},
-    {"name": "Bonding Structural",                    "duration": 4.0, "all_day": False, "room_restriction": None,                    "priority": False},
-    {"name": "MPS Liquid Shim",                       "duration": 2.0, "all_day": False, "room_restriction": None,                    "priority": False},
-    {"name": "Confined Space",                        "duration": 3.0, "all_day": False, "room_restriction": None,                    "priority": True},
-    {"name": "Strain Gauge Installation",             "duration": 4.0, "all_day": False, "room_restriction": None,                    "priority": False},
-    {"name": "Lock Out / Tag Out",                    "duration": 2.0, "all_day": False, "room_restriction": None,                    "priority": True},
-    {"name": "Rynglok - Axial Swage",                 "duration": 2.0, "all_day": False, "room_restriction": None,                    "priority": False},
-    {"name": "Mechanical Skills",                   "duration": 40.0, "all_day": True,  "room_restriction": "Hawking",  "priority": False},
-]
-
-SLOT1_MIN, SLOT1_MAX = 3.0, 4.0
-SLOT2_MIN, SLOT2_MAX = 1.5, 2.5
-
-DEFAULT_SHIFTS = {
-    "A1": {"label": "A1-Shift", "start": "06:30", "end": "16:00", "days": ["Monday","Tuesday","Wednesday","Thursday"]},
-    "A2": {"label": "A2-Shift", "start": "06:30", "end": "16:00", "days": ["Tuesday","Wednesday","Thursday","Friday"]},
-    "B":  {"label": "B-Shift",  "start": "16:30", "end": "02:00", "days": ["Monday","Tuesday","Wednesday","Thursday"]},
-    "C":  {"label": "C-Shift",  "start": "06:00", "end": "18:00", "days": ["Friday","Saturday","Sunday"]},
-}
-ACTIVE_SHIFTS = ["A1", "A2", "B", "C"]
-SHIFT_DAY_ORDER = {
-    "A1": {"Monday": 0, "Tuesday": 1, "Wednesday": 2, "Thursday": 3},
-    "A2": {"Tuesday": 0, "Wednesday": 1, "Thursday": 2, "Friday": 3},
-    "B":  {"Monday": 0, "Tuesday": 1, "Wednesday": 2, "Thursday": 3},
-    "C":  {"Friday": 0, "Saturday": 1, "Sunday": 2},
-}
-
-DEFAULT_INSTRUCTORS = [
-    {"name": "Eric",    "shift": "A1"},
-    {"name": "David",   "shift": "A1"},
-    {"name": "Chris",   "shift": "A2"},
-    {"name": "Aaron",   "shift": "A2"},
-    {"name": "Dave",    "shift": "B"},
-    {"name": "Kendall", "shift": "B"},
-    {"name": "Taji",    "shift": "C"},
-]
-
-INSTRUCTOR_COLORS = {
-    "Eric":    {"bg": "#c2410c", "text": "#ffffff"},
-    "David":   {"bg": "#1d4ed8", "text": "#ffffff"},
-    "Chris":   {"bg": "#0e7490", "text": "#ffffff"},
-    "Aaron":   {"bg": "#166534", "text": "#ffffff"},
-    "Dave":    {"bg": "#490b6b", "text": "#ffffff"},
-    "Kendall": {"bg": "#92400e", "text": "#ffffff"},
-    "Taji":    {"bg": "#0f766e", "text": "#ffffff"},
-}
 DEFAULT_COLOR    = {"bg": "#444444", "text": "#ffffff"}
-DEFAULT_ROOMS = ["Hawking", "Galileo", "Newton", "Classroom C"]
-PRIORITY_DEFAULT = 5
-STANDARD_DEFAULT = 1
-MEAL_MINS        = 30
-PREP_MINS        = 30
-
-NO_PREP_CLASSES = {
-    "Lock Out / Tag Out", "Confined Space",
-    "Wire Harness Mate / Demate", "Wire Harness Routing and Installation",
-    "Rynglok - Axial Swage", "Fluid Fittings Installation",
-    "Strain Gauge Installation",
-}
-SKIP_WEEKLY_FREQ = {"Mech / Elec Torque"}  # Mechanical Skills uses its own rule
-MECH_SKILLS_WEEKLY_SHIFTS = {"A1", "B"}  # Mechanical Skills weekly on A1 or B
-
-QUAL_QUALIFIED      = "Qualified"
-QUAL_CROSS_TRAINING = "Cross Training"
-QUAL_NOT_QUALIFIED  = "Not Qualified"
-QUAL_STATES         = [QUAL_QUALIFIED, QUAL_CROSS_TRAINING, QUAL_NOT_QUALIFIED]
 
 def init_state():
     if "step" not in st.session_state:
@@ -111,9 +48,9 @@ def init_state():
         st.session_state.qualifications = {}
         for inst in DEFAULT_INSTRUCTORS:
             iname = inst["name"]
-            if iname in {"Taji", "Kendall"}:
+            if iname in DEFAULT_QUALIFIED:
                 st.session_state.qualifications[iname] = {
-                    cn: (QUAL_QUALIFIED if cn in {"Lock Out / Tag Out", "Confined Space"} else QUAL_NOT_QUALIFIED)
+                    cn: (QUAL_QUALIFIED if cn in DEFAULT_QUALIFIED[iname] else QUAL_NOT_QUALIFIED)
                     for cn in all_cn
                 }
             elif inst.get("cross_training_only"):
@@ -122,16 +59,28 @@ def init_state():
                 st.session_state.qualifications[iname] = {cn: QUAL_QUALIFIED for cn in all_cn}
     if "generated_schedule" not in st.session_state:
         st.session_state.generated_schedule = None
+    if "generated_constraints" not in st.session_state:
+        st.session_state.generated_constraints = None  # constraints the schedule was built with
+    if "gen_job" not in st.session_state:
+        st.session_state.gen_job = None  # {"id", "kind", "constraints"} of the running background job
+    if "gen_notice" not in st.session_state:
+        st.session_state.gen_notice = None  # how the last job ended, shown once in step 5
+    if "horizon_exports" not in st.session_state:
+        st.session_state.horizon_exports = None  # [(label, flag count, xlsx bytes)] per horizon month
     if "removed_instructors" not in st.session_state:
         st.session_state.removed_instructors = set()
     if "edited_schedule" not in st.session_state:
-        st.session_state.edited_schedule = None
-    if "edit_selected_idx" not in st.session_state:
-        st.session_state.edit_selected_idx = None
+        st.session_state.edited_schedule = None  # the generated schedule the edit journal applies to
+    if "edit_selected_sid" not in st.session_state:
+        st.session_state.edit_selected_sid = None
     if "edit_panel_mode" not in st.session_state:
         st.session_state.edit_panel_mode = None
     if "edit_selected_date" not in st.session_state:
         st.session_state.edit_selected_date = None
+    if "edit_journal" not in st.session_state:
+        st.session_state.edit_journal = None  # EditJournal over edited_schedule's sessions
+    if "generated_store" not in st.session_state:
+        st.session_state.generated_store = None  # (schedule, SessionStore) for the read-only views
 
 init_state()
 
@@ -161,713 +110,34 @@ st.sidebar.caption("Complete each step in order before generating.")
 def next_step(): st.session_state.step = min(st.session_state.step + 1, 5)
 def prev_step(): st.session_state.step = max(st.session_state.step - 1, 1)
 
-def get_month_dates(year, month):
-    _, num_days = calendar.monthrange(year, month)
-    return [date(year, month, d) for d in range(1, num_days + 1)]
-
-def get_month_weeks(year, month):
-    """Return list of week-day-lists running Sun-Sat, clipped to actual month boundaries."""
-    month_days = get_month_dates(year, month)
-    weeks = []
-    current_week = []
-    for d in month_days:
-        current_week.append(d)
-        if d.weekday() == 5:
-            weeks.append(current_week)
-            current_week = []
-    if current_week:
-        weeks.append(current_week)
-    return weeks
-
-def day_name(d): return d.strftime("%A")
-
-def time_to_minutes(t_str):
-    h, m = map(int, t_str.split(":"))
-    return h * 60 + m
-
-def minutes_to_time(mins):
-    mins = int(mins) % (24 * 60)
-    return str(mins // 60).zfill(2) + ":" + str(mins % 60).zfill(2)
+def _engine_input(**opts):
+    return ScheduleInput(**opts,
+        year=st.session_state.schedule_year, month=st.session_state.schedule_month,
+        class_requirements=dict(st.session_state.class_requirements),
+        constraints=st.session_state.constraints,
+        qualifications=st.session_state.qualifications,
+        removed_instructors=frozenset(st.session_state.get("removed_instructors", set())),
+    )
+
+def _generated_store():
+    # Indexed view of the generated schedule, rebuilt when a new schedule lands
+    sched  = st.session_state.generated_schedule
+    cached = st.session_state.generated_store
+    if cached is None or cached[0] is not sched:
+        cached = st.session_state.generated_store = (sched, SessionStore(sched["sessions"]))
+    return cached[1]
 
 def inst_color(name):
     return INSTRUCTOR_COLORS.get(name, DEFAULT_COLOR)
 
-def get_shift_window(sk, dobj=None):
-    sh = DEFAULT_SHIFTS[sk]
-    s = time_to_minutes(sh["start"])
-    e = time_to_minutes(sh["end"])
-    if e <= s: e += 24 * 60
-    if sk == "B" and dobj is not None:
-        mtype = tuesday_meeting_type(dobj, dobj.year, dobj.month)
-        if mtype == "all_staff":
-            e -= 60
-    return s, e
-
-def get_shift_midpoint(sk):
-    s, e = get_shift_window(sk)
-    return (s + e) // 2
-
-ALL_STAFF_ANCHOR = date(2026, 4, 14)  # First All Staff meeting date
-
-def tuesday_meeting_type(dobj, year, month):
-    if dobj.strftime("%A") != "Tuesday": return None
-    delta = (dobj - ALL_STAFF_ANCHOR).days
-    if delta < 0:
-        return None
-    weeks = delta // 7
-    return "all_staff" if weeks % 2 == 0 else "cop"
-
-def get_tuesday_meeting_window(dobj, year, month):
-    mtype = tuesday_meeting_type(dobj, dobj.year, dobj.month)
-    if mtype is None: return None, None
-    if mtype == "all_staff":
-        return time_to_minutes("10:30"), time_to_minutes("12:30")
-    else:  # cop
-        return time_to_minutes("11:00"), time_to_minutes("12:00")
-
-def inst_blocked(iname, dobj, bstart, bend):
-    ds = dobj.isoformat()
-    for h in st.session_state.constraints["holidays"]:
-        if h["date"] == ds: return True
-    for p in st.session_state.constraints["pto"]:
-        if p["instructor"] == iname and p["date"] == ds: return True
-    for m in st.session_state.constraints["meetings"]:
-        if m["date"] == ds and iname in m["instructors"]:
-            ms = time_to_minutes(m["start"])
-            me = ms + int(m["duration_hrs"] * 60)
-            if not (bend <= ms or bstart >= me):
-                return True
-    # Standing meetings enforcement
-    if dobj.strftime("%A") == "Tuesday":
-        mtype = tuesday_meeting_type(dobj, dobj.year, dobj.month)
-        if mtype == "all_staff":
-            ms, me = time_to_minutes("10:30"), time_to_minutes("12:30")
-            if not (bend <= ms or bstart >= me):
-                return True
-        elif mtype == "cop" and iname == "Eric":
-            ms, me = time_to_minutes("11:00"), time_to_minutes("12:00")
-            if not (bend <= ms or bstart >= me):
-                return True
-    return False
-
-def is_day_blocked(iname, dobj):
-    ds = dobj.isoformat()
-    for h in st.session_state.constraints["holidays"]:
-        if h["date"] == ds: return True
-    for p in st.session_state.constraints["pto"]:
-        if p["instructor"] == iname and p["date"] == ds: return True
-    return False
-
-def find_room(course, dobj, cs, ce, rsched):
-    if course.get("room_restriction"):
-        rooms = [course["room_restriction"]]
-    else:
-        rooms = [r for r in DEFAULT_ROOMS if r != "Hawking"]
-    for room in rooms:
-        busy = rsched.get((room, dobj.isoformat()), [])
-        if not any(not (ce <= rs or cs >= re) for rs, re, _ in busy):
-            return room
-    return None
-
-def is_qualified_to_teach(iname, cn):
-    return st.session_state.qualifications[iname].get(cn, QUAL_NOT_QUALIFIED) == QUAL_QUALIFIED
-
-def is_cross_training(iname, cn):
-    return st.session_state.qualifications[iname].get(cn, QUAL_NOT_QUALIFIED) == QUAL_CROSS_TRAINING
-
-
-def inst_time_conflict(iname, date_iso, cs, ce, isched):
-    """Return True if instructor already has a block overlapping cs-ce on date_iso."""
-    for (blk_s, blk_e, _) in isched.get((iname, date_iso), []):
-        if not (ce <= blk_s or cs >= blk_e):
-            return True
-    return False
-
-def schedule_two_class_day(sk, dobj, iname, c1_name, c2_name, cmap, rsched, isched):
-    sh_s, sh_e = get_shift_window(sk)
-    midpoint   = get_shift_midpoint(sk)
-    c1   = cmap[c1_name]
-    dur1 = int(c1["duration"] * 60)
-    mtg_start, mtg_resume = get_tuesday_meeting_window(dobj, dobj.year, dobj.month)
-    mtype = tuesday_meeting_type(dobj, dobj.year, dobj.month)
-
-    def prep_for(cn):
-        return 0 if cn in NO_PREP_CLASSES else PREP_MINS
-
-    def may_end_at_meeting(cn):
-        if mtype != "all_staff": return True
-        return cn in ("Lock Out / Tag Out", "Confined Space")
-
-    if c1["all_day"]:
-        cs1 = sh_s; ce1 = cs1 + dur1
-        if ce1 > sh_e or inst_blocked(iname, dobj, cs1, ce1): return None, None, None
-        if inst_time_conflict(iname, dobj.isoformat(), cs1, ce1, isched): return None, None, None
-        room1 = find_room(c1, dobj, cs1, ce1, rsched)
-        if room1 is None: return None, None, None
-        return _make_session(sk, dobj, iname, c1_name, c1, cs1, cs1, ce1, room1), None, None
-
-    p1 = prep_for(c1_name); cs1 = sh_s; ce1 = cs1 + dur1  # class always starts at shift start
-    if mtg_start is not None:
-        if cs1 < mtg_start and ce1 > mtg_start:
-            if may_end_at_meeting(c1_name):
-                ncs = mtg_start - dur1
-                if ncs >= sh_s: cs1, ce1 = ncs, mtg_start
-                else: cs1 = mtg_resume + p1; ce1 = cs1 + dur1
-            else:
-                cs1 = mtg_resume + p1; ce1 = cs1 + dur1
-        elif mtg_start <= cs1 < mtg_resume:
-            cs1 = mtg_resume + p1; ce1 = cs1 + dur1
-
-    if ce1 > sh_e or inst_blocked(iname, dobj, cs1, ce1): return None, None, None
-    if inst_time_conflict(iname, dobj.isoformat(), cs1, ce1, isched): return None, None, None
-    room1 = find_room(c1, dobj, cs1, ce1, rsched)
-    if room1 is None: return None, None, None
-    s1 = _make_session(sk, dobj, iname, c1_name, c1, cs1 - p1, cs1, ce1, room1)  # prep before shift start is OK
-
-    if c2_name is None:
-        meal_start = None if (mtg_start is not None and ce1 <= mtg_start) else max(ce1, midpoint)
-        return s1, None, meal_start
-
-    c2 = cmap[c2_name]; dur2 = int(c2["duration"] * 60); p2 = prep_for(c2_name)
-    if mtg_start is not None and ce1 <= mtg_start:
-        ps2 = mtg_resume; cs2 = ps2 + p2; meal_start = None
-    else:
-        meal_start = max(ce1, midpoint); ps2 = meal_start + MEAL_MINS; cs2 = ps2 + p2
-    ce2 = cs2 + dur2
-    if ce2 > sh_e or inst_blocked(iname, dobj, cs2, ce2): return s1, None, meal_start
-    if inst_time_conflict(iname, dobj.isoformat(), cs2, ce2, isched): return s1, None, meal_start
-    room2 = find_room(c2, dobj, cs2, ce2, rsched)
-    if room2 is None: return s1, None, meal_start
-    return s1, _make_session(sk, dobj, iname, c2_name, c2, ps2, cs2, ce2, room2), meal_start
-
-
-def _make_session(sk, dobj, iname, cn, course, ps, cs, ce, room, shadow_of=None):
-    return {
-        "date": dobj.isoformat(), "shift": sk, "course": cn,
-        "instructor": iname, "room": room,
-        "prep_start":  minutes_to_time(ps), "class_start": minutes_to_time(cs), "class_end": minutes_to_time(ce),
-        "prep_start_min": ps, "class_start_min": cs, "class_end_min": ce,
-        "duration_hrs": course["duration"], "all_day": course["all_day"],
-        "shadow_of": shadow_of,
-    }
-
-def commit_session(s, rsched, isched, icount, scc, ihours=None):
-    iname, date_iso, sk, cn = s["instructor"], s["date"], s["shift"], s["course"]
-    ki = (iname, date_iso)
-    isched.setdefault(ki, []).append((s["prep_start_min"], s["class_end_min"], cn))
-    isched[ki].sort(key=lambda x: x[0])
-    if not s.get("shadow_of"):
-        rsched.setdefault((s["room"], date_iso), []).append((s["class_start_min"], s["class_end_min"], cn))
-        rsched[(s["room"], date_iso)].sort(key=lambda x: x[0])
-    icount[iname] = icount.get(iname, 0) + 1
-    if ihours is not None and not s.get("shadow_of"):
-        ihours[iname] = ihours.get(iname, 0.0) + s["duration_hrs"]
-    if not s.get("shadow_of"):
-        scc[sk][cn] = scc[sk].get(cn, 0) + 1
-
-def pick_slot1(pool, cmap, scc, sk, reqs, used_cn=None, day_courses=None):
-    day_courses = day_courses or set()
-    def shift_over(cn): return scc[sk][cn] >= max(1, reqs.get(cn, 0))
-    def total_rem(cn):  return max(0, reqs.get(cn, 0) - sum(scc[s][cn] for s in ACTIVE_SHIFTS))
-    def dup(cn): return 1 if cn in day_courses else 0
-    candidates = [cn for cn in pool if cn != used_cn]
-    t1 = sorted([cn for cn in candidates if SLOT1_MIN <= cmap[cn]["duration"] <= SLOT1_MAX and not shift_over(cn) and total_rem(cn) > 0], key=dup)
-    if t1: return t1[0]
-    t2 = sorted([cn for cn in candidates if SLOT1_MIN <= cmap[cn]["duration"] <= SLOT1_MAX and not shift_over(cn)], key=dup)
-    if t2: return t2[0]
-    t3 = sorted([cn for cn in candidates if not shift_over(cn)], key=dup)
-    if t3: return t3[0]
-    return sorted(candidates, key=dup)[0] if candidates else None
-
-def pick_slot2(pool, cmap, scc, sk, reqs, exclude_cn=None, day_courses=None):
-    day_courses = day_courses or set()
-    def total_rem(cn): return max(0, reqs.get(cn, 0) - sum(scc[s][cn] for s in ACTIVE_SHIFTS))
-    def shift_over(cn): return scc[sk][cn] >= max(1, reqs.get(cn, 0))
-    def sort_key(cn): return (1 if cn in day_courses else 0, scc[sk][cn])
-    pool_f = [cn for cn in pool if cn != exclude_cn]
-    best = [cn for cn in pool_f if SLOT2_MIN <= cmap[cn]["duration"] <= SLOT2_MAX and total_rem(cn) > 0 and not shift_over(cn)]
-    if best: best.sort(key=sort_key); return best[0]
-    ok = [cn for cn in pool_f if SLOT2_MIN <= cmap[cn]["duration"] <= SLOT2_MAX and not shift_over(cn)]
-    if ok: ok.sort(key=sort_key); return ok[0]
-    return None
-
-def qualified_pool_for(iname, sk, scc, reqs, cmap):
-    all_cn = [c["name"] for c in DEFAULT_CLASSES]
-    pool = [cn for cn in all_cn if not cmap[cn]["all_day"] and is_qualified_to_teach(iname, cn)]
-    def total_rem(cn): return max(0, reqs.get(cn, 0) - sum(scc[s][cn] for s in ACTIVE_SHIFTS))
-    pool.sort(key=lambda cn: (-total_rem(cn), scc[sk][cn]))
-    return pool
-
-def sort_dates_by_weekday(dates, sk):
-    order = SHIFT_DAY_ORDER.get(sk, {})
-    return sorted(dates, key=lambda d: order.get(day_name(d), 99))
-
-def get_day_courses(date_iso, sessions):
-    """Return the set of course names already scheduled on a given date (any shift, non-shadow)."""
-    return {s["course"] for s in sessions if s["date"] == date_iso and not s.get("shadow_of")}
-
-
-def get_shift_window_hours(sk):
-    s, e = get_shift_window(sk)
-    return (e - s) / 60.0
-
-def get_shift_weekly_target_hours(sk):
-    return get_shift_window_hours(sk) * len(DEFAULT_SHIFTS[sk]["days"])
-
-
-def inst_over_phase1_target(iname, sk, ihours, lead_instructors, n_weeks, target_wk=30.0):
-    """
-    Returns True if iname should be skipped during phase-1 scheduling.
-    An instructor is skipped if:
-      - They are at or above the 30 hrs/week monthly target, AND
-      - At least one shift-mate is still below that target.
-    This forces under-loaded instructors to be filled first.
-    """
-    monthly_target = target_wk * n_weeks
-    shift_mates = [i["name"] for i in lead_instructors if i["shift"] == sk]
-    if len(shift_mates) <= 1:
-        return False
-    if ihours.get(iname, 0.0) < monthly_target:
-        return False  # not yet at target themselves
-    # Check if any shift-mate is still below target
-    return any(ihours.get(n, 0.0) < monthly_target for n in shift_mates if n != iname)
-
-def generate_schedule():
-    month       = st.session_state.schedule_month
-    year        = st.session_state.schedule_year
-    month_dates = get_month_dates(year, month)
-    n_weeks     = max(len(get_month_weeks(year, month)), 1)
-    reqs        = dict(st.session_state.class_requirements)
-
-    sessions = []; flags = []; rsched = {}; isched = {}; meal_map = {}
-    all_cn   = [c["name"] for c in DEFAULT_CLASSES]
-    cmap     = {c["name"]: c for c in DEFAULT_CLASSES}
-
-    shift_days = {
-        "A1": ["Monday","Tuesday","Wednesday","Thursday"],
-        "A2": ["Tuesday","Wednesday","Thursday","Friday"],
-        "B":  ["Monday","Tuesday","Wednesday","Thursday"],
-        "C":  ["Friday","Saturday","Sunday"],
-    }
-
-    removed = st.session_state.get("removed_instructors", set())
-    lead_instructors = [i for i in DEFAULT_INSTRUCTORS
-                        if not i.get("cross_training_only") and i["name"] not in removed]
-    ct_instructors   = [i for i in DEFAULT_INSTRUCTORS
-                        if i.get("cross_training_only") and i["name"] not in removed]
-
-    ibs    = {sk: [i for i in lead_instructors if i["shift"] == sk] for sk in ACTIVE_SHIFTS}
-    scc    = {s: {cn: 0 for cn in all_cn} for s in ACTIVE_SHIFTS}
-    icount  = {i["name"]: 0   for i in DEFAULT_INSTRUCTORS}
-    ihours  = {i["name"]: 0.0 for i in DEFAULT_INSTRUCTORS}
-
-    sdates = {sk: sort_dates_by_weekday(
-                  [d for d in month_dates if day_name(d) in shift_days[sk]], sk)
-              for sk in ACTIVE_SHIFTS}
-
-    used_slots = set()
-
-    def try_assign_forced(iname, sk, dobj, force_c1):
-        if (iname, dobj.isoformat()) in used_slots: return False
-        if is_day_blocked(iname, dobj): return False
-        # Phase-1 balance: skip if over 30hr/wk target while shift-mates are below
-        if inst_over_phase1_target(iname, sk, ihours, lead_instructors, n_weeks):
-            return False
-        pool = qualified_pool_for(iname, sk, scc, reqs, cmap)
-        _dc  = get_day_courses(dobj.isoformat(), sessions)
-        c2   = pick_slot2(pool, cmap, scc, sk, reqs, exclude_cn=force_c1, day_courses=_dc)
-        s1, s2, meal_start = schedule_two_class_day(sk, dobj, iname, force_c1, c2, cmap, rsched, isched)
-        if s1 is None:
-            s1, s2, meal_start = schedule_two_class_day(sk, dobj, iname, force_c1, None, cmap, rsched, isched)
-        if s1 is None: return False
-        commit_session(s1, rsched, isched, icount, scc, ihours); sessions.append(s1)
-        if s2: commit_session(s2, rsched, isched, icount, scc, ihours); sessions.append(s2)
-        if meal_start is not None: meal_map[(iname, dobj.isoformat())] = meal_start
-        used_slots.add((iname, dobj.isoformat()))
-        return True
-
-    def try_assign_day(iname, sk, dobj):
-        if (iname, dobj.isoformat()) in used_slots: return False
-        if is_day_blocked(iname, dobj): return False
-        # Phase-1 balance: skip if over 30hr/wk target while shift-mates are below
-        if inst_over_phase1_target(iname, sk, ihours, lead_instructors, n_weeks):
-            return False
-        pool   = qualified_pool_for(iname, sk, scc, reqs, cmap)
-        allday = [cn for cn in all_cn if cmap[cn]["all_day"] and is_qualified_to_teach(iname, cn)]
-        for cn in allday:
-            if max(0, reqs.get(cn, 0) - sum(scc[s][cn] for s in ACTIVE_SHIFTS)) > 0:
-                s1, _, _ = schedule_two_class_day(sk, dobj, iname, cn, None, cmap, rsched, isched)
-                if s1:
-                    commit_session(s1, rsched, isched, icount, scc, ihours); sessions.append(s1)
-                    used_slots.add((iname, dobj.isoformat())); return True
-        _dc = get_day_courses(dobj.isoformat(), sessions)
-        c1 = pick_slot1(pool, cmap, scc, sk, reqs, day_courses=_dc)
-        if c1 is None: return False
-        c2 = pick_slot2(pool, cmap, scc, sk, reqs, exclude_cn=c1, day_courses=_dc)
-        s1, s2, meal_start = schedule_two_class_day(sk, dobj, iname, c1, c2, cmap, rsched, isched)
-        if s1 is None:
-            s1, s2, meal_start = schedule_two_class_day(sk, dobj, iname, c1, None, cmap, rsched, isched)
-        if s1 is None:
-            for cn in pool:
-                s1, s2, meal_start = schedule_two_class_day(sk, dobj, iname, cn, None, cmap, rsched, isched)
-                if s1: break
-        if s1 is None: return False
-        commit_session(s1, rsched, isched, icount, scc, ihours); sessions.append(s1)
-        if s2: commit_session(s2, rsched, isched, icount, scc, ihours); sessions.append(s2)
-        if meal_start is not None: meal_map[(iname, dobj.isoformat())] = meal_start
-        used_slots.add((iname, dobj.isoformat()))
-        return True
-
-    for sk in ACTIVE_SHIFTS:
-        dlist = list(sdates[sk])
-        if not dlist: continue
-        for course in DEFAULT_CLASSES:
-            if course["all_day"]: continue
-            cn = course["name"]
-            if scc[sk][cn] > 0: continue
-            qualified = [i for i in ibs[sk] if is_qualified_to_teach(i["name"], cn)]
-            if not qualified:
-                flags.append(cn + " has no qualified instructor on " + DEFAULT_SHIFTS[sk]["label"] + " - skipped.")
-                continue
-            placed = False
-            for dobj in dlist:
-                if placed: break
-                for inst in sorted(qualified, key=lambda i: ihours[i["name"]]):
-                    if (inst["name"], dobj.isoformat()) in used_slots: continue
-                    if try_assign_forced(inst["name"], sk, dobj, cn):
-                        placed = True; break
-            if not placed:
-                flags.append("Could not schedule " + cn + " on " + DEFAULT_SHIFTS[sk]["label"] + " (minimum once).")
-
-    for sk in ACTIVE_SHIFTS:
-        dlist = list(sdates[sk])
-        if not dlist: continue
-        for course in DEFAULT_CLASSES:
-            if not course["all_day"]: continue
-            cn = course["name"]
-            if scc[sk][cn] > 0: continue
-            qualified = [i for i in ibs[sk] if is_qualified_to_teach(i["name"], cn)]
-            if not qualified: continue
-            placed = False
-            for dobj in dlist:
-                if placed: break
-                for inst in sorted(qualified, key=lambda i: ihours[i["name"]]):
-                    if (inst["name"], dobj.isoformat()) in used_slots: continue
-                    s1, _, _ = schedule_two_class_day(sk, dobj, inst["name"], cn, None, cmap, rsched, isched)
-                    if s1:
-                        commit_session(s1, rsched, isched, icount, scc, ihours); sessions.append(s1)
-                        used_slots.add((inst["name"], dobj.isoformat())); placed = True; break
-
-    n_a1 = len([i for i in lead_instructors if i["shift"] == "A1"])
-    n_a2 = len([i for i in lead_instructors if i["shift"] == "A2"])
-    n_b  = len([i for i in lead_instructors if i["shift"] == "B"])
-    weighted_shift_order = (["A1"] * n_a1 + ["A2"] * n_a2 + ["B"] * max(n_b, 1)) * 4
-    for cn in all_cn:
-        req  = reqs.get(cn, 0)
-        need = req - sum(scc[s][cn] for s in ACTIVE_SHIFTS)
-        if need <= 0: continue
-        for sk in weighted_shift_order:
-            if need <= 0: break
-            dlist = list(sdates[sk])
-            for dobj in dlist:
-                if need <= 0: break
-                qualified = [i for i in ibs[sk] if is_qualified_to_teach(i["name"], cn)]
-                for inst in sorted(qualified, key=lambda i: ihours[i["name"]]):
-                    if (inst["name"], dobj.isoformat()) in used_slots: continue
-                    if try_assign_forced(inst["name"], sk, dobj, cn):
-                        need -= 1; break
-        if need > 0:
-            flags.append("Could only schedule " + cn + " " + str(reqs.get(cn,0)-need) + "/" + str(reqs.get(cn,0)) + " times.")
-
-    max_len = max(len(sdates[sk]) for sk in ACTIVE_SHIFTS)
-    interleaved = []
-    for di in range(max_len):
-        for sk in ACTIVE_SHIFTS:
-            if di < len(sdates[sk]):
-                interleaved.append((sk, sdates[sk][di]))
-    for (sk, dobj) in interleaved:
-        for inst in sorted(ibs[sk], key=lambda i: ihours[i["name"]]):
-            try_assign_day(inst["name"], sk, dobj)
-
-    def gap_fill_pass(phase2=False):
-        inst_map = {i["name"]: i for i in DEFAULT_INSTRUCTORS}
-        changed  = False
-        def _p(cn): return 0 if cn in NO_PREP_CLASSES else PREP_MINS
-
-        for (iname, date_iso) in sorted(used_slots):
-            dobj     = date.fromisoformat(date_iso)
-            inst_rec = inst_map.get(iname)
-            if inst_rec is None or inst_rec.get("cross_training_only"): continue
-            sk       = inst_rec["shift"]
-            # Phase-1 balance: throttle gap-fill if over 30hr/wk target
-            if not phase2 and inst_over_phase1_target(iname, sk, ihours, lead_instructors, n_weeks):
-                continue
-            sh_s, sh_e = get_shift_window(sk, dobj)
-            mtg_s, mtg_r = get_tuesday_meeting_window(dobj, dobj.year, dobj.month)
-
-            # Keep filling until no more classes fit
-            filled = True
-            while filled:
-                filled = False
-                day_blocks = sorted(isched.get((iname, date_iso), []), key=lambda x: x[0])
-                if not day_blocks: break
-
-                last_end = max(b[1] for b in day_blocks)
-                midpoint = (sh_s + sh_e) // 2
-                had_meal = (iname, date_iso) in meal_map
-
-                # On All Staff meeting days, lunch is covered by the meeting — skip meal break
-                all_staff_day = tuesday_meeting_type(dobj, dobj.year, dobj.month) == "all_staff"
-
-                if not had_meal:
-                    if all_staff_day:
-                        # Treat the meeting itself as the meal — record meal at meeting start
-                        meal_map[(iname, date_iso)] = mtg_s if mtg_s is not None else midpoint
-                    else:
-                        meal_at = max(last_end, midpoint)
-                        meal_map[(iname, date_iso)] = meal_at
-                    had_meal = True
-
-                meal_at = meal_map[(iname, date_iso)]
-                meal_end = meal_at + MEAL_MINS
-
-                # Build free windows respecting meal and meetings
-                free_windows = []
-                if mtg_s is not None:
-                    # Pre-meeting window (after last class, before meeting)
-                    if last_end < mtg_s:
-                        free_windows.append(("pre_mtg", last_end, mtg_s))
-                    # Post-meeting window — no extra meal buffer needed on all_staff days
-                    if mtg_r is not None and mtg_r < sh_e:
-                        free_windows.append(("post_mtg", mtg_r, sh_e))
-                else:
-                    # Normal: before meal, then after meal
-                    if last_end < meal_at:
-                        free_windows.append(("pre_meal", last_end, meal_at))
-                    free_windows.append(("post_meal", meal_end, sh_e))
-
-                for (wtype, w_start, w_end) in free_windows:
-                    avail = w_end - w_start
-                    if avail < 60: continue
-                    _gdc = get_day_courses(date_iso, sessions)
-                    pool = [c["name"] for c in DEFAULT_CLASSES if not c["all_day"]
-                            and is_qualified_to_teach(iname, c["name"])
-                            and int(c["duration"] * 60) + _p(c["name"]) <= avail]
-                    if not pool: continue
-                    pool.sort(key=lambda cn: (
-                        sum(scc[s][cn] for s in ACTIVE_SHIFTS),
-                        1 if cn in _gdc else 0,
-                        abs((w_end - 60) - (w_start + _p(cn) + int(cmap[cn]["duration"] * 60))),
-                        scc[sk][cn]
-                    ))
-                    for cn in pool:
-                        course = cmap[cn]; pv = _p(cn)
-                        cs = w_start + pv; ce = cs + int(course["duration"] * 60)
-                        if ce > w_end or inst_blocked(iname, dobj, cs, ce): continue
-                        if inst_time_conflict(iname, date_iso, cs, ce, isched): continue
-                        room = find_room(course, dobj, cs, ce, rsched)
-                        if room is None: continue
-                        s = _make_session(sk, dobj, iname, cn, course, w_start, cs, ce, room)
-                        commit_session(s, rsched, isched, icount, scc, ihours); sessions.append(s)
-                        changed = True; filled = True; break
-                    if filled: break
-        return changed
-    # Phase-1 gap fill: respects 30hr/wk cap to balance instructors
-    for _ in range(20):
-        if not gap_fill_pass(phase2=False): break
-    # Phase-2 gap fill: cap removed, fill everyone toward shift-window max
-    for _ in range(20):
-        if not gap_fill_pass(phase2=True): break
-
-
-    # ── Weekly frequency enforcement (Sun-Sat weeks, clipped to month) ──────
-    month_weeks_all = get_month_weeks(year, month)
-    for sk in ACTIVE_SHIFTS:
-        for course in DEFAULT_CLASSES:
-            cn = course["name"]
-            if cn in SKIP_WEEKLY_FREQ or course["all_day"]: continue
-            qualified = [i for i in ibs[sk] if is_qualified_to_teach(i["name"], cn)]
-            if not qualified: continue
-            for week_days in month_weeks_all:
-                wdays = [d for d in week_days if day_name(d) in shift_days[sk]]
-                if not wdays: continue
-                week_dates_set = {d.isoformat() for d in week_days}
-                already = any(
-                    s["course"] == cn and s["shift"] == sk and not s.get("shadow_of")
-                    and s["date"] in week_dates_set
-                    for s in sessions)
-                if already: continue
-                placed = False
-                for dobj in sorted(wdays, key=lambda d: min(icount[i["name"]] for i in qualified)):
-                    if placed: break
-                    for inst in sorted(qualified, key=lambda i: ihours[i["name"]]):
-                        if is_day_blocked(inst["name"], dobj): continue
-                        if (inst["name"], dobj.isoformat()) not in used_slots:
-                            if try_assign_forced(inst["name"], sk, dobj, cn):
-                                placed = True; break
-                        else:
-                            di2 = dobj.isoformat(); _, se2 = get_shift_window(sk)
-                            m2s, m2r = get_tuesday_meeting_window(dobj, dobj.year, dobj.month)
-                            blks = isched.get((inst["name"], di2), [])
-                            if not blks: continue
-                            le   = max(b[1] for b in blks)
-                            fs   = m2r if (m2s is not None and le <= m2s) else le + MEAL_MINS
-                            pv   = 0 if cn in NO_PREP_CLASSES else PREP_MINS
-                            ct   = fs + pv
-                            ce_t = ct + int(cmap[cn]["duration"] * 60)
-                            if ce_t > se2 or inst_blocked(inst["name"], dobj, ct, ce_t): continue
-                            rt = find_room(cmap[cn], dobj, ct, ce_t, rsched)
-                            if rt is None: continue
-                            sn = _make_session(sk, dobj, inst["name"], cn, cmap[cn], fs, ct, ce_t, rt)
-                            commit_session(sn, rsched, isched, icount, scc, ihours)
-                            sessions.append(sn); placed = True; break
-                if not placed:
-                    week_label = (week_days[0].strftime("%b %d")
-                                  + "–" + week_days[-1].strftime("%b %d"))
-                    flags.append(
-                        "Weekly freq: '" + cn + "' missing on "
-                        + DEFAULT_SHIFTS[sk]["label"] + " week of " + week_label + ".")
-
-
-    # ── Mechanical Skills: at least once per week on A1 or B ──────────────────
-    mech_cn = "Mechanical Skills"
-    if mech_cn in cmap:
-        for week_days in month_weeks_all:
-            week_dates_set = {d.isoformat() for d in week_days}
-            already = any(
-                s["course"] == mech_cn and s["shift"] in MECH_SKILLS_WEEKLY_SHIFTS
-                and not s.get("shadow_of") and s["date"] in week_dates_set
-                for s in sessions)
-            if already:
-                continue
-            placed = False
-            for sk_try in ["A1", "B"]:
-                if placed: break
-                wdays = [d for d in week_days if day_name(d) in shift_days[sk_try]]
-                qualified = [i for i in ibs[sk_try] if is_qualified_to_teach(i["name"], mech_cn)]
-                for dobj in wdays:
-                    if placed: break
-                    for inst in sorted(qualified, key=lambda i: ihours[i["name"]]):
-                        if is_day_blocked(inst["name"], dobj): continue
-                        if (inst["name"], dobj.isoformat()) not in used_slots:
-                            if try_assign_forced(inst["name"], sk_try, dobj, mech_cn):
-                                placed = True; break
-            if not placed:
-                wl = week_days[0].strftime("%b %d") + "–" + week_days[-1].strftime("%b %d")
-                flags.append(f"Weekly freq: 'Mechanical Skills' missing on A1/B week of {wl}.")
-
-    # ── B shift: all non-all-day courses at least twice per month ─────────────
-    for course in DEFAULT_CLASSES:
-        cn = course["name"]
-        if course["all_day"]: continue
-        b_count = scc["B"].get(cn, 0)
-        if b_count < 2:
-            need_b = 2 - b_count
-            qualified_b = [i for i in ibs["B"] if is_qualified_to_teach(i["name"], cn)]
-            for dobj in sdates["B"]:
-                if need_b <= 0: break
-                for inst in sorted(qualified_b, key=lambda i: ihours[i["name"]]):
-                    if (inst["name"], dobj.isoformat()) not in used_slots:
-                        if try_assign_forced(inst["name"], "B", dobj, cn):
-                            need_b -= 1; break
-            if need_b > 0:
-                flags.append(f"B-shift: '{cn}' only {2 - need_b}/2 times on B shift this month.")
-
-    shadow_sessions = []
-    for ct_inst in ct_instructors:
-        ct_name  = ct_inst["name"]
-        ct_sk    = ct_inst["shift"]
-        ct_dates = sort_dates_by_weekday(
-            [d for d in month_dates if day_name(d) in shift_days[ct_sk]], ct_sk)
-
-        shadow_days_per_inst = {i["name"]: 0 for i in lead_instructors if i["shift"] == ct_sk}
-        tiebreak = {i["name"]: random.random() for i in lead_instructors if i["shift"] == ct_sk}
-
-        for dobj in ct_dates:
-            if is_day_blocked(ct_name, dobj): continue
-            date_iso = dobj.isoformat()
-
-            day_leads = [s for s in sessions
-                         if s["date"] == date_iso
-                         and s["shift"] == ct_sk
-                         and not s.get("shadow_of")
-                         and is_cross_training(ct_name, s["course"])]
-            if not day_leads: continue
-
-            leads_by_inst = defaultdict(list)
-            for lead_s in day_leads:
-                leads_by_inst[lead_s["instructor"]].append(lead_s)
-
-            ct_blocks = []
-
-            def ct_overlaps(cs, ce):
-                for (bs, be) in ct_blocks:
-                    if not (ce <= bs or cs >= be): return True
-                return False
-
-            def course_shadow_count(cn):
-                return sum(1 for x in shadow_sessions if x["course"] == cn)
-
-            all_candidates = []
-            for n in leads_by_inst:
-                for s in leads_by_inst[n]:
-                    all_candidates.append((n, s))
-            all_candidates.sort(key=lambda x: (
-                course_shadow_count(x[1]["course"]),
-                shadow_days_per_inst.get(x[0], 0),
-                tiebreak.get(x[0], 0)
-            ))
-
-            for lead_inst_name, lead_s in all_candidates:
-                cs = lead_s["class_start_min"]
-                ce = lead_s["class_end_min"]
-                if inst_blocked(ct_name, dobj, cs, ce): continue
-                if ct_overlaps(cs, ce): continue
-                shadow = _make_session(
-                    lead_s["shift"], dobj, ct_name,
-                    lead_s["course"], cmap[lead_s["course"]],
-                    lead_s["prep_start_min"], cs, ce,
-                    lead_s["room"],
-                    shadow_of=lead_s["instructor"]
-                )
-                ki = (ct_name, date_iso)
-                isched.setdefault(ki, []).append((cs, ce, lead_s["course"]))
-                isched[ki].sort(key=lambda x: x[0])
-                icount[ct_name] = icount.get(ct_name, 0) + 1
-                shadow_sessions.append(shadow)
-                used_slots.add((ct_name, date_iso))
-                ct_blocks.append((cs, ce))
-                shadow_days_per_inst[lead_inst_name] = shadow_days_per_inst.get(lead_inst_name, 0) + 1
-                break
-
-    sessions.extend(shadow_sessions)
-
-    # Guarantee a 30-min break for every instructor on every working day
-    for (iname, date_iso) in list(used_slots):
-        if (iname, date_iso) in meal_map:
-            continue
-        dobj = date.fromisoformat(date_iso)
-        inst_rec = next((i for i in DEFAULT_INSTRUCTORS if i["name"] == iname), None)
-        if inst_rec is None:
-            continue
-        sk = inst_rec["shift"]
-        sh_s, sh_e = get_shift_window(sk, dobj)
-        midpoint = (sh_s + sh_e) // 2
-        mtg_s, _ = get_tuesday_meeting_window(dobj, dobj.year, dobj.month)
-        if tuesday_meeting_type(dobj, dobj.year, dobj.month) == "all_staff" and mtg_s is not None:
-            meal_map[(iname, date_iso)] = mtg_s
-        else:
-            day_blocks = sorted(isched.get((iname, date_iso), []), key=lambda x: x[0])
-            last_end = max((b[1] for b in day_blocks), default=sh_s)
-            meal_map[(iname, date_iso)] = max(last_end, midpoint)
-
-    return {"sessions": sessions, "flags": flags, "meal_map": meal_map, "isched": isched}
 
 
-def build_excel(sched, month, year):
+def build_excel(sched, month, year, meetings=None):
+    # ``meetings`` defaults to the session's; background jobs pass theirs in.
+    meetings    = st.session_state.constraints["meetings"] if meetings is None else meetings
     sessions    = sched["sessions"]
     meal_map    = sched["meal_map"]
-    mont_dates  = get_month_dates(year, month)
+    cal         = month_calendar(year, month)
     INST_HEX    = {i["name"]: inst_color(i["name"])["bg"].replace("#","") for i in DEFAULT_INSTRUCTORS}
     thin  = Side(style="thin")
     thick = Side(style="medium")
@@ -880,14 +150,12 @@ def build_excel(sched, month, year):
 
     for sk in ACTIVE_SHIFTS:
         sh_label  = DEFAULT_SHIFTS[sk]["label"]
-        sh_days   = DEFAULT_SHIFTS[sk]["days"]
         ws        = wb.create_sheet(title=sh_label)
         shift_sessions  = [s for s in sessions if s["shift"] == sk]
-        shift_day_dates = sort_dates_by_weekday(
-            [d for d in mont_dates if day_name(d) in sh_days], sk)
+        shift_day_dates = cal.shift_dates(sk)
         if not shift_day_dates:
             continue
-        shift_instructors = [i["name"] for i in DEFAULT_INSTRUCTORS if i["shift"] == sk]
+        shift_instructors = [i["name"] for i in INSTRUCTORS_BY_SHIFT[sk]]
         n_inst = len(shift_instructors)
         n_days = len(shift_day_dates)
 
@@ -931,7 +199,7 @@ def build_excel(sched, month, year):
                 ws.column_dimensions[get_column_letter(col)].width = 16
         ws.row_dimensions[3].height = 18
 
-        shs, she = get_shift_window(sk)
+        shs, she = cal.window(sk)
         by_date_inst = defaultdict(list)
         for s in shift_sessions:
             by_date_inst[(s["date"], s["instructor"])].append(s)
@@ -953,15 +221,16 @@ def build_excel(sched, month, year):
                     cell_val = ""; cell_fill = "FFFFFF"; font_color = "000000"; bold = False
 
                     meeting_here = next(
-                        (m for m in st.session_state.constraints["meetings"]
+                        (m for m in meetings
                          if m["date"] == d.isoformat() and iname in m["instructors"]
                          and time_to_minutes(m["start"]) <= t
                          < time_to_minutes(m["start"]) + int(m["duration_hrs"] * 60)), None)
                     if not meeting_here:
-                        _tmt = tuesday_meeting_type(d, year, month)
-                        if _tmt == "all_staff" and time_to_minutes("10:30") <= t < time_to_minutes("12:30"):
+                        _tmt = cal.meeting_type[d]
+                        _ms, _me = cal.meeting[d]
+                        if _tmt == "all_staff" and _ms <= t < _me:
                             meeting_here = {"label": "All Staff Meeting"}
-                        elif _tmt == "cop" and iname == "Eric" and time_to_minutes("11:00") <= t < time_to_minutes("12:00"):
+                        elif _tmt == "cop" and iname in COP_MEMBERS and _ms <= t < _me:
                             meeting_here = {"label": "CoP Meeting"}
                     if meeting_here:
                         cell_val = meeting_here["label"]; cell_fill = "FF9800"
@@ -1002,11 +271,11 @@ def step8():
     if not st.session_state.generated_schedule:
         st.warning("No schedule generated yet."); return
 
-    sched      = st.session_state.generated_schedule
-    sessions   = sched["sessions"]
+    store      = _generated_store()
     month      = st.session_state.schedule_month
     year       = st.session_state.schedule_year
-    mont_dates = get_month_dates(year, month)
+    cal        = month_calendar(year, month)
+    cindex     = ConstraintIndex(st.session_state.constraints)
     AVAIL_THRESH = 90
     TIGHT_THRESH = 60
 
@@ -1016,16 +285,14 @@ def step8():
         iname    = inst["name"]
         sk       = inst["shift"]
         sh       = DEFAULT_SHIFTS[sk]
-        shs, she = get_shift_window(sk)
-        shift_dates = sort_dates_by_weekday(
-            [d for d in mont_dates if day_name(d) in sh["days"]], sk)
+        shs, she = cal.window(sk)
+        shift_dates = cal.shift_dates(sk)
 
         for d in shift_dates:
             date_iso = d.isoformat()
-            if is_day_blocked(iname, d): continue
+            if is_day_blocked(iname, d, cindex): continue
             inst_sessions = sorted(
-                [s for s in sessions if s["instructor"] == iname
-                 and s["date"] == date_iso and not s.get("shadow_of")],
+                [s for s in store.select(instructor=iname, date=date_iso) if not s.get("shadow_of")],
                 key=lambda x: x["class_start_min"])
 
             if not inst_sessions:
@@ -1111,9 +378,8 @@ def step1():
         month_num = mnames.index(month_sel) + 1
     st.markdown("---")
     st.subheader("Calendar Preview")
-    sdmap = {"Monday":"A1+B","Tuesday":"A1+A2+B","Wednesday":"A1+A2+B",
-             "Thursday":"A1+A2+B","Friday":"A2","Saturday":"Off","Sunday":"Off"}
-    dates = get_month_dates(year, month_num)
+    cal   = month_calendar(year, month_num)
+    dates = cal.dates
     weeks, week = [], []
     for _ in range(dates[0].weekday()): week.append(None)
     for d in dates:
@@ -1129,7 +395,7 @@ def step1():
         cols = st.columns(7)
         for i, d in enumerate(wk):
             if d is None: cols[i].write(" ")
-            else: cols[i].markdown("**"+str(d.day)+"** "+sdmap.get(day_name(d),"Off"))
+            else: cols[i].markdown("**"+str(d.day)+"** "+("+".join(cal.shifts[d]) or "Off"))
     st.markdown("---")
     if st.button("Next: Course Requirements", type="primary"):
         st.session_state.schedule_year  = year
@@ -1161,7 +427,7 @@ def step3():
     inst_names  = [i["name"] for i in DEFAULT_INSTRUCTORS]
     month       = st.session_state.schedule_month or 3
     year        = st.session_state.schedule_year  or 2026
-    month_dates = get_month_dates(year, month)
+    month_dates = month_calendar(year, month).dates
     date_options = [d.strftime("%A, %B %d") for d in month_dates]
     date_lookup  = {d.strftime("%A, %B %d"): d for d in month_dates}
     st.subheader("Holidays / Blackout Days")
@@ -1210,6 +476,18 @@ def step3():
         if c2.button("Remove", key="dm_"+str(i)):
             st.session_state.constraints["meetings"].pop(i); st.rerun()
     st.markdown("---")
+    _gen = st.session_state.generated_schedule
+    _old = st.session_state.generated_constraints
+    if _gen and _old is not None and _old != st.session_state.constraints:
+        st.info("Constraints changed since the schedule was generated. Repair keeps the rest of the month "
+                "and only reworks the days the change touches; Step 5 regenerates from scratch.")
+        if st.button("Repair generated schedule"):
+            result = repair_schedule(_gen, _engine_input(), constraint_delta(_old, st.session_state.constraints))
+            st.session_state.generated_schedule    = result
+            st.session_state.generated_constraints = copy.deepcopy(st.session_state.constraints)
+            _r = result["repair"]
+            st.success(f"Schedule repaired in {_r['ms']} ms: {_r['dropped']} conflicting session(s) removed, "
+                       f"{_r['added']} placed.")
     col1, col2 = st.columns(2)
     with col1:
         if st.button("Back"): prev_step()
@@ -1256,6 +534,59 @@ def step4():
     with col2:
         if st.button("Next: Generate", type="primary"): next_step()
 
+def _horizon_events(inp, n_months, starts, budget_s, meetings):
+    # Job events for a horizon run; each month's workbook is built as it finishes.
+    exports, first, n_sessions = [], None, 0
+    run = lambda x: generate_cached(x, starts=starts, budget_s=budget_s)
+    for k, (y, m, r) in enumerate(generate_horizon(inp, n_months, run)):
+        first = first or r
+        buf = io.BytesIO(); build_excel(r, m, y, meetings).save(buf)
+        exports.append((calendar.month_name[m] + " " + str(y), len(r["flags"]), buf.getvalue()))
+        n_sessions += len(r["sessions"])
+        yield {"kind": "progress", "phase": exports[-1][0] + " done", "progress": (k + 1) / n_months,
+               "sessions": n_sessions, "flags": sum(e[1] for e in exports)}
+    yield {"kind": "done", "progress": 1.0, "result": {"schedule": first, "exports": exports}}
+
+def _submit_job(kind, make_events, inp, label):
+    # The job reads its input on the worker thread, after this rerun has moved on:
+    # freeze the editable tables so steps 3-4 can change while it runs.
+    inp = replace(inp, constraints=copy.deepcopy(inp.constraints),
+                  qualifications=copy.deepcopy(inp.qualifications))
+    st.session_state.gen_job = {"id": JOBS.submit(make_events(inp), label), "kind": kind,
+                                "constraints": inp.constraints}
+    st.rerun()
+
+@st.fragment(run_every=1.0)
+def _job_panel():
+    # Polls the background job; a finished one is picked up with a full rerun.
+    job  = st.session_state.gen_job
+    info = JOBS.status(job["id"]) if job else None
+    if info is None:
+        st.session_state.gen_job = None; return
+    if info["finished"] is None:
+        what = (info["phase"] or info["state"]).replace("_", " ")
+        st.progress(info["progress"], text="Generating " + info["label"] + " — " + what)
+        st.caption(f"{info['sessions']} sessions placed · {info['flags']} flags"
+                   + (" — " + info["last_flag"] if info["last_flag"] else ""))
+        st.button("Cancel", key="job_cancel", on_click=JOBS.cancel, args=(job["id"],))
+        return
+    st.session_state.gen_job = None
+    if info["state"] == "done":
+        result = JOBS.result(job["id"])
+        if job["kind"] == "horizon":
+            st.session_state.horizon_exports = result["exports"]; result = result["schedule"]
+        else:
+            st.session_state.horizon_exports = None
+        st.session_state.generated_schedule    = result
+        st.session_state.generated_constraints = job["constraints"]
+        st.session_state.gen_notice = ("success", "Schedule generated! Use the sidebar to view Calendar or Day Detail.")
+    elif info["state"] == "cancelled":
+        st.session_state.gen_notice = ("info", f"Generation cancelled at {info['progress']:.0%} "
+                                               f"with {info['sessions']} sessions placed.")
+    else:
+        st.session_state.gen_notice = ("error", "Generation failed: " + info["error"])
+    st.rerun()
+
 def step5():
     st.title("Step 5 - Review & Generate")
     month = st.session_state.schedule_month
@@ -1288,34 +619,94 @@ def step5():
             st.markdown("- "+name+" ("+DEFAULT_SHIFTS[inst["shift"]]["label"]+"): "+str(n_q)+" Qualified, "+str(n_ct)+" Cross Training")
     st.markdown("---")
     st.info("Total minimum required sessions: "+str(sum(st.session_state.class_requirements.values())))
-    if st.button("GENERATE SCHEDULE", type="primary", use_container_width=True):
-        with st.spinner("Building schedule..."):
-            result = generate_schedule()
-        st.session_state.generated_schedule = result
-        st.success("Schedule generated! Use the sidebar to view Calendar or Day Detail.")
-        st.rerun()
+    mc1, mc2 = st.columns(2)
+    n_starts = mc1.number_input("Multi-start runs", min_value=1, max_value=64, value=1, step=1,
+                                help="Run several diversified orderings in parallel and keep the best schedule.")
+    budget_s = mc2.number_input("Time budget (s)", min_value=1.0, max_value=60.0, value=5.0, step=1.0,
+                                disabled=n_starts == 1)
+    lc1, lc2, lc3 = st.columns(3)
+    improve = lc1.checkbox("Local search", value=False,
+                           help="After the greedy passes, swap / move sessions to cut unmet requirements, "
+                                "weekly-frequency misses and hour spread.")
+    ls_mode = lc2.selectbox("Search", ["anneal", "tabu"], disabled=not improve,
+                            format_func=lambda m: {"anneal": "Simulated annealing", "tabu": "Tabu search"}[m])
+    ls_iters = lc3.number_input("Moves", min_value=1000, max_value=200000, value=20000, step=1000,
+                                disabled=not improve)
+    profile = st.checkbox("Collect diagnostics", value=False,
+                          help="Record per-phase timings and call counters for the next run.")
+    opts = {"improve_iters": int(ls_iters), "improve_mode": ls_mode} if improve else {}
+    if profile: opts["profile"] = True
+    if st.session_state.gen_notice:
+        kind, msg = st.session_state.gen_notice
+        getattr(st, kind)(msg)
+        st.session_state.gen_notice = None
+    running = st.session_state.gen_job is not None
+    if running:
+        st.caption("A generation job is running — progress is in the sidebar, and the other views stay usable meanwhile.")
+    label = calendar.month_name[month] + " " + str(year)
+    if st.button("GENERATE SCHEDULE", type="primary", use_container_width=True, disabled=running):
+        _submit_job("month", lambda inp: iter_cached(inp, starts=int(n_starts), budget_s=budget_s),
+                    _engine_input(**opts), label)
+    with st.expander("Multi-month horizon", expanded=bool(st.session_state.horizon_exports)):
+        st.caption("Generate consecutive months from " + calendar.month_name[month] + " " + str(year)
+                   + " in one run. Hour balance and Sun–Sat weeks that cross a month edge carry over; "
+                   "each month's Excel is built as soon as it is done. The first month becomes the working schedule.")
+        hc1, hc2 = st.columns([1, 3])
+        n_months = hc1.number_input("Months", min_value=2, max_value=12, value=3, step=1)
+        hc2.markdown("<br>", unsafe_allow_html=True)
+        if hc2.button("GENERATE HORIZON", use_container_width=True, disabled=running or not EXCEL_OK):
+            _submit_job("horizon", lambda inp: _horizon_events(inp, int(n_months), int(n_starts), budget_s,
+                                                               inp.constraints["meetings"]),
+                        _engine_input(**opts), label + " + " + str(int(n_months) - 1) + " months")
+        for k, (label, n_flags, blob) in enumerate(st.session_state.horizon_exports or []):
+            st.download_button(f"Download {label} ({n_flags} flags)", blob,
+                               file_name=label.replace(" ", "") + "_Schedule.xlsx", key=f"dl_horizon_{k}",
+                               mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
     if st.session_state.generated_schedule:
         sched    = st.session_state.generated_schedule
-        sessions = sched["sessions"]
+        store    = _generated_store()
         if sched["flags"]:
             _nf = len(sched["flags"])
             with st.expander(f"⚠️ {_nf} Scheduling Flag{'s' if _nf != 1 else ''} — click to expand", expanded=False):
                 for f in sched["flags"]: st.warning(f)
+        if sched.get("cached"):
+            st.caption("Inputs unchanged since an earlier run — schedule served from cache.")
+        if sched.get("multistart"):
+            _ms = sched["multistart"]
+            st.caption(f"Best of {_ms['runs']}/{_ms['starts']} multi-start runs (run {_ms['run']}) — "
+                       f"unmet: {_ms['score'][0]}, weekly misses: {_ms['score'][1]}, hour spread: {_ms['score'][2]} hrs")
+        if sched.get("improve"):
+            _im = sched["improve"]
+            st.caption(f"Local search ({_im['mode']}): objective {_im['cost_before']} → {_im['cost_after']} "
+                       f"over {_im['evaluated']} moves in {_im['seconds']}s")
+        if sched.get("profile"):
+            _pf = sched["profile"]
+            with st.expander(f"Diagnostics — generated in {_pf['total_ms']} ms", expanded=False):
+                ptbl = "| Phase | ms |\n|--|--|\n"
+                for ph, ms in _pf["phases_ms"].items(): ptbl += f"| {ph} | {ms} |\n"
+                st.markdown(ptbl)
+                ctbl = "| Counter | Attempts | Successes |\n|--|--|--|\n"
+                for fn, v in _pf["calls"].items():
+                    ctbl += (f"| {fn} | {v['attempts']} | {v['successes']} |\n" if isinstance(v, dict)
+                             else f"| {fn} | {v} | — |\n")
+                st.markdown(ctbl)
+                st.caption(f"Peak session count: {_pf['peak_sessions']}")
         st.markdown("---")
         st.subheader("Quick Summary")
         st.markdown("#### Instructor Load")
-        _mweeks = get_month_weeks(year, month)
+        cal     = month_calendar(year, month)
+        _mweeks = cal.weeks
         _nwks   = max(len(_mweeks), 1)
         tbl = "| Instructor | Shift | Lead Sessions | Shadow Sessions | Teaching Hrs | Est. Weekly Hrs | Target |\n|--|--|--|--|--|--|--|\n"
         for inst in DEFAULT_INSTRUCTORS:
             name      = inst["name"]
             sk        = inst["shift"]
-            inst_s    = [s for s in sessions if s["instructor"]==name and not s.get("shadow_of")]
-            shadow_s  = [s for s in sessions if s["instructor"]==name and s.get("shadow_of")]
+            own       = store.by_instructor.get(name, {}).values()
+            inst_s    = [s for s in own if not s.get("shadow_of")]
+            shadow_s  = [s for s in own if s.get("shadow_of")]
             total_hrs = sum(s["duration_hrs"] for s in inst_s)
-            wdays_worked = sum(1 for d in get_month_dates(year, month)
-                               if day_name(d) in DEFAULT_SHIFTS[sk]["days"]
-                               and (name, d.isoformat()) in sched.get("meal_map", {}))
+            wdays_worked = sum(1 for d in cal.dates_on(sk)
+                               if (name, d.isoformat()) in sched.get("meal_map", {}))
             est_wk  = round((wdays_worked / _nwks) * get_shift_window_hours(sk), 1)
             tgt     = round(get_shift_weekly_target_hours(sk), 1)
             ct_tag  = " (CT)" if inst.get("cross_training_only") else ""
@@ -1324,30 +715,33 @@ def step5():
         st.markdown(tbl)
         st.caption("Est. Weekly Hrs = avg working days/week × shift window.  ✅ 37-43 hrs  ⚠️ 28-37 hrs  ❌ <28 hrs")
 
-        # ── Taji Shadow Breakdowns ─────────────────────────────────────────
-        taji_shadows = [s for s in sessions if s["instructor"]=="Taji" and s.get("shadow_of")]
-        if taji_shadows:
+        # ── Shadow Breakdowns (one per cross-training instructor) ─────────────
+        shadows_by_ct = defaultdict(list)
+        for s in store:
+            if s.get("shadow_of"): shadows_by_ct[s["instructor"]].append(s)
+        for ct_name in [i["name"] for i in DEFAULT_INSTRUCTORS if i["name"] in shadows_by_ct]:
+            ct_shadows = shadows_by_ct[ct_name]
             # Instructor breakdown (inline caption)
             shadow_by_inst      = defaultdict(int)
             shadow_days_by_inst = defaultdict(set)
-            for s in taji_shadows:
+            for s in ct_shadows:
                 shadow_by_inst[s["shadow_of"]] += 1
                 shadow_days_by_inst[s["shadow_of"]].add(s["date"])
             breakdown = " | ".join(
                 n + ": " + str(shadow_by_inst[n]) + " sessions / " + str(len(shadow_days_by_inst[n])) + " days"
                 for n in sorted(shadow_by_inst.keys())
             )
-            st.caption("Taji shadow breakdown → " + breakdown)
+            st.caption(ct_name + " shadow breakdown → " + breakdown)
 
             # Class breakdown (collapsible table, sorted by most-shadowed first)
             class_shadow_count = defaultdict(int)
-            for s in taji_shadows:
+            for s in ct_shadows:
                 class_shadow_count[s["course"]] += 1
             sorted_classes = sorted(class_shadow_count.items(), key=lambda x: -x[1])
             tbl_class = "| Course | Times Shadowed |\n|---|---|\n"
             for cn, cnt in sorted_classes:
                 tbl_class += "| " + cn + " | " + str(cnt) + " |\n"
-            with st.expander("Taji Shadow Class Breakdown"):
+            with st.expander(ct_name + " Shadow Class Breakdown"):
                 st.markdown(tbl_class)
 
         st.markdown("#### Course Coverage")
@@ -1360,14 +754,14 @@ def step5():
             tag = " [P]" if c["priority"] else ""
             counts = []; tot = 0
             for sk in ACTIVE_SHIFTS:
-                n = sum(1 for s in sessions if s["course"]==cn and s["shift"]==sk and not s.get("shadow_of"))
+                n = sum(1 for s in store.by_shift.get(sk, {}).values() if s["course"]==cn and not s.get("shadow_of"))
                 counts.append(str(n) if n else "-"); tot += n
             rows.append("| "+cn+tag+" | "+" | ".join(counts)+" | "+str(tot)+" / "+str(req)+" |")
         st.markdown(hdr+sep+"\n".join(rows))
 
         st.markdown("#### Weekly Frequency Check")
         st.caption("\u2705 = taught that week on that shift  \u274c = missing  \u2014 = exempt (IPC 620, J-STD, Mech/Elec Torque)")
-        _month_weeks = get_month_weeks(year, month)
+        _month_weeks = cal.weeks
         _wh = []
         for _wk_days in _month_weeks:
             _ws = _wk_days[0]; _we = _wk_days[-1]
@@ -1376,19 +770,15 @@ def step5():
         _wf_hdr = "| Class | " + " | ".join(_wh) + " |\n"
         _wf_sep = "|--|" + "|".join(["--"] * len(_month_weeks)) + "|\n"
         _wf_rows = []
+        _cov = CoverageIndex.from_sessions(store, _month_weeks, sched.get("carry_in"))
         for _c in DEFAULT_CLASSES:
             _cn = _c["name"]
             if _cn in SKIP_WEEKLY_FREQ or _c["all_day"]:
                 _wf_rows.append("| " + _cn + " | " + " | ".join(["\u2014"] * len(_month_weeks)) + " |")
                 continue
             _cells = []
-            for _wk_days in _month_weeks:
-                _week_dates_set = {_d.isoformat() for _d in _wk_days}
-                _hits = set()
-                for _s in sessions:
-                    if _s["course"] == _cn and not _s.get("shadow_of"):
-                        if _s["date"] in _week_dates_set:
-                            _hits.add(_s["shift"])
+            for _wi in range(len(_month_weeks)):
+                _hits = _cov.shifts(_cn, _wi)
                 _cells.append("\u2705 " + ", ".join(sorted(_hits)) if _hits else "\u274c")
             _wf_rows.append("| " + _cn + " | " + " | ".join(_cells) + " |")
         st.markdown(_wf_hdr + _wf_sep + "\n".join(_wf_rows))
@@ -1398,7 +788,7 @@ def step6():
     if not st.session_state.generated_schedule:
         st.warning("No schedule generated yet."); return
     sched    = st.session_state.generated_schedule
-    sessions = sched["sessions"]
+    store    = _generated_store()
     month    = st.session_state.schedule_month
     year     = st.session_state.schedule_year
     st.markdown("### "+calendar.month_name[month]+" "+str(year))
@@ -1406,7 +796,7 @@ def step6():
     # ── Calendar Filters ──────────────────────────────────────────────
     all_instructors = [i["name"] for i in DEFAULT_INSTRUCTORS
                        if not i.get("cross_training_only")]
-    all_courses = sorted(set(s["course"] for s in sessions
+    all_courses = sorted(set(s["course"] for s in store
                             if not s.get("shadow_of")))
     fc1, fc2 = st.columns(2)
     filter_insts   = fc1.multiselect("Filter by Instructor",
@@ -1431,9 +821,8 @@ def step6():
     legend_html += "</div>"
     st.markdown(legend_html, unsafe_allow_html=True)
     st.markdown("---")
-    dates = get_month_dates(year, month)
-    sess_by_date = defaultdict(list)
-    for s in sessions: sess_by_date[s["date"]].append(s)
+    cal   = month_calendar(year, month)
+    dates = cal.dates
     weeks, week = [], []
     for _ in range(dates[0].weekday()): week.append(None)
     for d in dates:
@@ -1451,7 +840,7 @@ def step6():
             if d is None:
                 cols[i].markdown("<div style='min-height:80px'></div>", unsafe_allow_html=True)
             else:
-                day_sessions = sorted(sess_by_date.get(d.isoformat(), []), key=lambda x: x["class_start_min"])
+                day_sessions = sorted(store.by_date.get(d.isoformat(), {}).values(), key=lambda x: x["class_start_min"])
                 cell = "<div style='border:1px solid #ddd;border-radius:4px;padding:4px;min-height:80px'>"
                 cell += "<div style='font-weight:bold;margin-bottom:4px'>"+str(d.day)+"</div>"
                 for s in day_sessions:
@@ -1471,9 +860,9 @@ def step6():
                     s["instructor"] for s in day_sessions if not s.get("shadow_of")))
                 badge_line = ""
                 for iname in shown_insts:
-                    inst_rec = next((x for x in DEFAULT_INSTRUCTORS if x["name"] == iname), None)
+                    inst_rec = INSTRUCTOR_BY_NAME.get(iname)
                     if not inst_rec or inst_rec.get("cross_training_only"): continue
-                    _, she_i = get_shift_window(inst_rec["shift"])
+                    _, she_i = cal.window(inst_rec["shift"])
                     inst_day = [s for s in day_sessions
                                 if s["instructor"] == iname and not s.get("shadow_of")]
                     if inst_day:
@@ -1506,17 +895,18 @@ def step7():
     if not st.session_state.generated_schedule:
         st.warning("No schedule generated yet."); return
     sched    = st.session_state.generated_schedule
-    sessions = sched["sessions"]
+    store    = _generated_store()
     meal_map = sched["meal_map"]
     month    = st.session_state.schedule_month
     year     = st.session_state.schedule_year
-    dates        = get_month_dates(year, month)
-    active_dates = sorted({s["date"] for s in sessions})
+    cal          = month_calendar(year, month)
+    dates        = cal.dates
+    active_dates = store.by_date
     date_options = [d.isoformat() for d in dates if d.isoformat() in active_dates]
     if not date_options: st.info("No sessions scheduled."); return
     sel_date = st.selectbox("Select a Day", date_options,
                             format_func=lambda d: date.fromisoformat(d).strftime("%A, %B %d, %Y"))
-    day_sessions = sorted([s for s in sessions if s["date"] == sel_date], key=lambda s: s["class_start_min"])
+    day_sessions = sorted(store.by_date.get(sel_date, {}).values(), key=lambda s: s["class_start_min"])
     if not day_sessions: st.info("No sessions on this day."); return
     meetings_today = [m for m in st.session_state.constraints["meetings"] if m["date"] == sel_date]
 
@@ -1525,7 +915,7 @@ def step7():
         if not inst_sessions: return
         col = inst_color(iname)
         sh  = DEFAULT_SHIFTS[sk]
-        sh_s, sh_e = get_shift_window(sk)
+        sh_s, sh_e = cal.window(sk)
         st.markdown("<div style='background:"+col["bg"]+";color:"+col["text"]+";padding:6px 12px;border-radius:4px;font-weight:bold;margin-top:8px'>"+iname+"</div>", unsafe_allow_html=True)
         st.markdown("<div style='color:#888;font-size:0.82em;margin:2px 0 6px 4px'>"+sh["start"]+" - "+sh["end"]+"</div>", unsafe_allow_html=True)
         meal_min      = meal_map.get((iname, sel_date))
@@ -1571,24 +961,16 @@ def step7():
             else:                   content = time_str+"&nbsp;&nbsp;&nbsp;"+label
             st.markdown("<div style='"+style+"'>"+content+"</div>", unsafe_allow_html=True)
 
-    left_col, right_col = st.columns(2)
-    with left_col:
-        for sk in ["A1", "A2"]:
-            sk_sessions = [s for s in day_sessions if s["shift"] == sk]
-            if not sk_sessions: continue
-            st.markdown("## "+DEFAULT_SHIFTS[sk]["label"])
-            st.markdown("<div style='color:#888;font-size:0.85em'>"+DEFAULT_SHIFTS[sk]["start"]+" - "+DEFAULT_SHIFTS[sk]["end"]+"</div>", unsafe_allow_html=True)
-            for inst in DEFAULT_INSTRUCTORS:
-                if inst["shift"] == sk:
+    half = (len(ACTIVE_SHIFTS) + 1) // 2
+    for col, shifts in zip(st.columns(2), (ACTIVE_SHIFTS[:half], ACTIVE_SHIFTS[half:])):
+        with col:
+            for sk in shifts:
+                sk_sessions = [s for s in day_sessions if s["shift"] == sk]
+                if not sk_sessions: continue
+                st.markdown("## "+DEFAULT_SHIFTS[sk]["label"])
+                st.markdown("<div style='color:#888;font-size:0.85em'>"+DEFAULT_SHIFTS[sk]["start"]+" - "+DEFAULT_SHIFTS[sk]["end"]+"</div>", unsafe_allow_html=True)
+                for inst in INSTRUCTORS_BY_SHIFT[sk]:
                     render_instructor_timeline(inst["name"], sk, day_sessions)
-    with right_col:
-        sk_sessions = [s for s in day_sessions if s["shift"] == "B"]
-        if sk_sessions:
-            st.markdown("## "+DEFAULT_SHIFTS["B"]["label"])
-            st.markdown("<div style='color:#888;font-size:0.85em'>"+DEFAULT_SHIFTS["B"]["start"]+" - "+DEFAULT_SHIFTS["B"]["end"]+"</div>", unsafe_allow_html=True)
-            for inst in DEFAULT_INSTRUCTORS:
-                if inst["shift"] == "B":
-                    render_instructor_timeline(inst["name"], "B", day_sessions)
 
 
 # =======================================================================
@@ -1596,32 +978,25 @@ def step7():
 # =======================================================================
 
 def _init_edited():
-    import copy
+    # No copy: the journal shares the generated sessions and copies only the ones it edits.
     if st.session_state.edited_schedule is None and st.session_state.generated_schedule:
-        st.session_state.edited_schedule = copy.deepcopy(st.session_state.generated_schedule)
-
-
-def _detect_conflicts(sessions):
-    conflicts = set()
-    for i, a in enumerate(sessions):
-        for j, b in enumerate(sessions):
-            if i >= j: continue
-            if a["date"] != b["date"]: continue
-            overlap = not (a["class_end_min"] <= b["class_start_min"]
-                           or a["class_start_min"] >= b["class_end_min"])
-            if overlap:
-                if a["instructor"] == b["instructor"]:
-                    conflicts.add(i); conflicts.add(j)
-                if (a["room"] == b["room"]
-                        and not a.get("shadow_of") and not b.get("shadow_of")):
-                    conflicts.add(i); conflicts.add(j)
-    return conflicts
+        st.session_state.edited_schedule = st.session_state.generated_schedule
+        st.session_state.edit_journal    = EditJournal(st.session_state.edited_schedule["sessions"])
+
+
+def _conflict_text(a, b, reason):
+    day = date.fromisoformat(a["date"]).strftime("%a %b %d")
+    if reason == "instructor":
+        return (day + ": " + a["instructor"] + " double-booked — " + a["course"] + " " + a["class_start"]
+                + "–" + a["class_end"] + " overlaps " + b["course"] + " " + b["class_start"] + "–" + b["class_end"])
+    return (day + ": " + a["room"] + " double-booked — " + a["course"] + " (" + a["instructor"] + ") and "
+            + b["course"] + " (" + b["instructor"] + ")")
 
 
 @st.dialog("Edit Session", width="large")
-def _edit_dialog(sidx, sessions, month, year):
+def _edit_dialog(sid, journal, month, year):
     cmap2  = {c["name"]: c for c in DEFAULT_CLASSES}
-    s      = sessions[sidx]
+    s      = journal.store[sid]
     st.markdown("**Editing:** " + s["course"] + " — " + s["instructor"]
                 + " on " + date.fromisoformat(s["date"]).strftime("%A, %B %d"))
     st.markdown("---")
@@ -1629,18 +1004,18 @@ def _edit_dialog(sidx, sessions, month, year):
     new_course = st.selectbox("Course", all_cn2,
         index=all_cn2.index(s["course"]) if s["course"] in all_cn2 else 0)
     sk         = s["shift"]
-    sh_insts   = [i["name"] for i in DEFAULT_INSTRUCTORS if i["shift"] == sk]
+    sh_insts   = [i["name"] for i in INSTRUCTORS_BY_SHIFT[sk]]
     new_inst   = st.selectbox("Instructor", sh_insts,
         index=sh_insts.index(s["instructor"]) if s["instructor"] in sh_insts else 0)
     new_room   = st.selectbox("Room", DEFAULT_ROOMS,
         index=DEFAULT_ROOMS.index(s["room"]) if s["room"] in DEFAULT_ROOMS else 0)
-    valid_dates = [d for d in get_month_dates(year, month)
-                   if day_name(d) in DEFAULT_SHIFTS[sk]["days"]]
+    cal         = month_calendar(year, month)
+    valid_dates = cal.dates_on(sk)
     date_strs   = [d.isoformat() for d in valid_dates]
     new_date    = st.selectbox("Date", date_strs,
         index=date_strs.index(s["date"]) if s["date"] in date_strs else 0,
         format_func=lambda x: date.fromisoformat(x).strftime("%A, %B %d"))
-    sh_s2, sh_e2 = get_shift_window(sk)
+    sh_s2, sh_e2 = cal.window(sk)
     time_opts    = list(range(sh_s2, sh_e2, 30))
     time_strs2   = [minutes_to_time(t) for t in time_opts]
     cur_ti       = time_opts.index(s["class_start_min"]) if s["class_start_min"] in time_opts else 0
@@ -1653,46 +1028,42 @@ def _edit_dialog(sidx, sessions, month, year):
     st.markdown("---")
     ca, cb, cc = st.columns([2, 1, 1])
     if ca.button("💾 Save", type="primary", use_container_width=True):
-        sessions[sidx].update({
-            "course": new_course, "instructor": new_inst,
-            "room": new_room, "date": new_date,
-            "class_start": new_st_str, "class_start_min": new_st_min,
-            "class_end": minutes_to_time(new_end_min), "class_end_min": new_end_min,
-            "prep_start_min": max(sh_s2, new_st_min - PREP_MINS),
-            "prep_start": minutes_to_time(max(sh_s2, new_st_min - PREP_MINS)),
-            "duration_hrs": cmap2[new_course]["duration"],
-        })
-        st.session_state.edit_selected_idx = None
+        journal.edit(sid,
+            course=new_course, instructor=new_inst, room=new_room, date=new_date,
+            class_start_min=new_st_min, class_end_min=new_end_min,
+            prep_start_min=max(sh_s2, new_st_min - PREP_MINS),
+            duration_hrs=cmap2[new_course]["duration"])
+        st.session_state.edit_selected_sid = None
         st.session_state.edit_panel_mode   = None
         st.query_params.clear(); st.rerun()
     if cb.button("🗑️ Remove", use_container_width=True):
-        sessions.pop(sidx)
-        st.session_state.edit_selected_idx = None
+        journal.remove(sid)
+        st.session_state.edit_selected_sid = None
         st.session_state.edit_panel_mode   = None
         st.query_params.clear(); st.rerun()
     if cc.button("✖ Cancel", use_container_width=True):
-        st.session_state.edit_selected_idx = None
+        st.session_state.edit_selected_sid = None
         st.session_state.edit_panel_mode   = None
         st.query_params.clear(); st.rerun()
 
 
 @st.dialog("Add New Class", width="large")
-def _add_dialog(sessions, month, year, default_date=None):
+def _add_dialog(journal, month, year, default_date=None):
     cmap2     = {c["name"]: c for c in DEFAULT_CLASSES}
     all_cn2   = [c["name"] for c in DEFAULT_CLASSES]
     new_course = st.selectbox("Course", all_cn2)
     new_sk     = st.selectbox("Shift", ACTIVE_SHIFTS,
                               format_func=lambda x: DEFAULT_SHIFTS[x]["label"])
-    sh_insts   = [i["name"] for i in DEFAULT_INSTRUCTORS if i["shift"] == new_sk]
+    sh_insts   = [i["name"] for i in INSTRUCTORS_BY_SHIFT[new_sk]]
     new_inst   = st.selectbox("Instructor", sh_insts)
     new_room   = st.selectbox("Room", DEFAULT_ROOMS)
-    valid_d    = [d for d in get_month_dates(year, month)
-                  if day_name(d) in DEFAULT_SHIFTS[new_sk]["days"]]
+    cal        = month_calendar(year, month)
+    valid_d    = cal.dates_on(new_sk)
     date_strs  = [d.isoformat() for d in valid_d]
     def_idx    = date_strs.index(default_date) if default_date and default_date in date_strs else 0
     new_date   = st.selectbox("Date", date_strs, index=def_idx,
         format_func=lambda x: date.fromisoformat(x).strftime("%A, %B %d"))
-    sh_s3, sh_e3 = get_shift_window(new_sk)
+    sh_s3, sh_e3 = cal.window(new_sk)
     time_opts    = list(range(sh_s3, sh_e3, 30))
     time_strs3   = [minutes_to_time(t) for t in time_opts]
     new_st_str   = st.selectbox("Start Time", time_strs3)
@@ -1704,7 +1075,7 @@ def _add_dialog(sessions, month, year, default_date=None):
     st.markdown("---")
     ca2, cb2 = st.columns(2)
     if ca2.button("✅ Add", type="primary", use_container_width=True):
-        sessions.append(_make_session(
+        journal.add(_make_session(
             new_sk, date.fromisoformat(new_date), new_inst,
             new_course, cmap2[new_course],
             max(sh_s3, new_st_min - PREP_MINS), new_st_min, new_end, new_room))
@@ -1715,25 +1086,23 @@ def _add_dialog(sessions, month, year, default_date=None):
         st.rerun()
 
 
-def _build_timeline_html(sel_date_iso, sessions, conflicts):
+def _build_timeline_html(sel_date_iso, store, conflicts):
     ROW_PX = 40; SLOT_MINS = 30; TIME_COL = 64; INST_COL = 160
     sel_date   = date.fromisoformat(sel_date_iso)
-    dname      = day_name(sel_date)
-    act_shifts = [sk for sk in ACTIVE_SHIFTS if dname in DEFAULT_SHIFTS[sk]["days"]]
+    cal        = month_calendar(sel_date.year, sel_date.month)
+    act_shifts = cal.shifts.get(sel_date, ())
     if not act_shifts:
         return "<p>No shifts scheduled on this day.</p>", 100
-    day_sess  = [s for s in sessions if s["date"] == sel_date_iso]
-    sess_idx  = {id(s): i for i, s in enumerate(sessions)}
-    t_start   = min(get_shift_window(sk)[0] for sk in act_shifts)
-    t_end     = max(get_shift_window(sk)[1] for sk in act_shifts)
+    t_start   = min(cal.window(sk)[0] for sk in act_shifts)
+    t_end     = max(cal.window(sk)[1] for sk in act_shifts)
     slots     = list(range(t_start, t_end, SLOT_MINS))
     inst_list = [(i["name"], i["shift"])
                  for sk in act_shifts
-                 for i in DEFAULT_INSTRUCTORS if i["shift"] == sk]
+                 for i in INSTRUCTORS_BY_SHIFT[sk]]
     total_w   = TIME_COL + len(inst_list) * INST_COL
     total_h   = 70 + len(slots) * (ROW_PX + 1) + 20
-    mtg_start, _ = get_tuesday_meeting_window(sel_date, sel_date.year, sel_date.month)
-    mtype         = tuesday_meeting_type(sel_date, sel_date.year, sel_date.month)
+    mtg_start, _ = cal.meeting_window(sel_date)
+    mtype         = cal.meeting_type.get(sel_date)
     mtg_label     = ("All Staff Meeting 11:00-12:00" if mtype == "all_staff"
                      else "CoP Meeting 11:00-12:00") if mtype else None
 
@@ -1787,8 +1156,8 @@ def _build_timeline_html(sel_date_iso, sessions, conflicts):
     h.append("</div>")
 
     for iname, sk in inst_list:
-        sh_s4, sh_e4 = get_shift_window(sk)
-        col_sess = sorted([s for s in day_sess if s["instructor"] == iname],
+        sh_s4, sh_e4 = cal.window(sk)
+        col_sess = sorted(store.select(date=sel_date_iso, instructor=iname),
                           key=lambda x: x["class_start_min"])
         h.append("<div class='ic'>")
         for slot in slots:
@@ -1809,7 +1178,7 @@ def _build_timeline_html(sel_date_iso, sessions, conflicts):
             h.append("<div class='mb' style='top:" + mtop + "px;height:" + mh + "px'>"
                      + "📋 " + mtg_label + "</div>")
         for s in col_sess:
-            si2   = sess_idx.get(id(s), -1)
+            si2   = s["id"]
             s_col = inst_color(iname)
             bg    = "#dc2626" if si2 in conflicts else s_col["bg"]
             shad  = " [Shadow]" if s.get("shadow_of") else ""
@@ -1829,9 +1198,9 @@ def _build_timeline_html(sel_date_iso, sessions, conflicts):
     h.append("</div></div>")
     h.append(
         "<script>"
-        "function doEdit(idx){"
+        "function doEdit(sid){"
         "var u=new URL(window.parent.location.href);"
-        "u.searchParams.set('_edit_idx',idx);"
+        "u.searchParams.set('_edit_sid',sid);"
         "window.parent.history.pushState({},'',u.toString());"
         "window.parent.dispatchEvent(new PopStateEvent('popstate',{state:{}}));}"
         "</script></body></html>")
@@ -1845,18 +1214,19 @@ def step9():
     if not st.session_state.edited_schedule:
         st.warning("Please generate a schedule first (Step 5).")
         return
-    sessions  = st.session_state.edited_schedule["sessions"]
+    journal   = st.session_state.edit_journal
+    store     = journal.store
     month     = st.session_state.schedule_month
     year      = st.session_state.schedule_year
-    conflicts = _detect_conflicts(sessions)
+    conflict_pairs, conflicts = store.conflicts.conflicts(), store.conflicts.flagged()
 
-    # URL bridge — pencil buttons set ?_edit_idx=N
-    raw_idx = st.query_params.get("_edit_idx", None)
-    if raw_idx is not None:
+    # URL bridge — pencil buttons set ?_edit_sid=<session id>
+    raw_sid = st.query_params.get("_edit_sid", None)
+    if raw_sid is not None:
         try:
-            sidx = int(raw_idx)
-            if 0 <= sidx < len(sessions):
-                st.session_state.edit_selected_idx = sidx
+            sid = int(raw_sid)
+            if sid in store:
+                st.session_state.edit_selected_sid = sid
                 st.session_state.edit_panel_mode   = "edit"
         except ValueError:
             pass
@@ -1864,19 +1234,17 @@ def step9():
         st.rerun()
 
     if (st.session_state.edit_panel_mode == "edit"
-            and st.session_state.edit_selected_idx is not None
-            and st.session_state.edit_selected_idx < len(sessions)):
-        _edit_dialog(st.session_state.edit_selected_idx, sessions, month, year)
+            and st.session_state.edit_selected_sid in store):
+        _edit_dialog(st.session_state.edit_selected_sid, journal, month, year)
 
     if st.session_state.edit_panel_mode == "add":
-        _add_dialog(sessions, month, year,
+        _add_dialog(journal, month, year,
                     default_date=st.session_state.edit_selected_date)
 
-    all_working = sorted({
-        d.isoformat() for d in get_month_dates(year, month)
-        if any(day_name(d) in DEFAULT_SHIFTS[sk]["days"] for sk in ACTIVE_SHIFTS)})
+    cal = month_calendar(year, month)
+    all_working = sorted(d.isoformat() for d in cal.dates if cal.shifts[d])
     if st.session_state.edit_selected_date not in all_working:
-        act_d = sorted({s["date"] for s in sessions})
+        act_d = sorted(store.by_date)
         st.session_state.edit_selected_date = (
             act_d[0] if act_d else (all_working[0] if all_working else None))
     if not all_working:
@@ -1903,20 +1271,23 @@ def step9():
             st.rerun()
     if n4.button("➕ Add New Class", use_container_width=True, type="primary"):
         st.session_state.edit_panel_mode   = "add"
-        st.session_state.edit_selected_idx = None
+        st.session_state.edit_selected_sid = None
         st.rerun()
 
-    if conflicts:
+    if conflict_pairs:
         st.markdown(
             "<div style='background:#fef9c3;border:1px solid #ca8a04;border-radius:6px;"
             "padding:6px 12px;font-size:.85em;margin:6px 0'>"
-            "⚠️ <b>" + str(len(conflicts)) + " conflict(s)</b>"
+            "⚠️ <b>" + str(len(conflict_pairs)) + " conflict(s)</b>"
             " — shown in red. Click ✏️ to fix.</div>",
             unsafe_allow_html=True)
+        with st.expander("Conflict details", expanded=False):
+            for i, j, reason in conflict_pairs:
+                st.markdown("- " + _conflict_text(store[i], store[j], reason))
 
     st.markdown("---")
     sel_obj = date.fromisoformat(st.session_state.edit_selected_date)
-    mtype_e = tuesday_meeting_type(sel_obj, sel_obj.year, sel_obj.month)
+    mtype_e = cal.meeting_type.get(sel_obj)
     mtg_tag = (" 📋 All Staff Meeting" if mtype_e == "all_staff"
                else (" 📋 CoP Meeting" if mtype_e == "cop" else ""))
     st.markdown(
@@ -1926,21 +1297,32 @@ def step9():
         unsafe_allow_html=True)
 
     html_out, est_h = _build_timeline_html(
-        st.session_state.edit_selected_date, sessions, conflicts)
+        st.session_state.edit_selected_date, store, conflicts)
     components.html(html_out, height=est_h, scrolling=True)
 
     st.markdown("---")
+    u1, u2, u3 = st.columns(3)
+    _last = journal.last()
+    if u1.button("↶ Undo" + (" " + _last[0] if _last else ""), use_container_width=True,
+                 disabled=not journal.can_undo()):
+        journal.undo(); st.rerun()
+    if u2.button("↷ Redo", use_container_width=True, disabled=not journal.can_redo()):
+        journal.redo(); st.rerun()
+    if u3.button("📌 Checkpoint", use_container_width=True, disabled=not len(journal),
+                 help="Keep the edits so far and clear the undo history."):
+        journal.snapshot(); st.rerun()
     b1, b2 = st.columns(2)
     if b1.button("↩️ Reset to Generated Schedule", use_container_width=True):
         st.session_state.edited_schedule   = None
+        st.session_state.edit_journal      = None
         st.session_state.edit_panel_mode   = None
-        st.session_state.edit_selected_idx = None
+        st.session_state.edit_selected_sid = None
         _init_edited()
         st.rerun()
     if EXCEL_OK:
         import io as _io
         buf = _io.BytesIO()
-        build_excel(st.session_state.edited_schedule, month, year).save(buf)
+        build_excel({**st.session_state.edited_schedule, "sessions": list(store)}, month, year).save(buf)
         buf.seek(0)
         b2.download_button(
             "📥 Download Edited Excel", buf,
@@ -1957,17 +1339,11 @@ def step10():
         st.warning("No schedule generated yet.")
         return
     sched       = st.session_state.generated_schedule
-    sessions    = sched["sessions"]
+    store       = _generated_store()
     meal_map    = sched.get("meal_map", {})
     month       = st.session_state.schedule_month
     year        = st.session_state.schedule_year
-    month_weeks = get_month_weeks(year, month)
-    shift_days  = {
-        "A1": ["Monday","Tuesday","Wednesday","Thursday"],
-        "A2": ["Tuesday","Wednesday","Thursday","Friday"],
-        "B":  ["Monday","Tuesday","Wednesday","Thursday"],
-        "C":  ["Friday","Saturday","Sunday"],
-    }
+    cal         = month_calendar(year, month)
     st.markdown(
         "Instructors should work **close to 40 hours/week**. "
         "A **guaranteed 30-minute break** is recorded every working day. "
@@ -1991,16 +1367,15 @@ def step10():
             unsafe_allow_html=True
         )
         week_rows = []
-        for wi, week_days in enumerate(month_weeks, 1):
-            wdays_for_shift = [d for d in week_days if day_name(d) in shift_days[sk]]
+        for wi, week_days in enumerate(cal.weeks, 1):
+            wdays_for_shift = cal.week_days(sk, wi - 1)
             if not wdays_for_shift:
                 continue
             week_date_isos = {d.isoformat() for d in week_days}
             days_worked   = [d for d in wdays_for_shift if (iname, d.isoformat()) in meal_map]
             n_worked      = len(days_worked)
-            teaching_hrs  = sum(s["duration_hrs"] for s in sessions
-                                if s["instructor"] == iname
-                                and s["date"] in week_date_isos
+            teaching_hrs  = sum(s["duration_hrs"] for s in store.by_instructor.get(iname, {}).values()
+                                if s["date"] in week_date_isos
                                 and not s.get("shadow_of"))
             onsite_hrs = round(n_worked * shift_day_hrs, 1)
             break_hrs  = round(n_worked * BREAK_HRS, 1)
@@ -2036,6 +1411,9 @@ def step10():
     st.caption("✅ On target = 37-43 hrs/week  ⚠️ 28-37 hrs  ❌ <28 hrs")
     st.caption(f"A {MEAL_MINS}-min break is guaranteed every working day and is included within on-site hours.")
 
+if st.session_state.gen_job:
+    with st.sidebar: _job_panel()
+
 step = st.session_state.step
 if   step == 1: step1()
 elif step == 2: step2()